@@ -0,0 +1,162 @@
+# archive.py
+"""Local columnar archive of every converted report.
+
+Besides going to Drive, each report is written as Parquet under
+ARCHIVE_DIR, partitioned Hive-style by job, facility and report date:
+
+    archive/job=daily_service/facility=ZECA-278/date=2026-10-16/part.parquet
+
+The portal's reports are cumulative for their date, so a partition holds
+only the latest snapshot: each write replaces the partition's part file
+(written aside and renamed over it), and a scan counts every row once.
+
+so weeks of manifests can be scanned with ``pyarrow.dataset`` (or DuckDB,
+pandas, ...) instead of re-downloading XLSX files from Drive and loading
+them one by one:
+
+    import pyarrow.dataset as ds
+    ds.dataset("archive", partitioning="hive").to_table(filter=ds.field("job") == "pickup_manifest")
+
+Every part of a job has the same schema, so a scan over many parts never
+meets one column typed two ways: columns listed in the report spec's
+``column_types`` get that type (a value that does not fit is null), all
+other columns are strings; empty cells are null. The job's report spec
+(normalize.report_spec) also gives the header row, and a report missing a
+required column is not archived. Rows come from normalize.read_report,
+cleaned the same way as the uploaded files (dates decoded, blank and
+repeated header rows dropped, overflow sheets joined into one table).
+
+pyarrow is optional. Without it, or with ARCHIVE=0, nothing is written.
+"""
+
+import os
+import re
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+
+from normalize import read_report, report_spec, validate_header
+from xls_converter import normalize_cell
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE", "1") == "1"
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "archive"))
+PART_NAME = "part.parquet"
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def available() -> bool:
+    """Is archiving on and pyarrow importable?"""
+    return ARCHIVE_ENABLED and importlib.util.find_spec("pyarrow") is not None
+
+
+def partition_dir(job: str, facility: str, report_date: str, root: Path = ARCHIVE_DIR) -> Path:
+    """archive/job=.../facility=.../date=YYYY-MM-DD for one report."""
+    if report_date:
+        day = datetime.strptime(report_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+    else:
+        day = datetime.now().strftime("%Y-%m-%d")
+    # Facilities look like "ZNHI-250/3250"; keep partition values path-safe
+    facility = _UNSAFE.sub("_", facility or "all").strip("_")
+    return root / f"job={job}" / f"facility={facility}" / f"date={day}"
+
+
+def column_names(header: list) -> list:
+    """Unique, non-empty column names from a header row."""
+    names, seen = [], {}
+    for i, value in enumerate(header):
+        name = str(normalize_cell(value)) or f"column_{i + 1}"
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+def read_columns(xls_path: Path, spec: dict, tag: str = "[Archive]"):
+    """Column names and per-column values of a report (normalize.read_report)."""
+    header, rows = read_report(xls_path, spec, tag)
+    names = column_names(header)
+    columns = [[row[c] if c < len(row) and row[c] != "" else None for row in rows]
+               for c in range(len(names))]
+    return names, columns
+
+
+def arrow_type(name: str):
+    """Arrow type of a column type name from a report spec's ``column_types``."""
+    import pyarrow as pa
+
+    types = {"number": pa.float64(), "integer": pa.int64(), "date": pa.timestamp("s"),
+             "bool": pa.bool_(), "string": pa.string()}
+    if name not in types:
+        raise ValueError(f"Unknown column type {name!r}, expected one of {tuple(types)}")
+    return types[name]
+
+
+def _typed(value, name: str):
+    """``value`` as a column of type ``name``; None when it does not fit."""
+    if value is None:
+        return None
+    if name == "string":
+        return str(normalize_cell(value))
+    if name == "date":
+        return value if isinstance(value, datetime) else None
+    if name == "bool":
+        return value if isinstance(value, bool) else None
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if name == "integer":
+        return int(number) if number.is_integer() else None
+    return number
+
+
+def build_table(names: list, columns: list, spec: dict, tag: str = "[Archive]"):
+    """The job's fixed schema: declared ``column_types``, strings for the rest."""
+    import pyarrow as pa
+
+    declared = spec.get("column_types", {})
+    arrays = []
+    for name, values in zip(names, columns):
+        type_name = declared.get(name, "string")
+        typed = [_typed(v, type_name) for v in values]
+        dropped = sum(1 for v, t in zip(values, typed) if v is not None and t is None)
+        if dropped:
+            print(f"{tag} ⚠ {dropped} value(s) in column {name!r} are not {type_name}, archived as null")
+        arrays.append(pa.array(typed, type=arrow_type(type_name)))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def archive_report(xls_path: Path, job: str, facility: str, report_date: str,
+                   spec: dict = None, root: Path = ARCHIVE_DIR, tag: str = "[Archive]") -> str:
+    """Write one report into the archive; returns the part file path.
+
+    The part is written under a temporary name and renamed over the
+    partition's earlier snapshot, so a scan running at the same time sees
+    either the old or the new one, never both or half of one.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("ARCHIVE needs pyarrow installed")
+
+    spec = spec or report_spec(job)
+    names, columns = read_columns(Path(xls_path), spec, tag)
+    if not names:
+        print(f"{tag} ⚠ {Path(xls_path).name} has no header row {spec['header_row']}, not archived")
+        return None
+    validate_header(names, spec)
+    table = build_table(names, columns, spec, tag)
+
+    out_dir = partition_dir(job, facility, report_date, Path(root))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    part = out_dir / PART_NAME
+    tmp = part.with_name(f".{part.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, part)
+    # Snapshots written before parts had a fixed name
+    for old in out_dir.glob("part-*.parquet"):
+        old.unlink()
+    print(f"{tag} 🗄 Archived {table.num_rows} row(s) x {table.num_columns} column(s) to {part}")
+    return str(part)
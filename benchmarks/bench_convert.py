@@ -0,0 +1,180 @@
+# benchmarks/bench_convert.py
+"""Compare the legacy cell-by-cell converter with xls_converter.
+
+Builds a synthetic workbook (default 100k rows, split across sheets because
+.xls caps a sheet at 65536 rows), then converts it once with each
+implementation (legacy, streaming, memory-bounded, and ``pooled``: the
+upload stage's default path through conversion_pool.py) in a fresh
+interpreter and reports wall time and peak RSS; for ``pooled`` that is the
+largest of the interpreter and its pool workers.
+
+``--budget-mb`` sets CONVERT_RSS_LIMIT_MB to that ceiling and exits
+non-zero if the bounded or the pooled conversion went over it, so it
+doubles as a memory check:
+
+    python benchmarks/bench_convert.py --rows 100000 --cols 20
+    python benchmarks/bench_convert.py --rows 200000 --budget-mb 300 --no-merges
+
+Needs ``xlwt`` on top of the service dependencies to write the input file.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+XLS_MAX_ROWS = 65536
+
+
+def legacy_convert_xls_to_xlsx(xls_path: Path) -> Path:
+    """The converter the services used before xls_converter (baseline)."""
+    from xlrd import open_workbook
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    xlsx_path = xls_path.with_suffix(".xlsx")
+    xls_book = open_workbook(str(xls_path), formatting_info=True)
+    xlsx_book = Workbook()
+    xlsx_book.remove(xlsx_book.active)
+
+    for sheet_name in xls_book.sheet_names():
+        xls_sheet = xls_book.sheet_by_name(sheet_name)
+        new_sheet = xlsx_book.create_sheet(title=sheet_name)
+        for row_idx in range(xls_sheet.nrows):
+            for col_idx in range(xls_sheet.ncols):
+                new_sheet.cell(row=row_idx+1, column=col_idx+1,
+                               value=xls_sheet.cell_value(row_idx, col_idx))
+        for (r1, r2, c1, c2) in xls_sheet.merged_cells:
+            merge_range = f"{get_column_letter(c1+1)}{r1+1}:{get_column_letter(c2)}{r2}"
+            new_sheet.merge_cells(merge_range)
+
+    xlsx_book.save(str(xlsx_path))
+    return xlsx_path
+
+
+def build_synthetic_xls(path: Path, rows: int, cols: int):
+    """Write a manifest-like .xls with a merged title row on every sheet."""
+    import xlwt
+
+    book = xlwt.Workbook()
+    sheet_idx = 0
+    remaining = rows
+    while remaining > 0:
+        sheet = book.add_sheet(f"Sheet{sheet_idx+1}")
+        sheet.write_merge(0, 0, 0, cols - 1, f"Synthetic manifest part {sheet_idx+1}")
+        for c in range(cols):
+            sheet.write(1, c, f"Column {c+1}")
+        body_rows = min(remaining, XLS_MAX_ROWS - 2)
+        for r in range(body_rows):
+            row = sheet.row(r + 2)
+            for c in range(cols):
+                if c % 3 == 0:
+                    row.write(c, f"TRK{r:07d}{c:02d}")
+                else:
+                    row.write(c, r * cols + c)
+        remaining -= body_rows
+        sheet_idx += 1
+    book.save(str(path))
+
+
+def peak_rss_kb() -> int:
+    """This process's peak RSS in KiB.
+
+    Prefers VmHWM: ru_maxrss survives exec, so a child spawned from a big
+    parent (the one that just built the workbook) would report its peak.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(impl: str, xls_path: Path):
+    """Convert once in this process and print timing as JSON."""
+    if impl == "legacy":
+        convert = legacy_convert_xls_to_xlsx
+    elif impl == "bounded":
+        from xls_converter import convert_xls_to_xlsx_bounded
+        convert = lambda p: convert_xls_to_xlsx_bounded(p, tag="[Bench]")
+    elif impl == "pooled":
+        import asyncio
+        import conversion_pool
+        convert = lambda p: asyncio.run(conversion_pool.convert_to_xlsx(p, tag="[Bench]"))
+    else:
+        from xls_converter import convert_xls_to_xlsx
+        convert = lambda p: convert_xls_to_xlsx(p, tag="[Bench]")
+
+    started = time.perf_counter()
+    out = convert(xls_path)
+    elapsed = time.perf_counter() - started
+
+    peak_kb = peak_rss_kb()
+    if impl == "pooled":
+        # Workers are only counted in RUSAGE_CHILDREN once they have exited
+        conversion_pool.get_pool().shutdown(wait=True)
+        peak_kb = max(peak_kb, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if out and out.exists():
+        out.unlink()
+    print(json.dumps({"impl": impl, "seconds": elapsed, "peak_rss_mb": peak_kb / 1024}))
+
+
+def measure(impl: str, xls_path: Path, env: dict = None) -> dict:
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", impl, str(xls_path)],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--budget-mb", type=float, default=0.0,
+                        help="RSS ceiling for the bounded converter; fail if exceeded")
+    parser.add_argument("--no-merges", action="store_true",
+                        help="bounded converter without formatting info (merges dropped)")
+    parser.add_argument("--child", nargs=2, metavar=("IMPL", "XLS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], Path(args.child[1]))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xls_path = Path(tmp) / "synthetic.xls"
+        print(f"[Bench] Building {args.rows} x {args.cols} workbook...")
+        build_synthetic_xls(xls_path, args.rows, args.cols)
+        print(f"[Bench] Input size: {os.path.getsize(xls_path) / 1e6:.1f} MB")
+
+        env = os.environ.copy()
+        env["CONVERT_RSS_LIMIT_MB"] = str(args.budget_mb)
+        env["CONVERT_KEEP_MERGES"] = "0" if args.no_merges else "1"
+        over_budget = False
+        for impl in ("legacy", "streaming", "bounded", "pooled"):
+            for _ in range(args.repeat):
+                res = measure(impl, xls_path, env)
+                print(f"[Bench] {res['impl']:<10} {res['seconds']:8.2f}s  peak RSS {res['peak_rss_mb']:8.1f} MB")
+                if impl in ("bounded", "pooled") and args.budget_mb and res["peak_rss_mb"] > args.budget_mb:
+                    print(f"[Bench] ❌ {impl} peak RSS over the {args.budget_mb:.0f} MB budget")
+                    over_budget = True
+        if over_budget:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
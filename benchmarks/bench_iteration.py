@@ -0,0 +1,150 @@
+# benchmarks/bench_iteration.py
+"""End-to-end iteration benchmark against the local mock portal and fake Drive.
+
+Starts benchmarks/mock_portal.py and benchmarks/fake_drive.py in this
+process, then runs one full job iteration (login or session reuse, search,
+every facility, download, conversion, upload) per repeat in a fresh
+interpreter. Reports wall time, CPU (Python and, once it has exited, the
+browser) and peak RSS, plus the stage totals from the iteration's timing
+record. Needs Playwright's Chromium and ``xlwt`` besides the service
+dependencies; runs on any Linux box without portal access:
+
+    python benchmarks/bench_iteration.py --job daily_service --rows 20000 --repeat 3
+    python benchmarks/bench_iteration.py --job all --concurrency 3 --render-latency 1
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+JOB_NAMES = ("daily_service", "pickup_manifest", "weekly_service")
+
+
+def run_child(job_name: str):
+    """One iteration in this process (env already points at the mocks)."""
+    from job_engine import load_settings, run_once
+    from timing import METRICS_FILE
+
+    settings = load_settings(job_name)
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    results = asyncio.run(run_once(job_name, settings))
+    elapsed = time.perf_counter() - started
+
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    # Playwright's driver and Chromium have exited (and been reaped) by now
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    stages = {}
+    if METRICS_FILE.exists():
+        last = json.loads(METRICS_FILE.read_text(encoding="utf-8").strip().splitlines()[-1])
+        for s in last["spans"]:
+            stages[s["stage"]] = stages.get(s["stage"], 0.0) + s["seconds"]
+    print(json.dumps({
+        "job": job_name,
+        "seconds": elapsed,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "browser_cpu_seconds": children.ru_utime + children.ru_stime,
+        # ru_maxrss is KiB on Linux; for children it is the largest single one
+        "peak_rss_mb": me.ru_maxrss / 1024,
+        "browser_peak_rss_mb": children.ru_maxrss / 1024,
+        "statuses": [r["status"] for r in results],
+        "stages": stages,
+    }))
+
+
+def measure(job_name: str, env: dict, workdir: Path, verbose: bool) -> dict:
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", job_name],
+        env=env, cwd=workdir, capture_output=True, text=True,
+    )
+    if verbose or proc.returncode != 0:
+        print(proc.stdout)
+        print(proc.stderr, file=sys.stderr)
+    proc.check_returncode()
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--job", choices=JOB_NAMES + ("all",), default="daily_service")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--output-mode", choices=("xlsx", "csv", "gsheet"), default="xlsx")
+    parser.add_argument("--latency", type=float, default=0.0, help="per-request portal latency (s)")
+    parser.add_argument("--render-latency", type=float, default=0.5, help="report render latency (s)")
+    parser.add_argument("--drive-latency", type=float, default=0.0)
+    parser.add_argument("--portal-port", type=int, default=8766)
+    parser.add_argument("--drive-port", type=int, default=8765)
+    parser.add_argument("--verbose", action="store_true", help="show the iteration's own output")
+    parser.add_argument("--child", metavar="JOB", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    import fake_drive
+    import mock_portal
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        print(f"[Bench] Building {args.rows} x {args.cols} report for the mock portal...")
+        portal = mock_portal.serve(args.portal_port, args.rows, args.cols, args.latency,
+                                   args.render_latency)
+        drive = fake_drive.serve(args.drive_port, tmp / "drive", args.drive_latency)
+        print(f"[Bench] Report size: {len(mock_portal.MockPortalHandler.xls_bytes) / 1e6:.1f} MB")
+
+        env = os.environ.copy()
+        env.update({
+            "PYTHONPATH": os.pathsep.join([str(ROOT), env.get("PYTHONPATH", "")]),
+            "PORTAL_URL": f"http://127.0.0.1:{args.portal_port}/",
+            "DRIVE_API_ENDPOINT": f"http://127.0.0.1:{args.drive_port}/",
+            "SERVICE_ACCOUNT_FILE": str(tmp / "no-service-account.json"),
+            "FOLDER_ID": "bench-folder",
+            "SCRIPT_USERNAME": "bench",
+            "SCRIPT_PASSWORD": "bench",
+            "OUTPUT_MODE": args.output_mode,
+            "CONCURRENCY": str(args.concurrency),
+            "SCHEDULE_RUN": "0",
+            # Every repeat re-uploads; all local state stays in the temp dir
+            "DEDUPE": "0",
+            "SESSION_DIR": str(tmp / "sessions"),
+            "UPLOAD_SPOOL_DIR": str(tmp / "spool"),
+            "METRICS_FILE": str(tmp / "metrics.jsonl"),
+            "RUN_HISTORY_DB": str(tmp / "run_history.sqlite3"),
+            "SCHEDULE_STATE_DIR": str(tmp / "schedule_state"),
+        })
+        workdir = tmp / "work"
+        workdir.mkdir()
+
+        jobs = JOB_NAMES if args.job == "all" else (args.job,)
+        try:
+            for job_name in jobs:
+                for i in range(args.repeat):
+                    res = measure(job_name, env, workdir, args.verbose)
+                    stages = ", ".join(f"{k} {v:.1f}s" for k, v in res["stages"].items())
+                    print(f"[Bench] {job_name:<16} #{i+1} {res['seconds']:7.2f}s  "
+                          f"CPU {res['cpu_seconds']:6.2f}s (+browser {res['browser_cpu_seconds']:6.2f}s)  "
+                          f"peak RSS {res['peak_rss_mb']:7.1f} MB (browser {res['browser_peak_rss_mb']:7.1f} MB)  "
+                          f"{'/'.join(res['statuses'])}")
+                    print(f"[Bench]   stages: {stages or 'n/a'}")
+        finally:
+            portal.shutdown()
+            drive.shutdown()
+
+
+if __name__ == "__main__":
+    main()
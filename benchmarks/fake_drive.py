@@ -0,0 +1,167 @@
+# benchmarks/fake_drive.py
+"""Minimal local stand-in for the Drive v3 files.create endpoint.
+
+Point the services at it with DRIVE_API_ENDPOINT and no service account
+file, e.g.:
+
+    python benchmarks/fake_drive.py --port 8765 --out /tmp/fake_drive &
+    DRIVE_API_ENDPOINT=http://127.0.0.1:8765/ SERVICE_ACCOUNT_FILE=none python daily_service.py
+
+Uploaded files are written to --out; ``--latency`` delays every response and
+``--fail-rate`` answers that fraction of requests with a 503 to exercise the
+retry path. Resumable (chunked) upload sessions are supported.
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    out_dir = Path("fake_drive")
+    latency = 0.0
+    fail_rate = 0.0
+    files = {}
+    # upload_id -> {"metadata": ..., "data": bytearray}
+    sessions = {}
+    lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        print(f"[FakeDrive] {self.address_string()} {fmt % args}")
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", "0"))
+        return self.rfile.read(length) if length else b""
+
+    def _store(self, metadata: dict, content: bytes) -> dict:
+        file_id = uuid.uuid4().hex[:16]
+        name = metadata.get("name", file_id)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        (self.out_dir / f"{file_id}_{name}").write_bytes(content)
+        record = {"id": file_id, "name": name, "size": len(content),
+                  "parents": metadata.get("parents", [])}
+        with self.lock:
+            self.files[file_id] = record
+        return record
+
+    def _maybe_fail(self) -> bool:
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self._read_body()
+            self._send_json(503, {"error": {"code": 503, "message": "Injected failure"}})
+            return True
+        return False
+
+    def do_POST(self):
+        if self._maybe_fail():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self._read_body()
+
+        if url.path.endswith("/upload/drive/v3/files"):
+            upload_type = query.get("uploadType", ["media"])[0]
+            if upload_type == "resumable":
+                upload_id = uuid.uuid4().hex
+                with self.lock:
+                    self.sessions[upload_id] = {"metadata": json.loads(body or b"{}"),
+                                                "data": bytearray()}
+                host = self.headers.get("Host", f"127.0.0.1:{self.server.server_port}")
+                location = f"http://{host}{url.path}?uploadType=resumable&upload_id={upload_id}"
+                return self._send_json(200, {}, headers={"Location": location})
+            if upload_type == "multipart":
+                ctype = self.headers.get("Content-Type", "")
+                msg = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {ctype}\r\n\r\n".encode("utf-8") + body
+                )
+                parts = list(msg.iter_parts())
+                metadata = json.loads(parts[0].get_content())
+                content = parts[1].get_payload(decode=True)
+                return self._send_json(200, self._store(metadata, content))
+            return self._send_json(200, self._store({}, body))
+
+        if url.path.endswith("/drive/v3/files"):
+            metadata = json.loads(body or b"{}")
+            return self._send_json(200, self._store(metadata, b""))
+
+        self._send_json(404, {"error": {"code": 404, "message": f"No fake for {url.path}"}})
+
+
+    def do_PUT(self):
+        if self._maybe_fail():
+            return
+        query = parse_qs(urlparse(self.path).query)
+        upload_id = query.get("upload_id", [""])[0]
+        body = self._read_body()
+        with self.lock:
+            session = self.sessions.get(upload_id)
+        if session is None:
+            return self._send_json(404, {"error": {"code": 404, "message": "Unknown upload"}})
+
+        # "bytes 0-262143/1048576" for data, "bytes */1048576" for a status query
+        content_range = self.headers.get("Content-Range", "")
+        total = content_range.rsplit("/", 1)[-1]
+        if body:
+            start = int(content_range.split()[1].split("-")[0])
+            del session["data"][start:]
+            session["data"] += body
+
+        received = len(session["data"])
+        if total != "*" and received >= int(total):
+            with self.lock:
+                self.sessions.pop(upload_id, None)
+            return self._send_json(200, self._store(session["metadata"], bytes(session["data"])))
+
+        self.send_response(308)
+        if received:
+            self.send_header("Range", f"bytes=0-{received - 1}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def serve(port: int, out_dir: Path, latency: float = 0.0,
+          fail_rate: float = 0.0) -> ThreadingHTTPServer:
+    FakeDriveHandler.out_dir = out_dir
+    FakeDriveHandler.latency = latency
+    FakeDriveHandler.fail_rate = fail_rate
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeDriveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Drive v3 upload server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", type=Path, default=Path("fake_drive"))
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.out, args.latency, args.fail_rate)
+    print(f"[FakeDrive] Listening on http://127.0.0.1:{args.port}/ (files -> {args.out})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
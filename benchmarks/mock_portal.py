@@ -0,0 +1,257 @@
+# benchmarks/mock_portal.py
+"""Local stand-in for the FedEx business portal, for offline benchmarks.
+
+Serves just enough of the portal for the job engine to run unchanged, with
+the same selectors the jobs use: the login landing page
+(``input.credentials_input_submit``), the credentials form (``#input28``,
+``#input36``), the search box (``#PTSKEYWORD``, ``#PTSSEARCHBTN``), the
+IBPR report with its date picker, keyboard facility picker, View button
+and ``img[alt='Excel']`` download, the weekly tab, and the P&D manifest tab
+with ``#manifestForm:buttonGenerateExcel``.
+
+Downloads are synthetic .xls files of ``--rows`` x ``--cols`` (built once
+with xlwt). ``--latency`` delays every response and ``--render-latency``
+the report render that precedes the Excel icon:
+
+    python benchmarks/mock_portal.py --port 8766 --rows 20000 --render-latency 2
+    PORTAL_URL=http://127.0.0.1:8766/ python daily_service.py
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+COOKIE = "mock_session=ok"
+IBPR_FACILITIES = ["ZECA-278", "ZNHI-250/3250", "ZWLN-256/3256"]
+# 1x1 transparent PNG for the Excel icon
+PIXEL = ("data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4"
+         "nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII=")
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title></head>
+<body><h1>{title}</h1>{body}</body></html>"""
+
+LANDING = """
+<form action="/signin" method="get">
+  <input type="submit" class="credentials_input_submit" value="Log in">
+</form>"""
+
+SIGNIN = """
+<form action="/login" method="post">
+  <input id="input28" name="username">
+  <input id="input36" name="password" type="password">
+  <input type="submit" class="button-primary" value="Sign in">
+</form>"""
+
+HOME = """
+<input id="PTSKEYWORD" type="text">
+<button id="PTSSEARCHBTN" type="button">Search</button>
+<script>
+  document.getElementById('PTSSEARCHBTN').addEventListener('click', () => {
+    location.href = '/search?q=' + encodeURIComponent(document.getElementById('PTSKEYWORD').value);
+  });
+</script>"""
+
+SEARCH = """
+<a id="hit" href="{href}">{label}</a>
+<script>document.getElementById('hit').focus();</script>"""
+
+# Daily and weekly IBPR report: date, keyboard facility picker, View, Excel icon
+IBPR = """
+<ul><li class="triggered"><a href="/mgba/wsw">Weekly Service</a></li></ul>
+<div id="dateTimePicker1"><input type="text"></div>
+<button id="facilityToggle" type="button"></button>
+<ul id="facilityList" hidden></ul>
+<button class="selectionButton" type="button">View</button>
+<div id="report"></div>
+<script>
+  const FACILITIES = {facilities};
+  const toggle = document.getElementById('facilityToggle');
+  const list = document.getElementById('facilityList');
+  let open = false, highlighted = 0, selected = 0;
+  function draw() {{
+    toggle.textContent = FACILITIES[selected];
+    list.innerHTML = FACILITIES.map((f, i) => `<li>${{i === highlighted ? '> ' : ''}}${{f}}</li>`).join('');
+    list.hidden = !open;
+  }}
+  // Enter opens the list at the top, ArrowDown moves, Enter picks
+  toggle.addEventListener('click', () => {{
+    if (open) {{ selected = highlighted; open = false; }}
+    else {{ open = true; highlighted = 0; }}
+    draw();
+  }});
+  toggle.addEventListener('keydown', (e) => {{
+    if (!open) return;
+    if (e.key === 'ArrowDown') {{ highlighted = Math.min(highlighted + 1, FACILITIES.length - 1); e.preventDefault(); }}
+    if (e.key === 'ArrowUp') {{ highlighted = Math.max(highlighted - 1, 0); e.preventDefault(); }}
+    draw();
+  }});
+  document.querySelector('button.selectionButton').addEventListener('click', async () => {{
+    const report = document.getElementById('report');
+    const facility = FACILITIES[selected];
+    report.textContent = 'Loading...';
+    const info = await (await fetch('/render?facility=' + encodeURIComponent(facility))).json();
+    report.innerHTML = info.has_report
+      ? `<a href="/download?report={kind}&facility=${{encodeURIComponent(facility)}}">` +
+        `<img alt="Excel" src="{pixel}" width="16" height="16"></a>`
+      : 'No data for this facility';
+  }});
+  draw();
+</script>"""
+
+MANIFEST = """
+<div id="mainTabSettab_1" style="cursor:pointer">P&amp;D Manifest</div>
+<form id="manifestForm" style="display:none" onsubmit="return false">
+  <input id="manifestForm:date_input" type="text">
+  <button id="manifestForm:search" type="button">Search</button>
+  <button id="manifestForm:buttonGenerateExcel" type="button" disabled>Generate Excel</button>
+</form>
+<script>
+  const form = document.getElementById('manifestForm');
+  const generate = document.getElementById('manifestForm:buttonGenerateExcel');
+  document.getElementById('mainTabSettab_1').addEventListener('click', () => {
+    form.style.display = 'block';
+  });
+  document.getElementById('manifestForm:search').addEventListener('click', async () => {
+    generate.disabled = true;
+    await fetch('/render?facility=PickUpManifest');
+    generate.disabled = false;
+  });
+  generate.addEventListener('click', () => {
+    location.href = '/download?report=manifest&facility=PickUpManifest';
+  });
+</script>"""
+
+
+class MockPortalHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    render_latency = 0.0
+    no_report_rate = 0.0
+    xls_bytes = b""
+    quiet = True
+
+    def log_message(self, fmt, *args):
+        if not self.quiet:
+            print(f"[MockPortal] {self.address_string()} {fmt % args}")
+
+    def _logged_in(self) -> bool:
+        return COOKIE in self.headers.get("Cookie", "")
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, title: str, body: str):
+        self._send(200, PAGE.format(title=title, body=body).encode("utf-8"), "text/html; charset=utf-8")
+
+    def _redirect(self, location: str, headers: dict = None):
+        self._send(303, b"", "text/plain", {"Location": location, **(headers or {})})
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        length = int(self.headers.get("Content-Length", "0"))
+        self.rfile.read(length)
+        if urlparse(self.path).path == "/login":
+            return self._redirect("/", {"Set-Cookie": f"{COOKIE}; Path=/"})
+        self._send(404, b"not found", "text/plain")
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/signin":
+            return self._page("Sign in", SIGNIN)
+        if not self._logged_in():
+            if url.path == "/":
+                return self._page("Welcome", LANDING)
+            return self._redirect("/")
+
+        if url.path == "/":
+            return self._page("Portal home", HOME)
+        if url.path == "/search":
+            q = query.get("q", [""])[0]
+            if "Customer Connection" in q:
+                hit = SEARCH.format(href="/report/manifest", label="FedEx Customer Connection")
+            else:
+                hit = SEARCH.format(href="/report/ibpr", label="Daily Service Wk &amp; Vision IBPR")
+            return self._page("Search", hit)
+        if url.path in ("/report/ibpr", "/mgba/wsw"):
+            kind = "weekly" if url.path == "/mgba/wsw" else "daily"
+            return self._page(f"{kind.title()} Service Wk & Vision IBPR",
+                              IBPR.format(facilities=json.dumps(IBPR_FACILITIES), kind=kind, pixel=PIXEL))
+        if url.path == "/report/manifest":
+            return self._page("FedEx Customer Connection", MANIFEST)
+        if url.path == "/render":
+            time.sleep(self.render_latency)
+            has_report = random.random() >= self.no_report_rate
+            return self._send(200, json.dumps({"has_report": has_report}).encode("utf-8"),
+                              "application/json")
+        if url.path == "/download":
+            report = query.get("report", ["report"])[0]
+            facility = query.get("facility", ["facility"])[0]
+            filename = quote(f"{report}_{facility}.xls".replace("/", "_"))
+            return self._send(200, self.xls_bytes, "application/vnd.ms-excel",
+                              {"Content-Disposition": f"attachment; filename={filename}"})
+        self._send(404, b"not found", "text/plain")
+
+
+def build_report_bytes(rows: int, cols: int) -> bytes:
+    from bench_convert import build_synthetic_xls
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "report.xls"
+        build_synthetic_xls(path, rows, cols)
+        return path.read_bytes()
+
+
+def serve(port: int, rows: int = 2000, cols: int = 20, latency: float = 0.0,
+          render_latency: float = 0.0, no_report_rate: float = 0.0,
+          quiet: bool = True) -> ThreadingHTTPServer:
+    MockPortalHandler.xls_bytes = build_report_bytes(rows, cols)
+    MockPortalHandler.latency = latency
+    MockPortalHandler.render_latency = render_latency
+    MockPortalHandler.no_report_rate = no_report_rate
+    MockPortalHandler.quiet = quiet
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockPortalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the FedEx business portal")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--render-latency", type=float, default=0.0)
+    parser.add_argument("--no-report-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.rows, args.cols, args.latency, args.render_latency,
+                   args.no_report_rate, quiet=not args.verbose)
+    print(f"[MockPortal] Listening on http://127.0.0.1:{args.port}/ "
+          f"({len(MockPortalHandler.xls_bytes) / 1e6:.1f} MB reports)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
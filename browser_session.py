@@ -0,0 +1,206 @@
+# browser_session.py
+"""Long-lived Chromium session shared by the services.
+
+The browser is launched once per process and kept warm between iterations.
+After a successful login the context's ``storage_state`` (cookies + local
+storage) is written to disk and reused, by this process and the next one,
+until the login-expiry check fails. Only then is the full login replayed.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import traceback
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from readiness import wait_ready, selector_visible
+from timing import span
+
+PORTAL_URL = os.getenv("PORTAL_URL", "https://mybizaccount.fedex.com/")
+SESSION_DIR = Path(os.getenv("SESSION_DIR", "sessions"))
+
+# Present only once the portal considers us logged in
+LOGGED_IN_SELECTOR = "input#PTSKEYWORD"
+# Landing page button that leads to the credentials form
+LOGIN_ENTRY_SELECTOR = "input.credentials_input_submit"
+
+
+class SharedBrowser:
+    """One Chromium shared by several BrowserSessions in the same process.
+
+    Used by the in-process scheduler: each job keeps its own context and
+    saved login, but they all live in a single browser. The browser is
+    launched on first ``acquire`` and closed when the last session releases it.
+    """
+
+    def __init__(self, tag: str = "[Browser]", headless: bool = True):
+        self.tag = tag
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._users = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+                print(f"{self.tag} Shared browser launched")
+            self._users += 1
+            return self._browser
+
+    async def release(self):
+        async with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users:
+                return
+            try:
+                if self._browser:
+                    await self._browser.close()
+                    print(f"{self.tag} Shared browser closed")
+            finally:
+                self._browser = None
+                if self._playwright:
+                    await self._playwright.stop()
+                    self._playwright = None
+
+
+class BrowserSession:
+    """Warm Chromium + authenticated context, re-used across iterations.
+
+    With ``shared`` the browser comes from a SharedBrowser and only this
+    session's context is closed on ``close``.
+    """
+
+    def __init__(self, name: str, username: str, password: str,
+                 tag: str = "[Session]", headless: bool = True,
+                 shared: SharedBrowser = None):
+        self.name = name
+        self.username = username
+        self.password = password
+        self.tag = tag
+        self.headless = headless
+        self.shared = shared
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        # Serializes context creation / login when several pages open at once
+        self._lock = asyncio.Lock()
+
+    @property
+    def state_file(self) -> Path:
+        # Keyed by user so a credentials change never reuses a stale login
+        user_key = hashlib.sha1(self.username.encode("utf-8")).hexdigest()[:8]
+        return SESSION_DIR / f"{self.name}-{user_key}.json"
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        if self._browser and self._browser.is_connected():
+            return
+        if self.shared is not None:
+            if self._browser is not None:
+                await self.shared.release()
+            self._browser = await self.shared.acquire()
+            self._context = None
+            return
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._context = None
+        print(f"{self.tag} Browser launched")
+
+    async def close(self):
+        if self.shared is not None:
+            if self._browser is not None:
+                await self.invalidate()
+                self._browser = None
+                await self.shared.release()
+            return
+        try:
+            if self._browser:
+                await self._browser.close()
+                print(f"{self.tag} Browser closed")
+        finally:
+            self._browser = None
+            self._context = None
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+    async def _ensure_context(self):
+        await self.start()
+        if self._context is not None:
+            return
+        state = str(self.state_file) if self.state_file.exists() else None
+        if state:
+            print(f"{self.tag} Reusing saved login state: {self.state_file}")
+        self._context = await self._browser.new_context(
+            accept_downloads=True, storage_state=state
+        )
+
+    async def is_logged_in(self, page) -> bool:
+        """Login-expiry check: does the portal land on the search page?"""
+        with span("session_check"):
+            await page.goto(PORTAL_URL)
+            found = await page.wait_for_selector(
+                f"{LOGGED_IN_SELECTOR}, {LOGIN_ENTRY_SELECTOR}", timeout=60000
+            )
+            return await found.evaluate(
+                "(el, sel) => el.matches(sel)", LOGGED_IN_SELECTOR
+            )
+
+    async def login(self, page):
+        """Full mybizaccount login, then persist the storage state."""
+        print(f"{self.tag} Logging in as {self.username}...")
+        started = time.time()
+        with span("login"):
+            await page.goto(PORTAL_URL)
+            await wait_ready(page, "login_landing", selector_visible(LOGIN_ENTRY_SELECTOR), tag=self.tag)
+            await page.click(LOGIN_ENTRY_SELECTOR)
+            await wait_ready(page, "login_form", selector_visible('#input28'), tag=self.tag)
+            await page.fill('#input28', self.username)
+            await page.fill('#input36', self.password)
+            await page.click('input.button-primary')
+            await page.wait_for_load_state('domcontentloaded', timeout=60000)
+            await wait_ready(page, "portal_home", selector_visible(LOGGED_IN_SELECTOR), tag=self.tag)
+
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        await self._context.storage_state(path=str(self.state_file))
+        print(f"{self.tag} ✅ Logged in ({time.time() - started:.1f}s), state saved to {self.state_file}")
+
+    async def new_page(self):
+        """Return a page on the portal home, logging in only if needed."""
+        async with self._lock:
+            await self._ensure_context()
+            page = await self._context.new_page()
+            try:
+                if await self.is_logged_in(page):
+                    print(f"{self.tag} Session still valid, skipping login")
+                else:
+                    await self.login(page)
+                return page
+            except Exception:
+                await page.close()
+                # Drop a context that may be wedged; next call starts clean
+                await self.invalidate()
+                raise
+
+    async def invalidate(self):
+        """Forget the current context (e.g. after a failed check)."""
+        if self._context is not None:
+            try:
+                await self._context.close()
+            except Exception:
+                traceback.print_exc()
+            self._context = None
@@ -0,0 +1,133 @@
+# config_store.py
+"""config.json as a versioned store shared by the control panel and workers.
+
+The panel edits settings from several Flask request threads while the
+workers re-read the file between iterations, so:
+
+* writes are atomic: the new file is written next to the old one, fsynced
+  and renamed over it, so a reader (or a crash) never sees half a file;
+* edits are serialized by a lock held across threads and processes
+  (``edit()``: read the current file, change it, write it back);
+* every write bumps a monotonic ``_version`` stored in the file;
+* ``changed()`` is one stat() call (mtime, size, inode): ``read()`` only
+  parses the file, and merges it over the defaults, when it has changed;
+* ``read()`` hands out a copy and ``edit()`` works on one, which replaces
+  the cached config only once it is safely on disk.
+
+    store = ConfigStore("config.json", defaults)
+    with store.edit() as config:
+        config["daily_service"]["frequency"] = 30
+    store.read()["daily_service"]["frequency"], store.version
+"""
+
+import os
+import copy
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+VERSION_KEY = "_version"
+
+
+class ConfigStore:
+    """Per-job settings in one JSON file; thread- and process-safe."""
+
+    def __init__(self, path, defaults: dict = None):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        # job -> default settings; None keeps exactly what the file has
+        self.defaults = defaults
+        self.version = 0
+        self._config = None
+        self._stamp = None
+        self._lock = threading.RLock()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def changed(self) -> bool:
+        """Has the file changed since it was last read or written here?"""
+        return self._config is None or self._stat() != self._stamp
+
+    def read(self) -> dict:
+        """A copy of the current config (job -> settings); only re-parsed when it changed."""
+        with self._lock:
+            if self.changed():
+                self._load()
+            return copy.deepcopy(self._config)
+
+    def _load(self):
+        stamp = self._stat()
+        saved = {}
+        if stamp is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        version = saved.pop(VERSION_KEY, 0)
+        if self.defaults is None:
+            config = saved
+        else:
+            config = {job: {**defaults, **saved.get(job, {})} for job, defaults in self.defaults.items()}
+        self._config, self.version, self._stamp = config, version, stamp
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @contextmanager
+    def edit(self):
+        """Change a copy of the config; written (version + 1) when the block ends.
+
+        The block sees the latest file, also if another process wrote it. If
+        it or the write raises, the changes are dropped and the store keeps
+        what is on disk.
+        """
+        with self._lock, self._file_lock():
+            if self.changed():
+                self._load()
+            config = copy.deepcopy(self._config)
+            yield config
+            self._write(config, self.version + 1)
+
+    def _write(self, config: dict, version: int):
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({VERSION_KEY: version, **config}, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if tmp.exists():
+                tmp.unlink()
+            raise
+        if fcntl is not None:
+            # Make the rename itself durable
+            dir_fd = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self._config, self.version, self._stamp = config, version, self._stat()
@@ -1,103 +1,159 @@
 import os
 import sys
 import json
+import queue
+import signal
+import threading
 import traceback
 import subprocess
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 from datetime import datetime
+
+import events
+from config_store import ConfigStore
+from cron_schedule import MISSED_RUN_POLICIES, CronSchedule
+from log_store import LEVELS, LogStore
+from metrics import MetricsCollector
+from run_history import RunHistory
+from supervisor import Supervisor
+from report_jobs import JOBS
+
 app = Flask(__name__)
 
 CONFIG_FILE = "config.json"
 
-# Track processes
-processes = {
-    "daily_service": None,
-    "pickup_manifest": None,
-    "weekly_service": None
+# Upload formats understood by drive_uploader.UploadStage
+OUTPUT_MODES = ("xlsx", "csv", "gsheet")
+
+# "process": one worker process per job (default)
+# "inprocess": every job as an asyncio task in this process (scheduler.py)
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "process")
+scheduler = None
+
+# Track processes, one per job declared in report_jobs.JOBS
+processes = {job_name: None for job_name in JOBS}
+
+# Live events from the workers, streamed to /events clients
+bus = events.EventBus()
+SSE_KEEPALIVE_SECS = 15
+
+# Worker log records, tailed through /logs/<script_name>
+logs = None
+LOG_ECHO = os.getenv("LOG_ECHO", "1") == "1"
+
+# Heartbeats, hang detection, restarts with backoff (process mode)
+supervisor = None
+
+# Settings every job has on top of its own "defaults"
+COMMON_DEFAULTS = {
+    "output_mode": "xlsx",
+    "cron": None,
+    "missed_runs": "coalesce",
+    "prefetch": True,
+    "folder_id_updated": None,
+    "username": "USERNAME",
+    "username_updated": None,
+    "password": "PASSWORD",
+    "password_updated": None
 }
 
 # Default script configurations
 default_config = {
-    "daily_service": {
-        "start_hour": 9,
-        "end_hour": 22,
-        "frequency": 60,
-        "folder_id": "FOLDER-ID-DAILY",
-        "folder_id_updated": None,
-        "username": "USERNAME",
-        "username_updated": None,
-        "password": "PASSWORD",
-        "password_updated": None
-    },
-    "pickup_manifest": {
-        "start_hour": 8,
-        "end_hour": 23,
-        "frequency": 120,
-        "folder_id": "FOLDER-ID-PICKUP",
-        "folder_id_updated": None,
-        "username": "USERNAME",
-        "username_updated": None,
-        "password": "PASSWORD",
-        "password_updated": None
-    },
-    "weekly_service": {
-        "schedule_run": 1,
-        "folder_id": "FOLDER-ID-WEEKLY",
-        "folder_id_updated": None,
-        "username": "USERNAME",
-        "username_updated": None,
-        "password": "PASSWORD",
-        "password_updated": None
-    }
+    job_name: {**job["defaults"], **COMMON_DEFAULTS}
+    for job_name, job in JOBS.items()
 }
 
-# Load settings from JSON file
-def load_config():
-    saved_config = {}
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            saved_config = json.load(f)
-
-    merged_config = {}
-    for script_name in default_config:
-        script_config = default_config[script_name].copy()
-        if script_name in saved_config:
-            script_config.update(saved_config[script_name])
-        merged_config[script_name] = script_config
-    return merged_config
-# Save settings to JSON file
-def save_config():
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(scripts_config, f, indent=4)
-
-
-def stop_script(script_name):
-    proc = processes[script_name]
-    if not proc or proc.poll() is not None:
-        return False
-
+# Saved settings over the defaults; atomic, locked, versioned writes
+config_store = ConfigStore(CONFIG_FILE, default_config)
+
+def scripts_config():
+    """Current settings of every script (re-read only if config.json changed)."""
+    return config_store.read()
+
+
+def is_running(script_name):
+    if scheduler is not None:
+        return scheduler.is_running(script_name)
+    return supervisor.is_running(script_name)
+
+def stop_script(script_name, wait=None):
+    """Stop after the current facility; returns at once unless ``wait`` (seconds)."""
+    if scheduler is not None:
+        return scheduler.stop_job(script_name, wait)
+    return supervisor.stop_job(script_name, wait)
+
+def job_for_tag(tag):
+    """Job whose log tag starts ``tag`` (in-process mode: one shared stdout)."""
+    for job_name, job in JOBS.items():
+        if tag and tag.startswith(job["tag"]):
+            return job_name
+    return None
+
+def dispatch(event):
+    """Log records to the log store (and console), anything else to the bus."""
+    job_name = event.get("job") or job_for_tag(event.get("tag"))
+    supervisor.observe(job_name, event)
+    if event.get("kind") == "heartbeat":
+        return
+    if event.get("kind") != "log":
+        bus.publish(event)
+        return
+    event.pop("job", None)
+    event.pop("kind", None)
+    # The panel's own output (requests, ...) stays on its console only
+    if job_name is not None:
+        logs.append(job_name, event)
+    if LOG_ECHO or job_name is None:
+        tag = f"{event['tag']} " if event.get("tag") else ""
+        events.write_raw(f"{tag}{event.get('msg', '')}\n")
+
+def pump_output(script_name, proc):
+    """Reader thread: worker log records and events, line by line."""
     try:
-        proc.terminate()
-        proc.wait(timeout=10)
-        processes[script_name] = None
-        return True
-    except Exception as e:
+        for line in proc.stdout:
+            event = events.parse(line)
+            if event is None:
+                # Not a record, e.g. a conversion pool child printing directly
+                line = line.rstrip("\r\n")
+                if not line.strip():
+                    continue
+                event = {"kind": "log", "ts": round(datetime.now().timestamp(), 3),
+                         **events.log_fields(line)}
+            event["job"] = event.get("job") or script_name
+            dispatch(event)
+    except Exception:
         traceback.print_exc()
-        return False
 
-def start_script(script_name):
-    if processes[script_name] and processes[script_name].poll() is None:
-        return processes[script_name]
+def wait_worker(script_name, proc):
+    """Waiter thread: report the exit (Chromium may hold the pipe open past it)."""
+    supervisor.exited(script_name, proc, proc.wait())
 
-    cfg = scripts_config[script_name]
+def build_env(script_name):
+    """Environment for a worker process, built from its current settings."""
+    cfg = scripts_config()[script_name]
     env = os.environ.copy()
     env.update({
         "FOLDER_ID": cfg["folder_id"],
         "SCRIPT_USERNAME": cfg["username"],
-        "SCRIPT_PASSWORD": cfg["password"]
+        "SCRIPT_PASSWORD": cfg["password"],
+        "OUTPUT_MODE": cfg["output_mode"],
+        # Later changes are read from here between iterations (no restart)
+        "CONFIG_FILE": os.path.abspath(CONFIG_FILE),
+        # Events come back over the worker's stdout pipe, line by line
+        "EVENTS_PIPE": "1",
+        "PYTHONUNBUFFERED": "1"
     })
 
-    if script_name == "weekly_service":
+    if "concurrency" in cfg:
+        env["CONCURRENCY"] = str(cfg["concurrency"])
+    if "incremental" in cfg:
+        env["INCREMENTAL"] = "1" if cfg["incremental"] else "0"
+    if cfg.get("cron"):
+        env["CRON"] = cfg["cron"]
+    env["MISSED_RUNS"] = cfg["missed_runs"]
+    env["PREFETCH"] = "1" if cfg.get("prefetch", True) else "0"
+
+    if JOBS[script_name]["schedule"] == "weekly":
         env["SCHEDULE_RUN"] = str(cfg["schedule_run"])
     else:
         env.update({
@@ -105,23 +161,121 @@ def start_script(script_name):
             "END_HOUR": str(cfg["end_hour"]),
             "FREQUENCY": str(cfg["frequency"])
         })
+    return env
+
+def spawn_worker(script_name):
+    """Start one worker process with its current settings (called by the supervisor)."""
+    env = build_env(script_name)
 
     try:
-        proc = subprocess.Popen([sys.executable, f"{script_name}.py"], env=env)
+        # Own process group: the supervisor can take Chromium down with the worker
+        proc = subprocess.Popen([sys.executable, "job_engine.py", script_name], env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding="utf-8", errors="replace",
+                                start_new_session=True)
         processes[script_name] = proc
+        bus.publish({"kind": "state", "job": script_name, "state": "started", "pid": proc.pid})
+        threading.Thread(target=pump_output, args=(script_name, proc),
+                         name=f"{script_name}-output", daemon=True).start()
+        threading.Thread(target=wait_worker, args=(script_name, proc),
+                         name=f"{script_name}-wait", daemon=True).start()
         return proc
     except Exception as e:
         traceback.print_exc()
         return None
-    
-    
-# Load initial settings
-scripts_config = load_config()
+
+def start_script(script_name):
+    if scheduler is not None:
+        return scheduler.start_job(script_name, settings_from_config(script_name, scripts_config()[script_name]))
+    return supervisor.start_job(script_name)
+
+def apply_settings(script_name):
+    """Hand changed settings to a running job (once saved)."""
+    if not is_running(script_name):
+        return
+    if scheduler is not None:
+        # Picked up at the job's next iteration, no restart needed
+        scheduler.update_settings(script_name, settings_from_config(script_name, scripts_config()[script_name]))
+    # Worker processes watch CONFIG_FILE and apply it between iterations
+
+def script_status(script_name):
+    """Running state + config of one script, as returned by /status."""
+    cfg = scripts_config()[script_name]
+    running = is_running(script_name)
+    data = {
+        "running": running,
+        "status": "Running" if running else "Stopped",
+        "schedule_run": cfg.get("schedule_run"),
+        "hours": [cfg.get("start_hour"), cfg.get("end_hour")],
+        "frequency": cfg.get("frequency"),
+        "concurrency": cfg.get("concurrency"),
+        "output_mode": cfg.get("output_mode"),
+        "incremental": cfg.get("incremental"),
+        "cron": cfg.get("cron"),
+        "missed_runs": cfg.get("missed_runs"),
+        "folder_id": cfg["folder_id"],
+        "username": cfg["username"],
+        "password": "******",
+        "folder_id_updated": cfg.get("folder_id_updated"),
+        "username_updated": cfg.get("username_updated"),
+        "password_updated": cfg.get("password_updated")
+    }
+    try:
+        data["stats"] = history.job_stats(script_name)
+    except Exception:
+        traceback.print_exc()
+        data["stats"] = None
+    if scheduler is not None:
+        data.update(scheduler.status(script_name))
+        if running and data["stopping"]:
+            data["status"] = "Stopping"
+        elif running and data["paused"]:
+            data["status"] = "Paused"
+    else:
+        data.update(supervisor.status(script_name))
+        if data["health"] in ("stopping", "restarting"):
+            data["status"] = data["health"].title()
+    return data
+
+
+# Iteration records written by the workers (timing.py)
+metrics = None
+history = None
+
+
+def init():
+    """Set up the panel's state; only in the panel process itself.
+
+    Not at import: conversion pool children re-import this module (as
+    __mp_main__) and must not open stores or capture their own output.
+    """
+    global logs, supervisor, metrics, history, scheduler, settings_from_config
+    logs = LogStore()
+    supervisor = Supervisor(spawn_worker, bus.publish)
+    metrics = MetricsCollector()
+    history = RunHistory()
+    if SCHEDULER_MODE == "inprocess":
+        # Heavy imports (Playwright, Google client, openpyxl) only in this mode
+        from job_engine import settings_from_config
+        from scheduler import JobScheduler
+        scheduler = JobScheduler()
+        # Jobs run in this process: their events and output go straight to the bus / log store
+        events.set_sink(dispatch)
+        events.capture_output()
 
 
 @app.route("/")
 def index():
-    return render_template("index.html")
+    # The job list and which settings apply to each come from report_jobs.JOBS
+    jobs = {
+        job_name: {
+            "label": job_name.replace("_", " ").title(),
+            "weekly": job["schedule"] == "weekly",
+            "concurrency": "concurrency" in job["defaults"],
+        }
+        for job_name, job in JOBS.items()
+    }
+    return render_template("index.html", jobs=jobs)
 
 
 @app.route("/status", methods=["GET"])
@@ -133,94 +287,106 @@ def get_status():
         if script_name not in processes:
             return jsonify({"error": "Invalid script name"}), 400
 
-        proc = processes[script_name]
-        cfg = scripts_config[script_name]
-        running = proc is not None and proc.poll() is None
-        status_txt = "Running" if running else "Stopped"
-
-        return jsonify({
-            "running": running,
-            "status": status_txt,
-            "schedule_run": cfg.get("schedule_run"),
-            "hours": [cfg.get("start_hour"), cfg.get("end_hour")],
-            "frequency": cfg.get("frequency"),
-            "folder_id": cfg["folder_id"],
-            "username": cfg["username"],
-            "password": "******",
-            "folder_id_updated": cfg.get("folder_id_updated"),
-            "username_updated": cfg.get("username_updated"),
-            "password_updated": cfg.get("password_updated")
-        })
+        return jsonify(script_status(script_name))
 
     # Return status for all scripts
-    all_data = {
-        sname: {
-            "running": proc is not None and proc.poll() is None,
-            "status": "Running" if proc is not None and proc.poll() is None else "Stopped",
-            "schedule_run": cfg.get("schedule_run"),
-            "hours": [cfg.get("start_hour"), cfg.get("end_hour")],
-            "frequency": cfg.get("frequency"),
-            "folder_id": cfg["folder_id"],
-            "username": cfg["username"],
-            "password": "******",
-            "folder_id_updated": cfg.get("folder_id_updated"),
-            "username_updated": cfg.get("username_updated"),
-            "password_updated": cfg.get("password_updated")
-        }
-        for sname, proc in processes.items()
-        for cfg in [scripts_config[sname]]
-    }
+    all_data = {sname: script_status(sname) for sname in processes}
 
     return jsonify(all_data)
 
 
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus-style histograms per job and stage."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/events", methods=["GET"])
+def event_stream():
+    """Server-sent events: job states, facility progress, stage timings.
+
+    ``?script=`` limits the stream to one job. A reconnecting client
+    (Last-Event-ID) first gets the events it missed, as far as they are
+    still kept.
+    """
+    script_name = request.args.get("script")
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since")
+    subscription = bus.subscribe(int(last_id) if last_id and last_id.isdigit() else None)
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = subscription.get(timeout=SSE_KEEPALIVE_SECS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if script_name and event.get("job") != script_name:
+                    continue
+                yield f"id: {event['seq']}\nevent: {event['kind']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            bus.unsubscribe(subscription)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/logs/<script_name>", methods=["GET"])
+def get_logs(script_name):
+    """Tail a job's log records: ``?since=<seq>&limit=&level=warning``."""
+    if script_name not in processes:
+        return jsonify({"error": "Invalid script name"}), 400
+    try:
+        since = int(request.args.get("since", 0))
+        limit = max(1, min(int(request.args.get("limit", 500)), 5000))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    level = request.args.get("level")
+    if level not in (None,) + LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(LEVELS)}"}), 400
+    return jsonify(logs.get(script_name).since(since, limit, level))
+
+
 @app.route("/control/<script_name>", methods=["POST"])
 def control_script(script_name):
-    """Start or stop a script."""
+    """Start or stop a script; pause/resume in the in-process scheduler mode."""
     if script_name not in processes:
         return jsonify({"error": "Invalid script name"}), 400
 
     data = request.json or {}
     action = data.get("action")
 
+    if scheduler is not None:
+        if action == "start":
+            if not start_script(script_name):
+                return jsonify({"status": f"{script_name} is already running"})
+            return jsonify({"status": f"Started {script_name} (in-process)"})
+        handlers = {
+            "stop": (scheduler.stop_job, "Stopping"),
+            "pause": (scheduler.pause_job, "Paused"),
+            "resume": (scheduler.resume_job, "Resumed"),
+        }
+        if action in handlers:
+            handler, done = handlers[action]
+            if handler(script_name):
+                return jsonify({"status": f"{done} {script_name}"})
+        return jsonify({"status": "no change"})
+
     if action == "start":
         if processes[script_name] and processes[script_name].poll() is None:
             return jsonify({"status": f"{script_name} is already running"})
 
-        # Apply updated settings before starting the script
-        env = os.environ.copy()
-        cfg = scripts_config[script_name]
-        env["FOLDER_ID"] = cfg["folder_id"]
-        env["SCRIPT_USERNAME"] = cfg["username"]
-        env["SCRIPT_PASSWORD"] = cfg["password"]
-
-        if script_name == "weekly_service":
-            env["SCHEDULE_RUN"] = str(cfg["schedule_run"])
-        else:
-            env["START_HOUR"] = str(cfg["start_hour"])
-            env["END_HOUR"] = str(cfg["end_hour"])
-            env["FREQUENCY"] = str(cfg["frequency"])
-
-        try:
-            proc = subprocess.Popen([sys.executable, f"{script_name}.py"], env=env)
-            processes[script_name] = proc
-            return jsonify({"status": f"Started {script_name}, PID={proc.pid}"})
-        except Exception as e:
-            traceback.print_exc()
-            return jsonify({"error": str(e)}), 500
+        # Started with its current settings
+        proc = start_script(script_name)
+        if proc is None:
+            return jsonify({"error": f"Could not start {script_name}"}), 500
+        return jsonify({"status": f"Started {script_name}, PID={proc.pid}"})
 
     elif action == "stop":
-        proc = processes[script_name]
-        if not proc or proc.poll() is not None:
+        if not stop_script(script_name):
             return jsonify({"status": f"{script_name} not running"})
-        try:
-            proc.terminate()
-            proc.wait(timeout=10)
-            processes[script_name] = None
-            return jsonify({"status": f"Stopped {script_name}"})
-        except Exception as e:
-            traceback.print_exc()
-            return jsonify({"error": str(e)}), 500
+        return jsonify({"status": f"Stopping {script_name} after its current facility"})
 
     return jsonify({"status": "no change"})
 
@@ -228,76 +394,88 @@ def control_script(script_name):
 @app.route("/update_settings/<script_name>", methods=["POST"])
 def update_settings(script_name):
     """Update run hours, frequency, folder_id, etc. in memory and save them."""
-    if script_name not in scripts_config:
+    if script_name not in scripts_config():
         return jsonify({"error": "Invalid script name"}), 400
 
-    cfg = scripts_config[script_name]
     data = request.json or {}
-    restart_needed = False
-    if "folder_id" in data:
-        cfg["folder_id"] = data["folder_id"]
-        cfg["folder_id_updated"] = datetime.now().isoformat()
-        restart_needed = True
+    if data.get("output_mode") not in (None,) + OUTPUT_MODES:
+        return jsonify({"error": f"output_mode must be one of {', '.join(OUTPUT_MODES)}"}), 400
+    if data.get("missed_runs") not in (None,) + MISSED_RUN_POLICIES:
+        return jsonify({"error": f"missed_runs must be one of {', '.join(MISSED_RUN_POLICIES)}"}), 400
+    if data.get("cron"):
+        try:
+            CronSchedule(data["cron"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
     # Optional fields
     start = data.get("start_hour")
     end = data.get("end_hour")
     freq = data.get("frequency")
+    conc = data.get("concurrency")
+    mode = data.get("output_mode")
+    incremental = data.get("incremental")
+    missed_runs = data.get("missed_runs")
     fold_id = data.get("folder_id")
 
-    if start is not None:
-        cfg["start_hour"] = int(start)
-    if end is not None:
-        cfg["end_hour"] = int(end)
-    if freq is not None:
-        cfg["frequency"] = int(freq)
-    if fold_id is not None:
-        cfg["folder_id"] = fold_id
-
-    if restart_needed and processes[script_name] and processes[script_name].poll() is None:
-        stop_script(script_name)
-        start_script(script_name)
-    # Save changes to JSON file
-    save_config()
+    # Saved when the block ends; running workers pick the changes up from there
+    with config_store.edit() as config:
+        cfg = config[script_name]
+        if "folder_id" in data:
+            cfg["folder_id"] = data["folder_id"]
+            cfg["folder_id_updated"] = datetime.now().isoformat()
+        if start is not None:
+            cfg["start_hour"] = int(start)
+        if end is not None:
+            cfg["end_hour"] = int(end)
+        if freq is not None:
+            cfg["frequency"] = int(freq)
+        if conc is not None and "concurrency" in cfg:
+            cfg["concurrency"] = max(1, int(conc))
+        if mode is not None:
+            cfg["output_mode"] = mode
+        if incremental is not None and "incremental" in cfg:
+            cfg["incremental"] = bool(incremental)
+        if "cron" in data:
+            # Empty clears it, back to run hours + frequency
+            cfg["cron"] = data["cron"] or None
+        if missed_runs is not None:
+            cfg["missed_runs"] = missed_runs
+        if fold_id is not None:
+            cfg["folder_id"] = fold_id
+    apply_settings(script_name)
 
     return jsonify({
         "status": "settings updated",
-        "config": cfg
+        "config": cfg,
+        "version": config_store.version
     })
 
 
 @app.route("/update_credentials/<script_name>", methods=["POST"])
 def update_credentials(script_name):
-    print(f"\n=== Received credentials update request for {script_name} ===")  # Debug log
-    print("Request headers:", request.headers)  # Debug log
-    print("Request data:", request.data)  # Debug log
+    print(f"Credentials update requested via {script_name}")
     data = request.json or {}
     new_username = data.get("username")
     new_password = data.get("password")
 
     current_time = datetime.now().isoformat()
-    restart_scripts = []
 
+    with config_store.edit() as config:
+        for sname in processes:
+            cfg = config[sname]
+            if new_username is not None:
+                cfg["username"] = new_username
+                cfg["username_updated"] = current_time
+            if new_password is not None:
+                cfg["password"] = new_password
+                cfg["password_updated"] = current_time
+
+    # Each job logs in again with them from its next iteration, nothing restarts
     for sname in processes:
-        cfg = scripts_config[sname]
-        if new_username is not None:
-            cfg["username"] = new_username
-            cfg["username_updated"] = current_time
-        if new_password is not None:
-            cfg["password"] = new_password
-            cfg["password_updated"] = current_time
-        
-        if processes[sname] and processes[sname].poll() is None:
-            restart_scripts.append(sname)
-
-    # Restart affected scripts
-    for sname in restart_scripts:
-        stop_script(sname)
-        start_script(sname)
-
-    save_config()
+        apply_settings(sname)
     return jsonify({
         "status": "credentials updated",
-        "username": new_username or scripts_config[script_name]["username"],
+        "username": new_username or scripts_config()[script_name]["username"],
         "password": "******"
     })
 
@@ -305,22 +483,39 @@ def update_credentials(script_name):
 @app.route("/update_schedule/<script_name>", methods=["POST"])
 def update_schedule(script_name):
     """Update the schedule mode for the weekly service."""
-    if script_name != "weekly_service":
-        return jsonify({"error": "Only applicable to weekly_service"}), 400
+    if script_name not in JOBS or JOBS[script_name]["schedule"] != "weekly":
+        return jsonify({"error": "Only applicable to weekly jobs"}), 400
 
     data = request.json or {}
     schedule_run = data.get("schedule_run")
     if schedule_run is not None:
-        scripts_config[script_name]["schedule_run"] = int(schedule_run)
-
-    # Save changes to JSON file
-    save_config()
+        with config_store.edit() as config:
+            config[script_name]["schedule_run"] = int(schedule_run)
+        apply_settings(script_name)
 
     return jsonify({
         "status": "schedule updated",
-        "schedule_run": scripts_config[script_name]["schedule_run"]
+        "schedule_run": scripts_config()[script_name]["schedule_run"]
     })
 
 
+def handle_sigterm(signum, frame):
+    # Unwinds app.run() like Ctrl+C, so workers are shut down below
+    raise KeyboardInterrupt
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    init()
+    if scheduler is not None:
+        scheduler.start()
+    else:
+        supervisor.start()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    try:
+        app.run(host="0.0.0.0", port=5000, debug=False)
+    finally:
+        print("[Supervisor] Shutting down workers (current facilities finish first)...")
+        if scheduler is not None:
+            scheduler.shutdown()
+        else:
+            supervisor.shutdown()
@@ -0,0 +1,210 @@
+# conversion_pool.py
+"""Process pool for report conversion, parallel across files and sheets.
+
+xlrd parsing and XLSX writing are CPU-bound, so on the upload stage's
+threads they serialize on the GIL and compete with the event loop that
+drives the browser. Here every sheet of a workbook becomes its own task in
+a shared ProcessPoolExecutor (``write_sheet_xml`` / ``write_sheet_csv``);
+the per-sheet parts are then merged into one .xlsx (``assemble_xlsx``).
+Files of different facilities convert side by side on the same pool.
+
+The pool has CONVERT_WORKERS processes (default: CPU count). If one of
+them dies (e.g. OOM-killed) the pool is broken; it is then replaced and the
+task retried once, instead of every later task failing. In-flight
+tasks are also held to CONVERT_MEMORY_MB, estimating each task at its
+share of the file size times CONVERT_MEMORY_FACTOR (xlrd with
+formatting_info holds several times the file in memory). A task bigger than
+the whole budget still runs, but only on its own.
+
+With CONVERT_RSS_LIMIT_MB set, .xlsx conversion is not split by sheet:
+each file is one pool task running the memory-bounded converter
+(xls_converter.convert_xls_to_xlsx_bounded), so no worker goes past the
+ceiling. CONVERT_POOL=0 falls back to converting on the upload stage's
+threads.
+A report ``spec`` is passed through to the workers, which normalize and
+validate each sheet (normalize.py); ReportValidationError propagates.
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import weakref
+import threading
+import traceback
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from normalize import ReportValidationError
+from timing import count, counting
+from xls_converter import (CONVERT_RSS_LIMIT_MB, KEEP_MERGES, assemble_xlsx, content_digest,
+                           convert_xls_to_xlsx_bounded, csv_path_for, sheet_names, write_sheet_csv,
+                           write_sheet_xml)
+
+CONVERT_POOL = os.getenv("CONVERT_POOL", "1") == "1"
+CONVERT_WORKERS = max(1, min(os.cpu_count() or 1, int(os.getenv("CONVERT_WORKERS", "0")) or os.cpu_count() or 1))
+CONVERT_MEMORY_MB = float(os.getenv("CONVERT_MEMORY_MB", "1024"))
+CONVERT_MEMORY_FACTOR = float(os.getenv("CONVERT_MEMORY_FACTOR", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """The process-wide pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the parent has browser / upload threads, forking them is unsafe
+            _pool = ProcessPoolExecutor(max_workers=CONVERT_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _replace_broken(broken: ProcessPoolExecutor):
+    """Drop a pool whose worker died (e.g. OOM-killed); the next get_pool() starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        # Tasks that failed together on the same pool replace it only once
+        if _pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class MemoryBudget:
+    """Admits tasks while their estimated memory fits in the budget."""
+
+    def __init__(self, total_mb: float = CONVERT_MEMORY_MB):
+        self.total = total_mb
+        self.used = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, mb: float):
+        async with self._cond:
+            # An oversized task waits until it is alone, then runs anyway
+            await self._cond.wait_for(lambda: self.used == 0 or self.used + mb <= self.total)
+            self.used += mb
+
+    async def release(self, mb: float):
+        async with self._cond:
+            self.used -= mb
+            self._cond.notify_all()
+
+
+_budgets = weakref.WeakKeyDictionary()
+
+
+def _budget() -> MemoryBudget:
+    # One per event loop (asyncio primitives are bound to their loop)
+    loop = asyncio.get_running_loop()
+    if loop not in _budgets:
+        _budgets[loop] = MemoryBudget()
+    return _budgets[loop]
+
+
+async def run(func, *args, mb: float = 0.0):
+    """Run ``func(*args)`` in the pool once ``mb`` of the budget is free.
+
+    If a pool worker died, the pool is replaced and the task retried once.
+    """
+    budget = _budget()
+    await budget.acquire(mb)
+    try:
+        pool = get_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            print(f"[Convert] ⚠ Conversion pool broken (a worker died), restarting it for {func.__name__}")
+            _replace_broken(pool)
+            pool = get_pool()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+            except BrokenProcessPool:
+                # The task itself kills its worker; leave a working pool behind
+                _replace_broken(pool)
+                raise
+    finally:
+        await budget.release(mb)
+
+
+def estimate_mb(xls_path: Path, n_tasks: int = 1) -> float:
+    size_mb = xls_path.stat().st_size / (1024 * 1024)
+    return size_mb + size_mb * CONVERT_MEMORY_FACTOR / max(1, n_tasks)
+
+
+async def digest(xls_path: Path) -> str:
+    return await run(content_digest, xls_path, mb=estimate_mb(xls_path))
+
+
+def _convert_bounded(xls_path: Path, tag: str, rss_limit_mb: float, spec: dict):
+    """Pool task: the bounded conversion, and the rows it wrote."""
+    with counting() as counters:
+        xlsx_path = convert_xls_to_xlsx_bounded(xls_path, tag, rss_limit_mb, KEEP_MERGES, spec)
+    return xlsx_path, counters["rows"]
+
+
+async def convert_to_xlsx(xls_path: Path, tag: str = "[Convert]", spec: dict = None) -> Path:
+    """Convert every sheet in parallel and merge them; None on failure.
+
+    Under CONVERT_RSS_LIMIT_MB the file is converted by one memory-bounded task.
+    """
+    parts_dir = xls_path.with_name(f"{xls_path.stem}.parts")
+    try:
+        if CONVERT_RSS_LIMIT_MB:
+            # The worker may grow up to the ceiling, so that is its share of the budget
+            xlsx_path, rows = await run(_convert_bounded, xls_path, tag, CONVERT_RSS_LIMIT_MB, spec,
+                                        mb=CONVERT_RSS_LIMIT_MB)
+            count("rows", rows)
+            return xlsx_path
+        if not xls_path.exists():
+            print(f"{tag} ❌ File not found: {xls_path}")
+            return None
+        xlsx_path = xls_path.with_suffix(".xlsx")
+        started = time.time()
+        names = await run(sheet_names, xls_path)
+        print(f"{tag} Converting {xls_path} -> {xlsx_path} ({len(names)} sheet(s) in parallel)...")
+
+        parts_dir.mkdir(exist_ok=True)
+        mb = estimate_mb(xls_path, len(names))
+        parts = await asyncio.gather(*(
+            run(write_sheet_xml, xls_path, idx, parts_dir / f"sheet{idx + 1}.xml", KEEP_MERGES, spec, mb=mb)
+            for idx in range(len(names))
+        ))
+        await run(assemble_xlsx, parts, xlsx_path)
+        count("rows", sum(p["rows"] for p in parts))
+        print(f"{tag} ✅ Converted to: {xlsx_path} ({time.time() - started:.1f}s)")
+        return xlsx_path
+    except ReportValidationError:
+        raise
+    except Exception as e:
+        print(f"{tag} ❌ XLS->XLSX conversion failed: {e}")
+        traceback.print_exc()
+        return None
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+async def convert_to_csv(xls_path: Path, tag: str = "[Convert]", spec: dict = None) -> list:
+    """One CSV per sheet, written in parallel; None on failure."""
+    try:
+        if not xls_path.exists():
+            print(f"{tag} ❌ File not found: {xls_path}")
+            return None
+        names = await run(sheet_names, xls_path)
+        mb = estimate_mb(xls_path, len(names))
+        parts = await asyncio.gather(*(
+            run(write_sheet_csv, xls_path, idx, csv_path_for(xls_path, name, len(names)), spec, mb=mb)
+            for idx, name in enumerate(names)
+        ))
+        count("rows", sum(p["rows"] for p in parts))
+        csv_paths = [Path(p["path"]) for p in parts]
+        print(f"{tag} ✅ Wrote CSV: {', '.join(p.name for p in csv_paths)}")
+        return csv_paths
+    except ReportValidationError:
+        raise
+    except Exception as e:
+        print(f"{tag} ❌ XLS->CSV conversion failed: {e}")
+        traceback.print_exc()
+        return None
@@ -0,0 +1,210 @@
+# cron_schedule.py
+"""Cron-style schedules in US/Eastern with a missed-run policy.
+
+A schedule is either a 5-field cron expression (minute hour day month
+weekday; ``*``, ``a-b``, ``*/n``, ``a-b/n`` and lists, weekday 0/7 = Sunday)
+or ``CronSchedule.every(start_hour, end_hour, frequency)``, the classic
+"every N minutes within run hours", aligned to start_hour on the wall clock.
+
+The next fire time is computed once and slept until, so runs don't drift.
+Ticks that pass while an iteration is still running (or while the worker is
+down) are "missed" and handled by the policy instead of piling up:
+
+* ``skip``     - drop missed ticks, wait for the next one
+* ``coalesce`` - run once for all missed ticks (default), but only while the
+                 latest one is still current: no later than one schedule
+                 interval after it. Started at 7:50 after an overnight gap, a
+                 8:00-17:00 job does not run for yesterday's 16:30 tick, it
+                 waits for 8:00
+* ``catchup``  - run once per missed tick, oldest first (at most MAX_CATCHUP),
+                 each for the report date of its own tick
+
+Since the loop runs iterations one after another, a slow iteration never
+overlaps the next one. The last fire time is kept per job in
+SCHEDULE_STATE_DIR so a restarted worker knows what it missed.
+
+A job's very first start (no saved fire time) does not run straight away
+unless a tick passed within MISFIRE_GRACE: started at 10:30 on a 2-hourly
+schedule from 8:00, it first runs at 12:00.
+"""
+
+import os
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytz
+
+EST = pytz.timezone("US/Eastern")
+
+MISSED_RUN_POLICIES = ("skip", "coalesce", "catchup")
+MISSED_RUNS = os.getenv("MISSED_RUNS", "coalesce")
+# A tick this late (seconds) still counts as on time, not missed
+MISFIRE_GRACE = int(os.getenv("MISFIRE_GRACE", "300"))
+MAX_CATCHUP = int(os.getenv("MAX_CATCHUP", "24"))
+# Missed ticks further back than this are never looked at
+MAX_LOOKBACK = timedelta(days=8)
+SCHEDULE_STATE_DIR = Path(os.getenv("SCHEDULE_STATE_DIR", "schedule_state"))
+
+_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+
+def parse_field(text: str, name: str, lo: int, hi: int) -> set:
+    """Values matched by one cron field."""
+    values = set()
+    for part in text.split(","):
+        rng, _, step = part.partition("/")
+        try:
+            step = int(step) if step else 1
+            if rng == "*":
+                start, end = lo, hi
+            elif "-" in rng:
+                start, end = (int(v) for v in rng.split("-", 1))
+            else:
+                start = int(rng)
+                end = hi if "/" in part else start
+        except ValueError:
+            raise ValueError(f"Bad cron {name} field: {text!r}")
+        if step < 1 or not (lo <= start <= end <= hi):
+            raise ValueError(f"Bad cron {name} field: {text!r}")
+        values.update(range(start, end + 1, step))
+    if name == "weekday" and 7 in values:
+        values.discard(7)
+        values.add(0)
+    return values
+
+
+class CronSchedule:
+    """Fire times of a cron expression in one timezone."""
+
+    def __init__(self, expr: str, tz=EST):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {expr!r}")
+        minutes, hours, self.days, self.months, self.weekdays = (
+            parse_field(text, name, lo, hi) for text, (name, lo, hi) in zip(fields, _FIELDS)
+        )
+        self.expr = expr
+        self.tz = tz
+        # (hour, minute) pairs within a matching day, in order
+        self.times = sorted((h, m) for h in hours for m in minutes)
+        # Like cron: with both day and weekday restricted, either may match
+        self._either_day = fields[2] != "*" and fields[4] != "*"
+
+    @classmethod
+    def every(cls, start_hour: int, end_hour: int, frequency: int, tz=EST):
+        """Every ``frequency`` minutes from start_hour:00 until before end_hour."""
+        schedule = cls("* * * * *", tz)
+        schedule.expr = f"every {frequency} min, {start_hour}:00-{end_hour}:00"
+        schedule.times = [divmod(t, 60) for t in
+                          range(start_hour * 60, min(end_hour, 24) * 60, max(1, frequency))]
+        return schedule
+
+    def __str__(self):
+        return self.expr
+
+    def _day_matches(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        return (in_days or in_weekdays) if self._either_day else (in_days and in_weekdays)
+
+    def _localize(self, naive: datetime):
+        try:
+            return self.tz.localize(naive, is_dst=None)
+        except pytz.NonExistentTimeError:
+            return None  # falls in the spring-forward gap
+        except pytz.AmbiguousTimeError:
+            return self.tz.localize(naive, is_dst=True)  # first of the two
+
+    def next_after(self, after: datetime) -> datetime:
+        """First fire time strictly after ``after`` (an aware datetime)."""
+        day = after.astimezone(self.tz).date()
+        if self.times:
+            # Five years covers any valid expression, Feb 29 included
+            for _ in range(366 * 5):
+                if self._day_matches(day):
+                    for hour, minute in self.times:
+                        fire = self._localize(datetime(day.year, day.month, day.day, hour, minute))
+                        if fire is not None and fire > after:
+                            return fire
+                day += timedelta(days=1)
+        raise ValueError(f"Schedule {self.expr!r} never fires")
+
+
+class Ticker:
+    """Turns a schedule into "run these now" + "wake up then", per policy."""
+
+    def __init__(self, schedule: CronSchedule, policy: str = MISSED_RUNS,
+                 state_file: Path = None, grace: int = MISFIRE_GRACE):
+        if policy not in MISSED_RUN_POLICIES:
+            raise ValueError(f"Unknown missed-run policy {policy!r}, expected one of {MISSED_RUN_POLICIES}")
+        self.schedule = schedule
+        self.policy = policy
+        self.state_file = state_file
+        self.grace = timedelta(seconds=grace)
+        self.last_fire = self._load()
+        self.missed = 0
+
+    def _load(self):
+        if self.state_file is None or not self.state_file.exists():
+            return None
+        try:
+            with open(self.state_file, "r") as f:
+                return datetime.fromisoformat(json.load(f)["last_fire"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self):
+        if self.state_file is None:
+            return
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"last_fire": self.last_fire.isoformat()}, f)
+        os.replace(tmp, self.state_file)
+
+    def plan(self, now: datetime):
+        """Fire times to run right now (oldest first) and the next fire time."""
+        if self.last_fire is None:
+            # First start: only a tick within the grace period is due
+            self.last_fire = now - self.grace
+        due = []
+        fire = self.schedule.next_after(max(self.last_fire, now - MAX_LOOKBACK))
+        while fire <= now:
+            due.append(fire)
+            fire = self.schedule.next_after(fire)
+
+        on_time = [f for f in due if now - f <= self.grace]
+        if self.policy == "skip":
+            runs = on_time[-1:]
+        elif self.policy == "coalesce":
+            runs = [f for f in due[-1:] if now - f < self._interval(f)]
+        else:
+            runs = due[-MAX_CATCHUP:]
+        self.missed = len(due) - len(runs)
+        if due and not runs:
+            # Everything was late and skipped; don't look at it again
+            self.done(due[-1])
+        return runs, fire
+
+    def _interval(self, fire: datetime) -> timedelta:
+        """Time since the tick before ``fire`` (a day at most)."""
+        for back in (timedelta(minutes=1), timedelta(hours=1), timedelta(days=1)):
+            prev = self.schedule.next_after(fire - back - timedelta(seconds=1))
+            if prev < fire:
+                while (following := self.schedule.next_after(prev)) < fire:
+                    prev = following
+                return fire - prev
+        return timedelta(days=1)
+
+    def done(self, fire: datetime):
+        """Record a fire time as handled (run, failed or skipped)."""
+        if self.last_fire is None or fire > self.last_fire:
+            self.last_fire = fire
+            self._save()
+
+
+def schedule_state_file(job_name: str) -> Path:
+    return SCHEDULE_STATE_DIR / f"{job_name}.json"
@@ -0,0 +1,67 @@
+# dedupe_index.py
+"""Local SQLite index of the last uploaded content per facility and report date.
+
+Before a downloaded report is converted and uploaded, its normalized content
+digest is compared with the last one uploaded for the same job, facility and
+report date. An unchanged report is skipped entirely (no XLSX written, no
+Drive call). A digest is only recorded after a successful upload, so a
+failed or spooled upload is retried next time.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+DEDUPE_DB = os.getenv("DEDUPE_DB", "dedupe_index.sqlite3")
+DEDUPE_ENABLED = os.getenv("DEDUPE", "1") == "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_digest (
+    job          TEXT NOT NULL,
+    facility     TEXT NOT NULL,
+    report_date  TEXT NOT NULL,
+    digest       TEXT NOT NULL,
+    drive_id     TEXT,
+    uploaded_at  TEXT NOT NULL,
+    PRIMARY KEY (job, facility, report_date)
+)
+"""
+
+
+class DedupeIndex:
+    """Thread-safe wrapper around one SQLite connection (shared by upload workers)."""
+
+    def __init__(self, path: str = DEDUPE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        # WAL lets the three service processes read while another writes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def last_digest(self, job: str, facility: str, report_date: str) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM report_digest WHERE job=? AND facility=? AND report_date=?",
+                (job, facility, report_date),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_unchanged(self, job: str, facility: str, report_date: str, digest: str) -> bool:
+        return self.last_digest(job, facility, report_date) == digest
+
+    def record(self, job: str, facility: str, report_date: str, digest: str,
+               drive_id: str = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO report_digest VALUES (?, ?, ?, ?, ?, ?)",
+                (job, facility, report_date, digest, drive_id,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
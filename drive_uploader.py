@@ -0,0 +1,533 @@
+# drive_uploader.py
+"""Google Drive upload stage shared by the services.
+
+* The Drive client is built once per process (credentials file read once,
+  discovery client built once). googleapiclient's transport is not thread
+  safe, so each worker thread gets its own authorized HTTP object.
+* UploadStage takes downloaded .xls files through a bounded queue and
+  converts + uploads them on a small worker pool, so the browser can move
+  on to the next facility while the previous file is still being processed.
+* Files above RESUMABLE_THRESHOLD_MB go up as resumable chunked uploads.
+  Transient failures (5xx, 429, connection errors) are retried with jittered
+  exponential backoff; a file that still fails is moved to a local retry
+  spool instead of being deleted, and the spool is drained by the next stage.
+* OUTPUT_MODE picks what is uploaded: "xlsx" (default), "csv" (xlrd rows
+  streamed straight to CSV) or "gsheet" (the original .xls uploaded with
+  Drive's native conversion to a Google Sheet, no local conversion at all).
+* Reports whose content digest matches the last upload for the same job,
+  facility and report date are skipped before conversion (dedupe_index),
+  as are reports whose copy with that digest is still waiting in the
+  spool. A spooled report's digest is recorded once its last file drains.
+* Digests and conversions run on the process pool in conversion_pool.py
+  (sheets in parallel) unless CONVERT_POOL=0. On the pool and on the
+  thread fallback alike, CONVERT_RSS_LIMIT_MB switches .xlsx output to the
+  memory-bounded converter (one sheet at a time, spilling to disk past the
+  ceiling).
+* Every report that is converted is also written to the local Parquet
+  archive (archive.py) when pyarrow is installed; archive failures are
+  logged and never fail the upload.
+* Before xlsx / csv output, sheets are normalized and checked against the
+  job's report spec (normalize.py). A report missing a required column is
+  moved to ``<spool dir>/invalid`` and reported as "invalid".
+
+Set DRIVE_API_ENDPOINT (e.g. ``http://127.0.0.1:8765/``) to send every Drive
+request to a local fake server instead of googleapis.com; without a
+service account file the requests then go out unauthenticated.
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import threading
+import traceback
+import contextvars
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+import google_auth_httplib2
+from google.auth.credentials import AnonymousCredentials
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+
+import archive
+import conversion_pool
+import normalize
+from conversion_pool import CONVERT_POOL
+from dedupe_index import DedupeIndex, DEDUPE_ENABLED
+from timing import count, note, span
+from xls_converter import (CONVERT_RSS_LIMIT_MB, convert_xls_to_xlsx, convert_xls_to_xlsx_bounded,
+                           convert_xls_to_csv, content_digest)
+
+SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE", "SERVICE-JSON.json")
+SCOPES = ["https://www.googleapis.com/auth/drive", "https://www.googleapis.com/auth/spreadsheets"]
+DRIVE_API_ENDPOINT = os.getenv("DRIVE_API_ENDPOINT")
+GOOGLE_ROOT_URL = "https://www.googleapis.com/"
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLS_MIMETYPE = "application/vnd.ms-excel"
+CSV_MIMETYPE = "text/csv"
+GSHEET_MIMETYPE = "application/vnd.google-apps.spreadsheet"
+
+OUTPUT_MODES = ("xlsx", "csv", "gsheet")
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "xlsx")
+
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "4"))
+
+RESUMABLE_THRESHOLD = int(float(os.getenv("RESUMABLE_THRESHOLD_MB", "5")) * 1024 * 1024)
+# Drive requires chunk sizes in multiples of 256 KiB
+CHUNK_SIZE = max(1, int(float(os.getenv("UPLOAD_CHUNK_MB", "8")) * 4)) * 256 * 1024
+MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = float(os.getenv("UPLOAD_RETRY_BASE", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("UPLOAD_RETRY_MAX", "60"))
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+SPOOL_DIR = Path(os.getenv("UPLOAD_SPOOL_DIR", "upload_spool"))
+
+_service = None
+_sheets_service = None
+_credentials = None
+_service_lock = threading.Lock()
+_thread_state = threading.local()
+
+
+def _load_credentials():
+    if DRIVE_API_ENDPOINT and not Path(SERVICE_ACCOUNT_FILE).exists():
+        return AnonymousCredentials()
+    return service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=SCOPES
+    )
+
+
+def get_drive_service():
+    """Process-wide Drive v3 client, built on first use."""
+    global _service, _credentials
+    with _service_lock:
+        if _service is None:
+            _credentials = _load_credentials()
+            _service = build("drive", "v3", credentials=_credentials, cache_discovery=False)
+        return _service
+
+
+def get_sheets_service():
+    """Process-wide Sheets v4 client sharing the Drive credentials."""
+    global _sheets_service
+    get_drive_service()
+    with _service_lock:
+        if _sheets_service is None:
+            _sheets_service = build("sheets", "v4", credentials=_credentials, cache_discovery=False)
+        return _sheets_service
+
+
+def _thread_http():
+    http = getattr(_thread_state, "http", None)
+    if http is None:
+        get_drive_service()
+        http = google_auth_httplib2.AuthorizedHttp(_credentials, http=httplib2.Http())
+        _thread_state.http = http
+    return http
+
+
+def execute(request):
+    """Execute a Drive API request on this thread's own transport."""
+    if DRIVE_API_ENDPOINT:
+        request.uri = request.uri.replace(GOOGLE_ROOT_URL, DRIVE_API_ENDPOINT)
+    return request.execute(http=_thread_http())
+
+
+def is_transient(exc: Exception) -> bool:
+    """Errors worth retrying: throttling, server errors, flaky connections."""
+    if isinstance(exc, HttpError):
+        return exc.resp.status in RETRYABLE_STATUS
+    return isinstance(exc, (ConnectionError, TimeoutError, socket.timeout,
+                            httplib2.HttpLib2Error))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def with_retries(call, what: str, tag: str):
+    """``call()``, retried with backoff while it fails with a transient error."""
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if not is_transient(e) or attempt >= MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            count("retries")
+            print(f"{tag} ⚠ {what} failed ({e}); retry {attempt}/{MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def upload_file(file_path: Path, folder_id: str, tag: str = "[Drive]",
+                mimetype: str = XLSX_MIMETYPE, name: str = None,
+                target_mimetype: str = None) -> str:
+    """Blocking upload of one file with retries; returns the Drive file ID.
+
+    ``target_mimetype`` asks Drive to convert on import (e.g. to a Sheet).
+    """
+    drive_service = get_drive_service()
+    file_metadata = {"name": name or file_path.name, "parents": [folder_id]}
+    if target_mimetype:
+        file_metadata["mimeType"] = target_mimetype
+    size = file_path.stat().st_size
+    count("upload_bytes", size)
+
+    if size <= RESUMABLE_THRESHOLD:
+        def create():
+            media = MediaFileUpload(str(file_path), mimetype=mimetype)
+            return execute(drive_service.files().create(
+                body=file_metadata, media_body=media, fields="id"
+            ))
+        uploaded_file = with_retries(create, f"Upload of {file_path.name}", tag)
+    else:
+        media = MediaFileUpload(str(file_path), mimetype=mimetype,
+                                chunksize=CHUNK_SIZE, resumable=True)
+        request = drive_service.files().create(
+            body=file_metadata, media_body=media, fields="id"
+        )
+        if DRIVE_API_ENDPOINT:
+            request.uri = request.uri.replace(GOOGLE_ROOT_URL, DRIVE_API_ENDPOINT)
+        print(f"{tag} Resumable upload of {file_path} ({size / 1e6:.1f} MB)")
+        uploaded_file = None
+        while uploaded_file is None:
+            # A retried chunk resumes from the last byte the server acknowledged
+            status, uploaded_file = with_retries(
+                lambda: request.next_chunk(http=_thread_http()),
+                f"Chunk of {file_path.name}", tag,
+            )
+            if status:
+                print(f"{tag} ... {file_path.name}: {int(status.progress() * 100)}%")
+
+    print(f"{tag} ✅ Uploaded {file_path} (ID: {uploaded_file['id']})")
+    return uploaded_file["id"]
+
+
+def spool_file(file_path: Path, folder_id: str, spool_dir: Path, error: str,
+               mimetype: str = XLSX_MIMETYPE, target_mimetype: str = None,
+               name: str = None, report: dict = None) -> Path:
+    """Park a file that could not be uploaded, with what is needed to retry it.
+
+    ``report`` (job, facility, report_date, digest) lets drain_spool record
+    the digest in the dedupe index once the file is up.
+    """
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    target = spool_dir / file_path.name
+    shutil.move(str(file_path), target)
+    meta_path = target.with_name(target.name + ".json")
+    meta = {"folder_id": folder_id, "mimetype": mimetype,
+            "target_mimetype": target_mimetype, "name": name, "attempts": 0}
+    if report is not None:
+        meta["report"] = report
+    if meta_path.exists():
+        meta.update(json.loads(meta_path.read_text()))
+    meta["attempts"] += 1
+    meta["last_error"] = error
+    meta["spooled_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    meta_path.write_text(json.dumps(meta, indent=2))
+    return target
+
+
+def _spooled_meta(spool_dir: Path) -> list:
+    """(meta path, meta) of every spooled file still waiting."""
+    if not spool_dir.exists():
+        return []
+    spooled = []
+    for meta_path in sorted(spool_dir.glob("*.json")):
+        try:
+            spooled.append((meta_path, json.loads(meta_path.read_text())))
+        except (OSError, ValueError):
+            continue
+    return spooled
+
+
+def in_spool(spool_dir: Path, facility: str, report_date: str, digest: str) -> bool:
+    """Is this exact report (same digest) already waiting in the spool?"""
+    report = {"facility": facility, "report_date": report_date, "digest": digest}
+    return any(
+        {k: (meta.get("report") or {}).get(k) for k in report} == report
+        for _, meta in _spooled_meta(spool_dir)
+    )
+
+
+def drain_spool(spool_dir: Path, tag: str = "[Drive]", dedupe: DedupeIndex = None) -> int:
+    """Retry every spooled file; returns how many made it to Drive.
+
+    Once the last spooled file of a report is up, its digest goes into
+    ``dedupe`` so the same content is not uploaded again.
+    """
+    uploaded = 0
+    for meta_path, meta in _spooled_meta(spool_dir):
+        file_path = meta_path.with_name(meta_path.name[:-len(".json")])
+        if not file_path.exists():
+            meta_path.unlink()
+            continue
+        try:
+            drive_id = upload_file(file_path, meta["folder_id"], tag=tag, mimetype=meta["mimetype"],
+                                   name=meta.get("name"), target_mimetype=meta.get("target_mimetype"))
+        except Exception as e:
+            print(f"{tag} ❌ Spooled {file_path.name} still failing: {e}")
+            spool_file(file_path, meta["folder_id"], spool_dir, str(e), meta["mimetype"],
+                       meta.get("target_mimetype"), meta.get("name"), meta.get("report"))
+            continue
+        file_path.unlink()
+        meta_path.unlink()
+        uploaded += 1
+        report = meta.get("report")
+        if dedupe is not None and report and not any(
+                m.get("report") == report for _, m in _spooled_meta(spool_dir)):
+            dedupe.record(report["job"], report["facility"], report["report_date"],
+                          report["digest"], drive_id)
+    if uploaded:
+        print(f"{tag} ✅ Re-uploaded {uploaded} spooled file(s)")
+    return uploaded
+
+
+def _resolve(future: asyncio.Future, status: str):
+    if not future.done():
+        future.set_result(status)
+
+
+class UploadStage:
+    """Bounded convert + upload pipeline running beside the browser.
+
+    ``await stage.submit(xls_path, facility, report_date)`` only waits for
+    queue space and returns a future that resolves to the file's final status
+    ("ok", "unchanged", "convert failed", "invalid", "spooled").
+
+    With a ``turn`` (extraction.OrderedResults.turn) a file is digested and
+    converted straight away but only uploaded once its turn comes, so
+    uploads keep facility order. The wait happens off the worker, so a
+    file that is late to the queue never waits behind a later one.
+    """
+
+    def __init__(self, folder_id: str, tag: str = "[Drive]", job: str = None,
+                 workers: int = UPLOAD_WORKERS, queue_size: int = UPLOAD_QUEUE_SIZE,
+                 spool_dir: Path = None, output_mode: str = OUTPUT_MODE):
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {output_mode!r}, expected one of {OUTPUT_MODES}")
+        self.folder_id = folder_id
+        self.tag = tag
+        self.output_mode = output_mode
+        self.job = job or tag.strip("[]").lower()
+        self.workers = max(1, workers)
+        self.spool_dir = spool_dir or SPOOL_DIR / self.job
+        self.dedupe = DedupeIndex() if DEDUPE_ENABLED else None
+        self.spec = normalize.report_spec(self.job)
+        # Converters only normalize when handed a spec
+        self.normalize_spec = self.spec if normalize.available() else None
+        if normalize.NORMALIZE_ENABLED and self.normalize_spec is None:
+            print(f"{tag} ⚠ numpy not installed, reports will not be normalized")
+        self.archive = archive.available()
+        if archive.ARCHIVE_ENABLED and not self.archive:
+            print(f"{tag} ⚠ pyarrow not installed, reports will not be archived")
+        self._queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        self._tasks = []
+        self._waiting = set()
+        self._drain_task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Files left over from earlier failures go up alongside this run
+        self._drain_task = self._run(drain_spool, self.spool_dir, self.tag, self.dedupe)
+
+    async def submit(self, xls_path: Path, facility: str = None,
+                     report_date: str = None, turn: asyncio.Future = None) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((xls_path, facility, report_date, turn, future))
+        return future
+
+    async def close(self):
+        """Wait for queued files to finish, then stop the workers."""
+        await self._queue.join()
+        await asyncio.gather(*self._waiting, return_exceptions=True)
+        if self._drain_task is not None:
+            await asyncio.gather(self._drain_task, return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pool.shutdown(wait=True)
+        if self.dedupe is not None:
+            self.dedupe.close()
+
+    async def _worker(self):
+        while True:
+            xls_path, facility, report_date, turn, future = await self._queue.get()
+            try:
+                prepared = await self._prepare(xls_path, facility, report_date)
+                if isinstance(prepared, str):
+                    _resolve(future, prepared)
+                elif turn is None:
+                    _resolve(future, await self._upload(facility, report_date, *prepared))
+                else:
+                    task = asyncio.create_task(
+                        self._upload_in_turn(turn, future, xls_path, facility, report_date, prepared))
+                    self._waiting.add(task)
+                    task.add_done_callback(self._waiting.discard)
+            except Exception as e:
+                self._failed(future, xls_path, e)
+            finally:
+                self._queue.task_done()
+
+    async def _upload_in_turn(self, turn, future, xls_path: Path, facility: str,
+                              report_date: str, prepared: tuple):
+        try:
+            await turn
+            _resolve(future, await self._upload(facility, report_date, *prepared))
+        except Exception as e:
+            self._failed(future, xls_path, e)
+
+    def _failed(self, future, xls_path: Path, e: Exception):
+        print(f"{self.tag} ❌ Upload stage error for {xls_path}: {e}")
+        traceback.print_exc()
+        _resolve(future, "error")
+
+    def _run(self, func, *args):
+        """Run ``func`` on the pool, keeping the current timing context."""
+        return asyncio.get_running_loop().run_in_executor(
+            self._pool, contextvars.copy_context().run, func, *args
+        )
+
+    async def _prepare(self, local_xls: Path, facility: str, report_date: str):
+        """Dedupe, archive and convert; a final status, or (outputs, digest) to upload."""
+        digest = None
+        if self.dedupe is not None and facility and report_date:
+            with span("digest", facility):
+                if CONVERT_POOL:
+                    digest = await conversion_pool.digest(local_xls)
+                else:
+                    digest = await self._run(content_digest, local_xls)
+            if self.dedupe.is_unchanged(self.job, facility, report_date, digest):
+                print(f"{self.tag} ⏭ {facility} {report_date} unchanged since last upload, skipping")
+                local_xls.unlink()
+                return "unchanged"
+            if in_spool(self.spool_dir, facility, report_date, digest):
+                print(f"{self.tag} ⏭ {facility} {report_date} already waiting in the retry spool, skipping")
+                local_xls.unlink()
+                return "spooled"
+
+        # Archived alongside the conversion; both only read the .xls
+        archiving = None
+        if self.archive:
+            archiving = asyncio.ensure_future(self._archive(local_xls, facility, report_date))
+
+        try:
+            with span("convert", facility):
+                if CONVERT_POOL:
+                    outputs = await self._prepare_outputs_pooled(local_xls)
+                else:
+                    outputs = await self._run(self._prepare_outputs, local_xls)
+        except normalize.ReportValidationError as e:
+            if archiving is not None:
+                await archiving
+            invalid_dir = self.spool_dir / "invalid"
+            invalid_dir.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(local_xls), invalid_dir / local_xls.name)
+            print(f"{self.tag} ❌ {facility or local_xls.name}: {e}; kept in {invalid_dir}")
+            return "invalid"
+        if archiving is not None:
+            await archiving
+        if not outputs:
+            return "convert failed"
+
+        # Ensure the original XLS file is deleted before uploading (unless it is the upload)
+        if local_xls.exists() and all(path != local_xls for path, _, _, _ in outputs):
+            local_xls.unlink()
+            print(f"{self.tag} 🗑 Deleted original XLS: {local_xls}")
+
+        if facility:
+            note(facility, output_bytes=sum(path.stat().st_size for path, _, _, _ in outputs))
+        return outputs, digest
+
+    async def _upload(self, facility: str, report_date: str, outputs: list, digest: str) -> str:
+        status = "ok"
+        drive_ids = []
+        report = None
+        if digest is not None:
+            report = {"job": self.job, "facility": facility, "report_date": report_date, "digest": digest}
+        for path, mimetype, target_mimetype, name in outputs:
+            try:
+                with span("upload", facility):
+                    drive_ids.append(await self._run(
+                        upload_file, path, self.folder_id, self.tag,
+                        mimetype, name, target_mimetype,
+                    ))
+            except Exception as e:
+                print(f"{self.tag} ❌ Error uploading {path}: {e}")
+                traceback.print_exc()
+                spooled = spool_file(path, self.folder_id, self.spool_dir, str(e),
+                                     mimetype, target_mimetype, name, report)
+                print(f"{self.tag} 📥 Kept for retry: {spooled}")
+                status = "spooled"
+                continue
+            path.unlink()
+            print(f"{self.tag} 🗑 Deleted uploaded file: {path}")
+
+        if status == "ok" and digest is not None:
+            self.dedupe.record(self.job, facility, report_date, digest, drive_ids[0])
+        return status
+
+    async def _archive(self, local_xls: Path, facility: str, report_date: str):
+        """Add the report to the Parquet archive; failures are only logged."""
+        try:
+            with span("archive", facility):
+                if CONVERT_POOL:
+                    await conversion_pool.run(archive.archive_report, local_xls, self.job, facility,
+                                              report_date, self.spec, mb=conversion_pool.estimate_mb(local_xls))
+                else:
+                    await self._run(archive.archive_report, local_xls, self.job, facility, report_date,
+                                    self.spec)
+        except normalize.ReportValidationError:
+            # Reported by the conversion, which fails the same way
+            pass
+        except Exception as e:
+            print(f"{self.tag} ⚠ Could not archive {local_xls.name}: {e}")
+            traceback.print_exc()
+
+    def _prepare_outputs(self, local_xls: Path) -> list:
+        """Blocking: the (path, mimetype, target_mimetype, name) files to upload."""
+        if self.output_mode == "gsheet":
+            # Drive converts the .xls itself; nothing to do locally
+            return [(local_xls, XLS_MIMETYPE, GSHEET_MIMETYPE, local_xls.stem)]
+        if self.output_mode == "csv":
+            csv_paths = convert_xls_to_csv(local_xls, self.tag, self.normalize_spec)
+            return [(p, CSV_MIMETYPE, None, None) for p in csv_paths or []]
+        if CONVERT_RSS_LIMIT_MB:
+            xlsx_path = convert_xls_to_xlsx_bounded(local_xls, self.tag, spec=self.normalize_spec)
+        else:
+            xlsx_path = convert_xls_to_xlsx(local_xls, self.tag, self.normalize_spec)
+        if not (xlsx_path and xlsx_path.exists()):
+            return []
+        return [(xlsx_path, XLSX_MIMETYPE, None, None)]
+
+    async def _prepare_outputs_pooled(self, local_xls: Path) -> list:
+        """Like _prepare_outputs, converting on the process pool."""
+        if self.output_mode == "gsheet":
+            return [(local_xls, XLS_MIMETYPE, GSHEET_MIMETYPE, local_xls.stem)]
+        if self.output_mode == "csv":
+            csv_paths = await conversion_pool.convert_to_csv(local_xls, self.tag, self.normalize_spec)
+            return [(p, CSV_MIMETYPE, None, None) for p in csv_paths or []]
+        xlsx_path = await conversion_pool.convert_to_xlsx(local_xls, self.tag, self.normalize_spec)
+        if not (xlsx_path and xlsx_path.exists()):
+            return []
+        return [(xlsx_path, XLSX_MIMETYPE, None, None)]
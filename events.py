@@ -0,0 +1,200 @@
+# events.py
+"""Live job events, from the workers to the control panel's /events stream.
+
+Workers call ``emit(kind, job, **fields)`` as things happen:
+
+* ``state``     job state transitions (started, idle with its next run,
+                paused, resumed, stopped, crashed);
+* ``iteration`` an iteration starting (``phase="start"``) or ending, with
+                its status and duration;
+* ``facility``  a facility result, "pending" while its file is still being
+                converted / uploaded, then final, with its index and total;
+* ``stage``     one timed stage span (timing.py) as it closes.
+
+control_panel.py starts each worker with its stdout piped and EVENTS_PIPE=1;
+events then go to stdout as single lines, ``EVENT_PREFIX`` + JSON, which
+the panel's reader thread tells apart from ordinary output (``parse``). In
+the in-process scheduler mode the panel installs its EventBus as the sink
+(``set_sink``) and events are published directly. With neither, e.g. a
+worker run by hand, ``emit`` does nothing.
+
+The panel side is ``EventBus``: it numbers events, keeps the last few
+hundred for clients reconnecting with Last-Event-ID, and fans them out to
+one queue per connected /events client.
+
+Log output uses the same channel: ``capture_output`` swaps stdout/stderr
+for LogStreams that send every printed line as a ``log`` event (level
+from stream and emoji, ``[Tag]`` split off), which the panel keeps in its
+log store (log_store.py) instead of on the bus.
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import queue
+import threading
+import traceback
+from collections import deque
+
+EVENTS_PIPE = os.getenv("EVENTS_PIPE") == "1"
+# ASCII record separator: never starts an ordinary output line
+EVENT_PREFIX = "\x1eevent "
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", "500"))
+SUBSCRIBER_QUEUE = 1000
+
+_sink = None
+_write_lock = threading.Lock()
+# The real stdout once capture_output() has replaced sys.stdout
+_out = None
+# Per thread: partial lines, and whether a sink call is in progress
+_local = threading.local()
+_TAGS = re.compile(r"^((?:\[[^\]]*\])+)\s*")
+
+
+def set_sink(sink):
+    """Deliver events to ``sink(event)`` in this process instead of stdout."""
+    global _sink
+    _sink = sink
+
+
+def emit(kind: str, job: str = None, **fields):
+    """Send one event; never raises (events are best effort)."""
+    event = {"kind": kind, "job": job, "ts": round(time.time(), 3), **fields}
+    sink = _sink
+    if sink is not None:
+        if getattr(_local, "busy", False):
+            return
+        _local.busy = True
+        try:
+            sink(event)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            _local.busy = False
+        return
+    if not EVENTS_PIPE:
+        return
+    write_raw(EVENT_PREFIX + json.dumps(event, default=str) + "\n")
+
+
+def write_raw(text: str):
+    """Write to the real stdout, past any capture_output() wrapper."""
+    out = _out or sys.stdout
+    with _write_lock:
+        try:
+            out.write(text)
+            out.flush()
+        except (OSError, ValueError):
+            pass
+
+
+def log_fields(line: str, stream: str = "stdout") -> dict:
+    """Level, tag and message of one output line."""
+    match = _TAGS.match(line)
+    if "❌" in line or stream == "stderr":
+        level = "error"
+    elif "⚠" in line:
+        level = "warning"
+    else:
+        level = "info"
+    return {
+        "level": level,
+        "tag": match.group(1) if match else None,
+        "msg": line[match.end():] if match else line,
+        "stream": stream,
+        "pid": os.getpid(),
+    }
+
+
+class LogStream(io.TextIOBase):
+    """Stands in for stdout/stderr: every complete line becomes a log event."""
+
+    def __init__(self, stream: str, job: str = None):
+        self.stream = stream
+        self.job = job
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if getattr(_local, "busy", False):
+            # Printed by the sink itself (e.g. its traceback): don't loop back
+            write_raw(text)
+            return len(text)
+        lines = (getattr(_local, self.stream, "") + text).split("\n")
+        setattr(_local, self.stream, lines.pop())
+        for line in lines:
+            line = line.rstrip("\r")
+            if line.strip():
+                emit("log", self.job, **log_fields(line, self.stream))
+        return len(text)
+
+
+def capture_output(job: str = None):
+    """Send everything printed in this process as log events from now on."""
+    global _out
+    if _out is not None:
+        return
+    _out = sys.stdout
+    sys.stdout = LogStream("stdout", job)
+    sys.stderr = LogStream("stderr", job)
+
+
+def parse(line: str) -> dict:
+    """The event on one worker output line, or None for ordinary output."""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+
+
+class EventBus:
+    """Fans events out to subscriber queues; thread-safe."""
+
+    def __init__(self, history: int = EVENT_HISTORY):
+        self._seq = 0
+        self._recent = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict):
+        event.setdefault("ts", round(time.time(), 3))
+        with self._lock:
+            self._seq += 1
+            event["seq"] = self._seq
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Slow client: drop its oldest event, it can resync from /status
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def subscribe(self, last_seq: int = None) -> queue.Queue:
+        """A queue of new events, preloaded with the ones after ``last_seq``."""
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        with self._lock:
+            if last_seq is not None:
+                for event in self._recent:
+                    if event["seq"] > last_seq:
+                        q.put_nowait(event)
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(q)
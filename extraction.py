@@ -0,0 +1,162 @@
+# extraction.py
+"""Concurrent per-facility report extraction.
+
+Up to ``concurrency`` pages are opened on one authenticated BrowserSession.
+Each page navigates to the report once and then pulls facilities from a
+shared queue, so the iteration takes roughly facilities / concurrency
+report renders instead of one after another. Every facility's outcome is
+collected, in FACILITIES order, into a single iteration report.
+
+Facilities finish out of order once their downloads are converted and
+uploaded in the background (and, with prefetch, even saved in the
+background). OrderedResults puts them back in order: outcomes are logged
+in FACILITIES order as they become final, and ``turn(idx)`` lets the
+upload stage hold a file back until every facility before it is done.
+Each result is also sent as a live "facility" event the moment it is set.
+"""
+
+import time
+import asyncio
+import inspect
+import traceback
+
+from events import emit
+
+
+class OrderedResults:
+    """Facility results that are released (logged) in FACILITIES order."""
+
+    def __init__(self, facilities: list, tag: str = "[Extract]", job: str = None):
+        self.tag = tag
+        self.job = job
+        self.results = [None] * len(facilities)
+        self._final = [False] * len(facilities)
+        # Facilities before this index are all final
+        self._released = 0
+        self._turns = {}
+
+    def turn(self, idx: int) -> asyncio.Future:
+        """Resolves once every facility before ``idx`` has a final result."""
+        fut = asyncio.get_running_loop().create_future()
+        if idx <= self._released:
+            fut.set_result(None)
+        else:
+            self._turns.setdefault(idx, []).append(fut)
+        return fut
+
+    def set(self, idx: int, result: dict):
+        """Record a result that is still in flight (status "pending")."""
+        self.results[idx] = result
+        self._emit(idx)
+
+    def settle(self, idx: int, result: dict = None):
+        """Mark ``idx`` final, then log every result now in order."""
+        if result is not None:
+            self.results[idx] = result
+        self._final[idx] = True
+        self._emit(idx)
+        while self._released < len(self.results) and self._final[self._released]:
+            res = self.results[self._released]
+            print(f"{self.tag} 📋 {res['facility']}: {res['status']}")
+            self._released += 1
+            for fut in self._turns.pop(self._released, []):
+                if not fut.done():
+                    fut.set_result(None)
+
+    def _emit(self, idx: int):
+        # Live progress goes out as results happen, not in release order
+        res = self.results[idx]
+        emit("facility", self.job, facility=res["facility"], status=res["status"],
+             seconds=round(res.get("seconds") or 0.0, 3), error=res.get("error"),
+             index=idx, total=len(self.results), done=sum(self._final))
+
+
+async def extract_facilities(session, facilities, open_report, process_facility,
+                             concurrency: int = 1, tag: str = "[Extract]",
+                             collector: OrderedResults = None, stop: asyncio.Event = None) -> list:
+    """Run ``process_facility(page, fac)`` for every facility, N pages at a time.
+
+    ``open_report(page)`` brings a fresh page to the point where facility
+    selection starts. ``process_facility`` may return a short status string
+    (defaults to "ok") or an awaitable resolving to one, e.g. the future of a
+    file handed to the UploadStage; the page moves on immediately and those
+    are awaited once every page is done. Exceptions are recorded as "error"
+    for that facility only. Results go into ``collector`` (a fresh
+    OrderedResults by default), which logs them in facility order. Once
+    ``stop`` is set no page starts another facility; the rest are "not run".
+    """
+    queue = asyncio.Queue()
+    for idx, fac in enumerate(facilities):
+        queue.put_nowait((idx, fac))
+    collector = collector or OrderedResults(facilities, tag)
+    results = collector.results
+    pending = []
+
+    def settle_later(idx: int, future: asyncio.Future):
+        res = results[idx]
+        try:
+            res["status"] = future.result() or "ok"
+        except BaseException as ex_post:
+            res["status"] = "error"
+            res["error"] = str(ex_post)
+        collector.settle(idx)
+
+    async def worker(worker_id: int):
+        wtag = f"{tag}[p{worker_id}]"
+        page = await session.new_page()
+        try:
+            await open_report(page)
+            while stop is None or not stop.is_set():
+                try:
+                    idx, fac = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                print(f"{wtag} Processing facility: {fac['name']}")
+                started = time.time()
+                try:
+                    status = await process_facility(page, fac) or "ok"
+                    if inspect.isawaitable(status):
+                        future = asyncio.ensure_future(status)
+                        collector.set(idx, {"facility": fac["name"], "status": "pending",
+                                            "seconds": time.time() - started})
+                        future.add_done_callback(lambda f, idx=idx: settle_later(idx, f))
+                        pending.append(future)
+                    else:
+                        collector.settle(idx, {"facility": fac["name"], "status": status,
+                                               "seconds": time.time() - started})
+                except Exception as ex_fac:
+                    print(f"{wtag} Error processing {fac['name']}: {ex_fac}")
+                    traceback.print_exc()
+                    collector.settle(idx, {"facility": fac["name"], "status": "error",
+                                           "error": str(ex_fac), "seconds": time.time() - started})
+        finally:
+            await page.close()
+
+    n_workers = max(1, min(concurrency, len(facilities)))
+    outcomes = await asyncio.gather(*(worker(i) for i in range(n_workers)),
+                                    return_exceptions=True)
+    for i, outcome in enumerate(outcomes):
+        if isinstance(outcome, Exception):
+            print(f"{tag} Page {i} failed before finishing: {outcome}")
+
+    # Facilities left in the queue because every page failed or a stop was
+    # requested; settled first so files waiting for their turn behind them
+    # can go ahead
+    for idx, fac in enumerate(facilities):
+        if results[idx] is None:
+            collector.settle(idx, {"facility": fac["name"], "status": "not run", "seconds": 0.0})
+
+    # Files still being saved / converted / uploaded in the background
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    print_iteration_report(results, tag)
+    return results
+
+
+def print_iteration_report(results: list, tag: str):
+    print(f"{tag} Iteration report:")
+    for res in results:
+        line = f"{tag}   {res['facility']:<16} {res['status']:<10} {res['seconds']:6.1f}s"
+        if res.get("error"):
+            line += f"  ({res['error']})"
+        print(line)
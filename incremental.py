@@ -0,0 +1,225 @@
+# incremental.py
+"""Incremental append mode: push only rows not seen yet for the report date.
+
+The freshly downloaded manifest is diffed against the row keys already
+delivered for that date (kept in a local SQLite table), and only the new
+rows are appended to one rolling per-day destination:
+
+* ``sheet``   - a per-day Google Sheet in the job's Drive folder (values.append)
+* ``parquet`` - a per-day directory of Parquet part files, one per increment
+* ``csv``     - a per-day local CSV file
+
+Rows are remembered per facility, so two facilities of one job with an
+identical row both get it delivered. The row key is made of the ROW_KEY
+columns (comma-separated header names); when unset, the whole normalized
+row is the key. Rows are read through normalize.read_report with the
+job's report spec, cleaned like the uploaded files (dates decoded, blank
+and repeated header rows dropped, overflow sheets included); the Sheet
+and CSV targets get dates as "YYYY-MM-DD[ HH:MM:SS]" text, the Parquet
+target the archive's per-job schema (archive.build_table).
+"""
+
+import os
+import csv
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from archive import build_table, column_names
+from drive_uploader import GSHEET_MIMETYPE, execute, get_drive_service, get_sheets_service, with_retries
+from normalize import read_report, report_spec
+from report_jobs import JOBS
+from timing import count
+
+INCREMENTAL_DB = os.getenv("INCREMENTAL_DB", "incremental.sqlite3")
+INCREMENTAL_TARGET = os.getenv("INCREMENTAL_TARGET", "sheet")
+INCREMENTAL_TARGETS = ("sheet", "parquet", "csv")
+ROW_KEY = [c.strip() for c in os.getenv("ROW_KEY", "").split(",") if c.strip()]
+ROLLING_DIR = Path(os.getenv("ROLLING_DIR", "rolling"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_rows (
+    job          TEXT NOT NULL,
+    report_date  TEXT NOT NULL,
+    facility     TEXT NOT NULL,
+    row_key      TEXT NOT NULL,
+    PRIMARY KEY (job, report_date, facility, row_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rolling_target (
+    job          TEXT NOT NULL,
+    report_date  TEXT NOT NULL,
+    target       TEXT NOT NULL,
+    target_id    TEXT NOT NULL,
+    PRIMARY KEY (job, report_date, target)
+);
+"""
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Add the facility column to a seen_rows table from before it had one."""
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(seen_rows)")]
+    if not columns or "facility" in columns:
+        return
+    conn.execute("ALTER TABLE seen_rows RENAME TO seen_rows_old")
+    conn.executescript(_SCHEMA)
+    # Rows of a single-facility job can only have come from that facility
+    for (job,) in conn.execute("SELECT DISTINCT job FROM seen_rows_old").fetchall():
+        facilities = JOBS.get(job, {}).get("facilities", [])
+        facility = facilities[0]["name"] if len(facilities) == 1 else ""
+        conn.execute("INSERT OR IGNORE INTO seen_rows SELECT job, report_date, ?, row_key "
+                     "FROM seen_rows_old WHERE job=?", (facility, job))
+    conn.execute("DROP TABLE seen_rows_old")
+
+
+def cell_text(value):
+    """A normalized cell as written to the rolling Sheet / CSV."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return f"{value:%Y-%m-%d}" if value == datetime(value.year, value.month, value.day) \
+            else f"{value:%Y-%m-%d %H:%M:%S}"
+    return value
+
+
+def make_row_key(row: list, key_idx: list) -> str:
+    values = [row[i] if i < len(row) else "" for i in key_idx] if key_idx else row
+    return hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+
+class IncrementalSink:
+    """Appends only unseen manifest rows to a rolling per-day destination."""
+
+    def __init__(self, job: str, folder_id: str, tag: str = "[Incremental]",
+                 target: str = INCREMENTAL_TARGET, key_columns: list = None,
+                 header_row: int = None, db_path: str = INCREMENTAL_DB):
+        if target not in INCREMENTAL_TARGETS:
+            raise ValueError(f"Unknown incremental target {target!r}, expected one of {INCREMENTAL_TARGETS}")
+        self.job = job
+        self.folder_id = folder_id
+        self.tag = tag
+        self.target = target
+        self.key_columns = ROW_KEY if key_columns is None else key_columns
+        self.spec = report_spec(job)
+        if header_row is not None:
+            self.spec["header_row"] = header_row
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        _migrate(self._conn)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def append(self, xls_path: Path, report_date: str, facility: str) -> str:
+        """Blocking: diff, append new rows, remember them. Returns a status."""
+        header, rows = read_report(xls_path, self.spec, self.tag)
+        if not header:
+            raise ValueError(f"{Path(xls_path).name} has no header row {self.spec['header_row']}")
+        missing = [c for c in self.key_columns if c not in header]
+        if missing:
+            raise ValueError(f"Row key column(s) {missing} not in header {header}")
+        key_idx = [header.index(c) for c in self.key_columns]
+
+        with self._lock:
+            seen = {k for (k,) in self._conn.execute(
+                "SELECT row_key FROM seen_rows WHERE job=? AND report_date=? AND facility=?",
+                (self.job, report_date, facility),
+            )}
+        new_rows, new_keys = [], []
+        for row in rows:
+            key = make_row_key(row, key_idx)
+            if key not in seen:
+                seen.add(key)
+                new_rows.append(row)
+                new_keys.append(key)
+
+        if not new_rows:
+            print(f"{self.tag} ⏭ No new rows for {facility} on {report_date} ({len(rows)} already delivered)")
+            return "unchanged"
+
+        day = datetime.strptime(report_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+        first_write = not self._delivered(report_date)
+        if self.target == "sheet":
+            self._append_sheet(day, report_date, header, new_rows, first_write)
+        elif self.target == "parquet":
+            self._append_parquet(day, header, new_rows)
+        else:
+            self._append_csv(day, header, new_rows)
+
+        # Only remember rows once they have actually been delivered
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen_rows VALUES (?, ?, ?, ?)",
+                [(self.job, report_date, facility, k) for k in new_keys],
+            )
+            self._conn.commit()
+        count("rows", len(new_rows))
+        print(f"{self.tag} ✅ Appended {len(new_rows)} new row(s) of {len(rows)} for {facility} on {report_date}")
+        return f"+{len(new_rows)} rows"
+
+    def _delivered(self, report_date: str) -> bool:
+        """Has any facility delivered rows for report_date yet?"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM seen_rows WHERE job=? AND report_date=? LIMIT 1",
+                (self.job, report_date),
+            ).fetchone() is not None
+
+    def _target_id(self, report_date: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT target_id FROM rolling_target WHERE job=? AND report_date=? AND target=?",
+                (self.job, report_date, self.target),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _append_sheet(self, day: str, report_date: str, header: list, rows: list, first_write: bool):
+        sheet_id = self._target_id(report_date)
+        if sheet_id is None:
+            created = with_retries(lambda: execute(get_drive_service().files().create(
+                body={"name": f"{self.job}_{day}", "mimeType": GSHEET_MIMETYPE,
+                      "parents": [self.folder_id]},
+                fields="id",
+            )), f"Creating rolling sheet {self.job}_{day}", self.tag)
+            sheet_id = created["id"]
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO rolling_target VALUES (?, ?, ?, ?)",
+                                   (self.job, report_date, self.target, sheet_id))
+                self._conn.commit()
+            print(f"{self.tag} Created rolling sheet {self.job}_{day} (ID: {sheet_id})")
+            first_write = True
+
+        values = ([header] if first_write and header else []) + [[cell_text(v) for v in r] for r in rows]
+        with_retries(lambda: execute(get_sheets_service().spreadsheets().values().append(
+            spreadsheetId=sheet_id, range="A1", valueInputOption="RAW",
+            insertDataOption="INSERT_ROWS", body={"values": values},
+        )), f"Append of {len(rows)} row(s) to {self.job}_{day}", self.tag)
+
+    def _append_parquet(self, day: str, header: list, rows: list):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("INCREMENTAL_TARGET=parquet needs pyarrow installed")
+        part_dir = ROLLING_DIR / self.job / day
+        part_dir.mkdir(parents=True, exist_ok=True)
+        # The archive's per-job schema, so every part file of the day shares it
+        names = column_names(header)
+        columns = [[r[i] if i < len(r) and r[i] != "" else None for r in rows] for i in range(len(names))]
+        part = part_dir / f"part-{datetime.now().strftime('%H%M%S%f')}.parquet"
+        pq.write_table(build_table(names, columns, self.spec, self.tag), part)
+
+    def _append_csv(self, day: str, header: list, rows: list):
+        path = ROLLING_DIR / self.job / f"{day}.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not path.exists()
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if is_new and header:
+                writer.writerow(header)
+            writer.writerows([cell_text(v) for v in r] for r in rows)
@@ -0,0 +1,484 @@
+# job_engine.py
+"""Shared engine that runs the report jobs declared in report_jobs.py.
+
+One engine means every job gets the same machinery: the warm browser
+session, concurrent facility pages, readiness waits, the upload stage with
+dedupe/retries/output modes, and the incremental append mode.
+
+    python job_engine.py daily_service
+
+Settings come from the environment (set by control_panel.py), falling back
+to the job's "defaults"; with CONFIG_FILE set, later changes to the panel's
+config file are applied between iterations. SIGTERM (or Ctrl+C) stops the
+worker once the current facility and its upload are done; a heartbeat
+event tells the panel's supervisor the worker is alive.
+"""
+
+import os
+import sys
+import signal
+import asyncio
+import traceback
+import contextvars
+from datetime import datetime
+from pathlib import Path
+
+from browser_session import BrowserSession
+from config_store import ConfigStore
+from cron_schedule import EST, MISSED_RUNS, CronSchedule, Ticker, schedule_state_file
+from drive_uploader import UploadStage, UPLOAD_WORKERS, OUTPUT_MODE
+import events
+from events import emit
+from extraction import OrderedResults, extract_facilities
+from incremental import IncrementalSink
+from readiness import (wait_ready, is_ready, all_of, document_complete, network_idle,
+                       selector_visible, input_has_value, element_enabled)
+from report_jobs import JOBS
+from timing import count, iteration, note, span
+
+# Close the browser while the next run is further away than this
+IDLE_CLOSE_SECS = 3600
+# Liveness signal for the control panel's supervisor
+HEARTBEAT_SECS = float(os.getenv("HEARTBEAT_SECS", "10"))
+# How often a sleeping worker looks for config changes
+CONFIG_POLL_SECS = float(os.getenv("CONFIG_POLL_SECS", "5"))
+
+
+def load_settings(job_name: str) -> dict:
+    """Job settings from the environment, with the job's defaults as fallback."""
+    defaults = JOBS[job_name]["defaults"]
+    return {
+        "folder_id": os.getenv("FOLDER_ID", "NONE"),
+        "username": os.getenv("SCRIPT_USERNAME", "DEFAULT-USERNAME"),
+        "password": os.getenv("SCRIPT_PASSWORD", "DEFAULT-PASSWORD"),
+        "start_hour": int(os.getenv("START_HOUR", defaults.get("start_hour", 0))),
+        "end_hour": int(os.getenv("END_HOUR", defaults.get("end_hour", 24))),
+        "frequency": int(os.getenv("FREQUENCY", defaults.get("frequency", 60))),
+        "concurrency": int(os.getenv("CONCURRENCY", defaults.get("concurrency", 1))),
+        "schedule_run": int(os.getenv("SCHEDULE_RUN", defaults.get("schedule_run", 1))),
+        "incremental": os.getenv("INCREMENTAL", "1" if defaults.get("incremental") else "0") == "1",
+        "output_mode": os.getenv("OUTPUT_MODE", OUTPUT_MODE),
+        "cron": os.getenv("CRON") or None,
+        "missed_runs": os.getenv("MISSED_RUNS", MISSED_RUNS),
+        "prefetch": os.getenv("PREFETCH", "1") == "1",
+    }
+
+
+def settings_from_config(job_name: str, cfg: dict) -> dict:
+    """Same settings as load_settings, taken from a control-panel config entry."""
+    defaults = JOBS[job_name]["defaults"]
+    return {
+        "folder_id": cfg["folder_id"],
+        "username": cfg["username"],
+        "password": cfg["password"],
+        "start_hour": int(cfg.get("start_hour", defaults.get("start_hour", 0))),
+        "end_hour": int(cfg.get("end_hour", defaults.get("end_hour", 24))),
+        "frequency": int(cfg.get("frequency", defaults.get("frequency", 60))),
+        "concurrency": int(cfg.get("concurrency", defaults.get("concurrency", 1))),
+        "schedule_run": int(cfg.get("schedule_run", defaults.get("schedule_run", 1))),
+        "incremental": bool(cfg.get("incremental", defaults.get("incremental", False))),
+        "output_mode": cfg.get("output_mode", OUTPUT_MODE),
+        "cron": cfg.get("cron") or None,
+        "missed_runs": cfg.get("missed_runs", MISSED_RUNS),
+        "prefetch": bool(cfg.get("prefetch", True)),
+    }
+
+
+class ConfigWatcher:
+    """The job's settings from the panel's config store, re-read only when its version changes."""
+
+    def __init__(self, job_name: str, path: str):
+        self.job_name = job_name
+        self.store = ConfigStore(path)
+        self._version = None
+
+    def poll(self) -> dict:
+        """New settings if the config was saved since the last poll, else None."""
+        if self._version is not None and not self.store.changed():
+            return None
+        try:
+            config = self.store.read()
+            if self.store.version == self._version:
+                return None
+            settings = settings_from_config(self.job_name, config[self.job_name])
+        except (OSError, ValueError, KeyError, TypeError):
+            # Unreadable or not ours: try again next poll
+            return None
+        self._version = self.store.version
+        return settings
+
+
+def reload_settings(job_name: str, settings: dict, watcher: ConfigWatcher) -> dict:
+    """Settings to use from here on, announcing what changed."""
+    new = watcher.poll() if watcher is not None else None
+    if new is None or new == settings:
+        return settings
+    changed = sorted(k for k in new if new[k] != settings.get(k))
+    print(f"{JOBS[job_name]['tag']} 🔄 Config reloaded: {', '.join(changed)}")
+    emit("state", job_name, state="reloaded", changed=changed)
+    return new
+
+
+# ---------------------------------------------------------------------------
+# Step interpreter
+# ---------------------------------------------------------------------------
+
+def build_condition(spec, ctx: dict):
+    """Turn a declarative wait condition into a readiness check."""
+    if isinstance(spec, list):
+        return all_of(*(build_condition(s, ctx) for s in spec))
+    if spec == "network_idle":
+        return network_idle()
+    if spec == "document_complete":
+        return document_complete()
+    if "visible" in spec:
+        return selector_visible(spec["visible"])
+    if "enabled" in spec:
+        return element_enabled(spec["enabled"])
+    if "value" in spec:
+        selector, value = spec["value"]
+        return input_has_value(selector, value.format(**ctx))
+    raise ValueError(f"Unknown wait condition: {spec!r}")
+
+
+async def run_steps(page, steps: list, ctx: dict, tag: str, fac: dict = None):
+    for step in steps:
+        if "wait" in step:
+            await wait_ready(page, step["wait"], build_condition(step["until"], ctx), tag=tag)
+        elif "fill" in step:
+            await page.fill(step["fill"], step["value"].format(**ctx), timeout=60000)
+        elif "click" in step:
+            await page.click(step["click"])
+        elif "press" in step:
+            await page.keyboard.press(step["press"])
+        elif "keys" in step:
+            for key_step in fac["steps"]:
+                await page.keyboard.press(key_step)
+                await asyncio.sleep(0.5)
+        else:
+            raise ValueError(f"Unknown step: {step!r}")
+
+
+# ---------------------------------------------------------------------------
+# One iteration
+# ---------------------------------------------------------------------------
+
+def append_increment(sink: IncrementalSink, local_xls: Path, report_date: str, fac_name: str,
+                     tag: str) -> str:
+    """Blocking: push only the facility's rows not delivered yet for report_date."""
+    try:
+        with span("append"):
+            return sink.append(local_xls, report_date, fac_name)
+    finally:
+        if local_xls.exists():
+            local_xls.unlink()
+            print(f"{tag} 🗑 Deleted original XLS: {local_xls}")
+
+
+async def append_in_turn(sink: IncrementalSink, local_xls: Path, report_date: str, fac_name: str,
+                         tag: str, turn: asyncio.Future = None) -> str:
+    """Append on a thread once every earlier facility is done (rows stay in order)."""
+    if turn is not None:
+        await turn
+    return await asyncio.get_running_loop().run_in_executor(
+        None, contextvars.copy_context().run, append_increment, sink, local_xls, report_date, fac_name, tag
+    )
+
+
+async def hand_off(local_xls: Path, fac_name: str, ctx: dict, tag: str, stage: UploadStage,
+                   sink: IncrementalSink = None, turn: asyncio.Future = None):
+    """Queue a saved report for output; returns an awaitable of its final status."""
+    xls_bytes = local_xls.stat().st_size
+    count("download_bytes", xls_bytes)
+    note(fac_name, xls_bytes=xls_bytes)
+    print(f"{tag} Downloaded: {local_xls}")
+
+    # Convert and upload in the background while the page moves on
+    if sink is not None:
+        return asyncio.ensure_future(append_in_turn(sink, local_xls, ctx["date"], fac_name, tag, turn))
+    return await stage.submit(local_xls, fac_name, ctx["date"], turn)
+
+
+async def save_and_hand_off(dl, local_xls: Path, fac_name: str, ctx: dict, tag: str,
+                            stage: UploadStage, sink: IncrementalSink = None,
+                            turn: asyncio.Future = None) -> str:
+    """Prefetch: finish saving a download in the background, then hand it off."""
+    with span("download", fac_name):
+        await dl.save_as(local_xls)
+    return await (await hand_off(local_xls, fac_name, ctx, tag, stage, sink, turn))
+
+
+async def process_facility(job: dict, page, fac: dict, ctx: dict, stage: UploadStage,
+                           sink: IncrementalSink = None, turn: asyncio.Future = None,
+                           prefetch: bool = False):
+    """Select one facility, download its report and hand it off for output.
+
+    With ``prefetch`` the page moves on as soon as the download has
+    started; saving it finishes in the background. ``turn`` (from
+    OrderedResults) keeps uploads and appends in facility order.
+    """
+    tag = job["tag"]
+    fac_name = fac["name"]
+    download = job["download"]
+    locator = page.locator(download["selector"])
+    ready = element_enabled(download["selector"])
+    wait_name = download.get("wait", "download_ready")
+    with span("render", fac_name):
+        await run_steps(page, job["facility_steps"], ctx, tag, fac)
+        if download.get("optional"):
+            if not await is_ready(page, wait_name, ready, tag=tag):
+                print(f"{tag} No download found for {fac_name}")
+                return "no report"
+        else:
+            await wait_ready(page, wait_name, ready, tag=tag)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe_name = fac_name.replace("/", "_").replace(" ", "_")
+    local_xls = Path.cwd() / f"{timestamp}_{safe_name}.xls"
+    with span("download", fac_name):
+        async with page.expect_download() as dl_info:
+            await locator.click()
+        dl = await dl_info.value
+        if not prefetch:
+            await dl.save_as(local_xls)
+    if prefetch:
+        return asyncio.ensure_future(
+            save_and_hand_off(dl, local_xls, fac_name, ctx, tag, stage, sink, turn))
+    return await hand_off(local_xls, fac_name, ctx, tag, stage, sink, turn)
+
+
+async def run_job_iteration(job_name: str, session: BrowserSession, settings: dict,
+                            stop: asyncio.Event = None, fire: datetime = None) -> list:
+    """One iteration of a job: every facility, ``concurrency`` pages at a time.
+
+    The report date is the day of ``fire`` (the schedule tick being run, so
+    a caught-up tick gets its own day's report), or today. Once ``stop`` is
+    set, pages finish their current facility and take no new ones; files
+    already downloaded are still uploaded.
+    """
+    job = JOBS[job_name]
+    tag = job["tag"]
+    report_day = fire.astimezone(EST) if fire is not None else datetime.now(EST)
+    ctx = {"date": report_day.strftime("%m/%d/%Y"), "keyword": job["keyword"]}
+
+    async def open_report(page):
+        with span("navigation"):
+            await run_steps(page, job["navigation"], ctx, tag)
+
+    # Facility results (and uploads) in FACILITIES order
+    collector = OrderedResults(job["facilities"], tag, job=job_name)
+    facility_index = {fac["name"]: idx for idx, fac in enumerate(job["facilities"])}
+    prefetch = settings.get("prefetch", False)
+
+    sink = None
+    if settings["incremental"]:
+        sink = IncrementalSink(job_name, settings["folder_id"], tag=tag)
+    try:
+        with iteration(job_name, tag=tag) as record:
+            async with UploadStage(settings["folder_id"], tag=tag, job=job_name,
+                                   workers=job.get("upload_workers", UPLOAD_WORKERS),
+                                   output_mode=settings.get("output_mode", OUTPUT_MODE)) as stage:
+                record.results = await extract_facilities(
+                    session, job["facilities"],
+                    open_report=open_report,
+                    process_facility=lambda page, fac: process_facility(
+                        job, page, fac, ctx, stage, sink,
+                        turn=collector.turn(facility_index[fac["name"]]), prefetch=prefetch),
+                    concurrency=settings["concurrency"], tag=tag, collector=collector,
+                    stop=stop,
+                )
+            return record.results
+    finally:
+        if sink is not None:
+            sink.close()
+
+
+# ---------------------------------------------------------------------------
+# Scheduling
+# ---------------------------------------------------------------------------
+
+def job_schedule(job_name: str, settings: dict):
+    """The job's schedule, or None for a one-off forced run.
+
+    An explicit ``cron`` setting wins; otherwise hours jobs run every
+    ``frequency`` minutes inside their run hours and weekly jobs use the
+    job's own cron (Friday 10 PM) unless force-run.
+    """
+    job = JOBS[job_name]
+    if job["schedule"] == "weekly" and settings["schedule_run"] != 1:
+        return None
+    if settings.get("cron"):
+        return CronSchedule(settings["cron"])
+    if job["schedule"] == "weekly":
+        return CronSchedule(job["cron"])
+    return CronSchedule.every(settings["start_hour"], settings["end_hour"], settings["frequency"])
+
+def report_missed(tag: str, ticker: Ticker):
+    if ticker.missed:
+        print(f"{tag} ⚠ {ticker.missed} missed run(s) handled by policy '{ticker.policy}'")
+
+def new_session(job_name: str, settings: dict, shared=None) -> BrowserSession:
+    return BrowserSession(job_name, settings["username"], settings["password"],
+                          tag=JOBS[job_name]["tag"], shared=shared)
+
+async def sleep_unless_stopped(stop: asyncio.Event, seconds: float):
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+async def run_scheduled(job_name: str, settings: dict, stop: asyncio.Event = None,
+                        watcher: ConfigWatcher = None):
+    """Run iterations at the schedule's fire times on one event loop, browser kept warm.
+
+    With a ``watcher``, changed settings (hours, frequency, cron, folder,
+    credentials, ...) apply from the next iteration without a restart; a
+    sleeping worker re-plans as soon as they arrive. Returns once ``stop``
+    is set, after the current facility and its uploads.
+    """
+    tag = JOBS[job_name]["tag"]
+    stop = stop or asyncio.Event()
+    ticker = None
+    session = None
+    shown_schedule = None
+    announced = None
+    try:
+        while not stop.is_set():
+            try:
+                settings = reload_settings(job_name, settings, watcher)
+
+                # Credentials changed: start over with a fresh context / login
+                if session is not None and (session.username, session.password) != \
+                        (settings["username"], settings["password"]):
+                    await session.close()
+                    session = None
+
+                # Rebuilt every pass so new settings apply; the last fire time is kept
+                schedule = job_schedule(job_name, settings)
+                if schedule is None:
+                    print(f"{tag} Force run: Executing now...")
+                    session = session or new_session(job_name, settings)
+                    await run_job_iteration(job_name, session, settings, stop)
+                    return
+                if ticker is None:
+                    ticker = Ticker(schedule, settings["missed_runs"], state_file=schedule_state_file(job_name))
+                if (str(schedule), settings["missed_runs"]) != shown_schedule:
+                    shown_schedule = (str(schedule), settings["missed_runs"])
+                    print(f"{tag} Schedule: {schedule} (US/Eastern), missed runs: {settings['missed_runs']}")
+                    announced = None
+                ticker.schedule, ticker.policy = schedule, settings["missed_runs"]
+
+                runs, next_fire = ticker.plan(datetime.now(EST))
+                report_missed(tag, ticker)
+                for fire in runs:
+                    if stop.is_set():
+                        break
+                    print(f"{tag} ⏰ Running iteration for {fire:%Y-%m-%d %H:%M}...")
+                    session = session or new_session(job_name, settings)
+                    try:
+                        await run_job_iteration(job_name, session, settings, stop, fire)
+                    finally:
+                        # A failed run still counts, so it isn't retried in a tight loop
+                        ticker.done(fire)
+                if runs:
+                    announced = None
+                    continue  # ticks may have passed while we were running
+
+                sleep_secs = max(0, (next_fire - datetime.now(EST)).total_seconds())
+                if sleep_secs > IDLE_CLOSE_SECS and session is not None:
+                    # No point keeping Chromium around; the saved login state survives
+                    await session.close()
+                    session = None
+                if next_fire != announced:
+                    print(f"{tag} Sleeping {sleep_secs/60:.0f} min until {next_fire:%Y-%m-%d %H:%M}...")
+                    emit("state", job_name, state="idle", next_run=next_fire.isoformat())
+                    announced = next_fire
+                # Wake up now and then to pick up config changes
+                await sleep_unless_stopped(stop, min(sleep_secs, CONFIG_POLL_SECS) if watcher else sleep_secs)
+
+            except Exception as e:
+                print(f"{tag} Unexpected main-loop error: {e}")
+                traceback.print_exc()
+                await sleep_unless_stopped(stop, 30)  # short recovery delay
+        print(f"{tag} 🛑 Stopped")
+    finally:
+        if session is not None:
+            await session.close()
+
+async def run_once(job_name: str, settings: dict, stop: asyncio.Event = None):
+    """Single run; the saved login state is reused if still valid."""
+    async with new_session(job_name, settings) as session:
+        return await run_job_iteration(job_name, session, settings, stop)
+
+def handle_stop_signals(stop: asyncio.Event, tag: str):
+    """SIGTERM / Ctrl+C: finish the current facility, then exit; a second one exits now."""
+    loop = asyncio.get_running_loop()
+
+    def request_stop():
+        if stop.is_set():
+            raise KeyboardInterrupt
+        print(f"{tag} 🛑 Stop requested: finishing the current facility, then exiting "
+              f"(signal again to exit now)")
+        stop.set()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, request_stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: default handling
+
+async def heartbeat(job_name: str):
+    """Tell the supervisor this loop is alive, every HEARTBEAT_SECS."""
+    while True:
+        emit("heartbeat", job_name)
+        await asyncio.sleep(HEARTBEAT_SECS)
+
+async def serve(job_name: str, settings: dict, forced: bool = False, watcher: ConfigWatcher = None):
+    """The worker process: scheduled (or one forced) run, stoppable by signal."""
+    stop = asyncio.Event()
+    handle_stop_signals(stop, JOBS[job_name]["tag"])
+    beat = asyncio.create_task(heartbeat(job_name))
+    try:
+        if forced:
+            await run_once(job_name, settings, stop)
+        else:
+            await run_scheduled(job_name, settings, stop, watcher)
+    finally:
+        beat.cancel()
+
+def main(job_name: str = None):
+    sys.stdout.reconfigure(encoding='utf-8')
+    job_name = job_name or (sys.argv[1] if len(sys.argv) > 1 else None)
+    if job_name not in JOBS:
+        print(f"Usage: python job_engine.py <{'|'.join(JOBS)}>")
+        sys.exit(2)
+    if events.EVENTS_PIPE:
+        # Started by control_panel.py: output goes back as JSON log records
+        events.capture_output(job_name)
+
+    job = JOBS[job_name]
+    tag = job["tag"]
+    settings = load_settings(job_name)
+    # Started by the panel: follow its config file instead of restarting on changes
+    watcher = ConfigWatcher(job_name, os.environ["CONFIG_FILE"]) if os.getenv("CONFIG_FILE") else None
+
+    if job_schedule(job_name, settings) is None:
+        print(f"{tag} Force run: Executing now...")
+        try:
+            asyncio.run(serve(job_name, settings, forced=True))
+        except KeyboardInterrupt:
+            print(f"{tag} KeyboardInterrupt => exiting.")
+            sys.exit(0)
+        return
+
+    print(f"{tag} Starting with config: START_HOUR={settings['start_hour']}, END_HOUR={settings['end_hour']}, "
+          f"FREQ={settings['frequency']}min, CRON={settings['cron']}, CONCURRENCY={settings['concurrency']}, "
+          f"INCREMENTAL={settings['incremental']}, PREFETCH={settings['prefetch']}, FOLDER_ID={settings['folder_id']}")
+    try:
+        asyncio.run(serve(job_name, settings, watcher=watcher))
+    except KeyboardInterrupt:
+        print(f"{tag} KeyboardInterrupt => exiting.")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
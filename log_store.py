@@ -0,0 +1,133 @@
+# log_store.py
+"""Per-job log records collected by the control panel.
+
+Workers send their output as JSON log records (events.capture_output);
+the panel's reader threads hand each one to ``LogStore.append``. Every job
+gets a JobLog:
+
+* a ring buffer of the last LOG_BUFFER records in memory, numbered with a
+  per-job sequence, which /logs/<job>?since=<seq> tails;
+* the same records appended to LOG_DIR/<job>.jsonl, rotated once it passes
+  LOG_ROTATE_MB: the file is renamed and gzip-compressed in the background
+  (<job>.<timestamp>.jsonl.gz), keeping the newest LOG_KEEP archives.
+
+    zcat logs/daily_service.*.jsonl.gz | jq -r 'select(.level == "error") | .msg'
+"""
+
+import os
+import gzip
+import json
+import shutil
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
+LOG_BUFFER = int(os.getenv("LOG_BUFFER", "5000"))
+LOG_ROTATE_MB = float(os.getenv("LOG_ROTATE_MB", "10"))
+LOG_KEEP = int(os.getenv("LOG_KEEP", "10"))
+
+LEVELS = ("info", "warning", "error")
+
+
+def compress(rotated: Path, pattern: str, keep: int):
+    """Gzip a rotated file, then keep only the newest ``keep`` archives matching ``pattern``."""
+    try:
+        gz = rotated.with_name(rotated.name + ".gz")
+        with open(rotated, "rb") as src, gzip.open(gz, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        rotated.unlink()
+        archives = sorted(rotated.parent.glob(pattern))
+        for old in archives[:-keep] if keep else archives:
+            old.unlink()
+    except OSError:
+        traceback.print_exc()
+
+
+class JobLog:
+    """Ring buffer of one job's records, mirrored to a rotating file."""
+
+    def __init__(self, job: str, size: int = LOG_BUFFER, directory: Path = LOG_DIR,
+                 rotate_mb: float = LOG_ROTATE_MB, keep: int = LOG_KEEP):
+        self.job = job
+        self.records = deque(maxlen=size)
+        self.seq = 0
+        self.directory = Path(directory)
+        self.path = self.directory / f"{job}.jsonl"
+        self.rotate_bytes = int(rotate_mb * 1024 * 1024)
+        self.keep = keep
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, record: dict) -> dict:
+        with self._lock:
+            self.seq += 1
+            record["seq"] = self.seq
+            self.records.append(record)
+            try:
+                self._write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+            except OSError:
+                traceback.print_exc()
+        return record
+
+    def since(self, seq: int = 0, limit: int = 500, level: str = None) -> dict:
+        """Records after ``seq`` (oldest first, at most ``limit``)."""
+        min_level = LEVELS.index(level) if level in LEVELS else 0
+        with self._lock:
+            oldest = self.records[0]["seq"] if self.records else self.seq + 1
+            records = [r for r in self.records
+                       if r["seq"] > seq and LEVELS.index(r.get("level", "info")) >= min_level]
+            last = self.seq
+        records = records[:limit]
+        return {
+            "job": self.job,
+            "records": records,
+            # Where the next ?since= should start
+            "next": records[-1]["seq"] if len(records) == limit else max(seq, last),
+            "oldest": oldest,
+            # Records between ``seq`` and the buffer's start are only in the files
+            "truncated": seq + 1 < oldest,
+        }
+
+    def _write(self, line: str):
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(line)
+        self._file.flush()
+        if self._file.tell() >= self.rotate_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        rotated = self.path.with_name(f"{self.job}.{datetime.now():%Y%m%d_%H%M%S_%f}.jsonl")
+        os.replace(self.path, rotated)
+        threading.Thread(target=compress, args=(rotated, f"{self.job}.*.jsonl.gz", self.keep),
+                         name=f"{self.job}-log-rotate", daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LogStore:
+    """JobLogs by job name, created on first use; thread-safe."""
+
+    def __init__(self, directory: Path = LOG_DIR):
+        self.directory = Path(directory)
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def get(self, job: str) -> JobLog:
+        with self._lock:
+            if job not in self._logs:
+                self._logs[job] = JobLog(job, directory=self.directory)
+            return self._logs[job]
+
+    def append(self, job: str, record: dict) -> dict:
+        return self.get(job).append(record)
@@ -0,0 +1,150 @@
+# metrics.py
+"""Prometheus text exposition of the iteration records in METRICS_FILE.
+
+The control panel keeps one MetricsCollector; each /metrics request reads
+only the records appended since the last one (the file stays open) and
+folds them into per-job / per-stage histograms and counters. When the
+workers rotate the file (timing.rotate_metrics), the rest of the old one
+is read before moving on to the new one, so no record is lost; at startup
+only the current file is read.
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+
+from timing import METRICS_FILE
+
+# Seconds; covers quick readiness steps up to slow month-end uploads
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name: str, labels: str) -> list:
+        out = [f'{name}_bucket{{{labels},le="{bound}"}} {n}'
+               for bound, n in zip(self.buckets, self.counts)]
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum:.3f}")
+        out.append(f"{name}_count{{{labels}}} {self.total}")
+        return out
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**kv) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in kv.items())
+
+
+class MetricsCollector:
+    """Aggregates iteration records; safe to call from Flask request threads."""
+
+    def __init__(self, path: Path = METRICS_FILE):
+        self.path = Path(path)
+        self._file = None
+        self._lock = threading.Lock()
+        self.stage_seconds = {}    # (job, stage) -> Histogram
+        self.iteration_seconds = {}  # job -> Histogram
+        self.iterations = {}       # (job, status) -> n
+        self.facilities = {}       # (job, status) -> n
+        self.counters = {}         # (job, name) -> n
+
+    def refresh(self):
+        """Fold in records appended since the last call."""
+        with self._lock:
+            if self._file is None:
+                try:
+                    self._file = open(self.path, "rb")
+                except FileNotFoundError:
+                    return
+            self._read()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return  # rotated, the new file is not there yet
+            if st.st_ino != os.fstat(self._file.fileno()).st_ino:
+                # Rotated: the old file is read to its end above, go on with the new one
+                self._file.close()
+                self._file = None
+                try:
+                    self._file = open(self.path, "rb")
+                except FileNotFoundError:
+                    return
+                self._read()
+            elif st.st_size < self._file.tell():
+                self._file.seek(0)  # truncated
+                self._read()
+
+    def _read(self):
+        while True:
+            offset = self._file.tell()
+            line = self._file.readline()
+            if not line.endswith(b"\n"):
+                self._file.seek(offset)  # partial line still being written
+                break
+            try:
+                self.add(json.loads(line))
+            except (ValueError, KeyError):
+                continue
+
+    def add(self, record: dict):
+        job = record["job"]
+        self.iteration_seconds.setdefault(job, Histogram()).observe(record["seconds"])
+        key = (job, record["status"])
+        self.iterations[key] = self.iterations.get(key, 0) + 1
+        for s in record.get("spans", []):
+            self.stage_seconds.setdefault((job, s["stage"]), Histogram()).observe(s["seconds"])
+        for fac in record.get("facilities", []):
+            key = (job, fac["status"])
+            self.facilities[key] = self.facilities.get(key, 0) + 1
+        for name in ("download_bytes", "upload_bytes", "rows", "retries"):
+            key = (job, name)
+            self.counters[key] = self.counters.get(key, 0) + record.get(name, 0)
+
+    def render(self) -> str:
+        self.refresh()
+        with self._lock:
+            out = ["# HELP report_stage_seconds Time spent per pipeline stage.",
+                   "# TYPE report_stage_seconds histogram"]
+            for (job, stage), hist in sorted(self.stage_seconds.items()):
+                out += hist.lines("report_stage_seconds", _labels(job=job, stage=stage))
+
+            out += ["# HELP report_iteration_seconds Wall time of a whole iteration.",
+                    "# TYPE report_iteration_seconds histogram"]
+            for job, hist in sorted(self.iteration_seconds.items()):
+                out += hist.lines("report_iteration_seconds", _labels(job=job))
+
+            out += ["# HELP report_iterations_total Finished iterations by outcome.",
+                    "# TYPE report_iterations_total counter"]
+            out += [f"report_iterations_total{{{_labels(job=job, status=status)}}} {n}"
+                    for (job, status), n in sorted(self.iterations.items())]
+
+            out += ["# HELP report_facilities_total Facility results by status.",
+                    "# TYPE report_facilities_total counter"]
+            out += [f"report_facilities_total{{{_labels(job=job, status=status)}}} {n}"
+                    for (job, status), n in sorted(self.facilities.items())]
+
+            for name, help_text in (("download_bytes", "Bytes downloaded from the portal."),
+                                    ("upload_bytes", "Bytes uploaded to Drive."),
+                                    ("rows", "Report rows converted or appended."),
+                                    ("retries", "Drive request retries.")):
+                metric = f"report_{name}_total"
+                out += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                out += [f"{metric}{{{_labels(job=job)}}} {n}"
+                        for (job, key), n in sorted(self.counters.items()) if key == name]
+            return "\n".join(out) + "\n"
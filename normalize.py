@@ -0,0 +1,256 @@
+# normalize.py
+"""Column-wise normalization and validation of downloaded reports.
+
+xlrd hands back raw cell values: dates as Excel serial floats, numeric IDs
+as ``123.0``, plus blank rows and the header repeated on every printed
+page. ``normalize_sheet`` cleans one sheet a whole column at a time with
+NumPy, so it stays fast on large manifests:
+
+* date cells become ``datetime`` (1900 and 1904 date systems);
+* number columns whose values are all integral become ints, and plain
+  numbers stored as text in an otherwise numeric column become numbers
+  (text with leading zeros stays text, it is an ID);
+* text is stripped and empty text becomes an empty cell;
+* blank rows and repeated header rows below the header are dropped, and
+  merged ranges are moved to the surviving rows.
+
+Rows above the report's header row (titles) are kept as they are. The
+result quacks like an xlrd sheet (``name``, ``nrows``, ``row_values``,
+``merged_cells``), so the writers in xls_converter.py take it unchanged.
+
+A job can declare a ``report`` spec in report_jobs.py with its
+``header_row`` and ``required_columns`` (HEADER_ROW / REQUIRED_COLUMNS
+override them). A sheet without a required column raises
+ReportValidationError, which the upload stage reports as "invalid".
+
+Consumers that want the report's rows rather than a file (the Parquet
+archive, the incremental append mode) use ``read_report``: the header and
+the normalized data rows of every sheet sharing the first sheet's header
+(the 65536-row overflow sheets), cleaned here once for all of them.
+
+NumPy is optional: without it, or with NORMALIZE=0, sheets are written raw.
+"""
+
+import os
+import importlib.util
+from array import array
+
+from xlrd import (XL_CELL_BLANK, XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_EMPTY, XL_CELL_ERROR,
+                  XL_CELL_NUMBER, XL_CELL_TEXT, error_text_from_code, open_workbook)
+
+from report_jobs import JOBS
+
+NORMALIZE_ENABLED = os.getenv("NORMALIZE", "1") == "1"
+
+
+class ReportValidationError(ValueError):
+    """A downloaded report does not have the columns its job expects."""
+
+
+def available() -> bool:
+    """Is normalization on and NumPy importable?"""
+    return NORMALIZE_ENABLED and importlib.util.find_spec("numpy") is not None
+
+
+def report_spec(job_name: str) -> dict:
+    """Header row, required columns and declared column types of a job's report."""
+    report = JOBS.get(job_name, {}).get("report", {})
+    required = os.getenv("REQUIRED_COLUMNS")
+    return {
+        "header_row": int(os.getenv("HEADER_ROW", report.get("header_row", 0))),
+        "required_columns": ([c.strip() for c in required.split(",") if c.strip()]
+                             if required is not None else list(report.get("required_columns", []))),
+        "column_types": dict(report.get("column_types", {})),
+    }
+
+
+def validate_header(header: list, spec: dict, sheet_name: str = ""):
+    missing = [c for c in spec.get("required_columns", []) if c not in header]
+    if missing:
+        raise ReportValidationError(
+            f"Sheet {sheet_name!r} is missing column(s) {missing} (header: {header})")
+
+
+class NormalizedSheet:
+    """Title/header rows plus the cleaned data rows of one sheet."""
+
+    def __init__(self, name: str, top_rows: list, data, merged_cells: list):
+        self.name = name
+        self._top = top_rows
+        # object array, one row per data row
+        self._data = data
+        self.nrows = len(top_rows) + len(data)
+        self.ncols = max([len(r) for r in top_rows] + [data.shape[1] if len(data) else 0])
+        self.merged_cells = merged_cells
+
+    def row_values(self, row_idx: int) -> list:
+        if row_idx < len(self._top):
+            return self._top[row_idx]
+        return self._data[row_idx - len(self._top)].tolist()
+
+
+def decode_dates(serials, datemode: int):
+    """Excel serial dates (float array) to datetime objects."""
+    import numpy as np
+
+    if datemode:
+        base = np.datetime64("1904-01-01", "ms")
+    else:
+        # Serials below 60 predate Excel's phantom 1900-02-29
+        base = np.where(serials < 60, np.datetime64("1899-12-31", "ms"), np.datetime64("1899-12-30", "ms"))
+    offsets = np.round(serials * 86_400_000).astype(np.int64).astype("timedelta64[ms]")
+    return (base + offsets).astype(object)
+
+
+def parse_numbers(texts):
+    """Float array if every text is a plain number (no leading zeros), else None."""
+    import numpy as np
+
+    texts = texts.astype(str)
+    unsigned = np.char.lstrip(texts, "+-")
+    leading_zero = np.char.startswith(unsigned, "0") & (np.char.str_len(unsigned) > 1) \
+        & ~np.char.startswith(unsigned, "0.")
+    if leading_zero.any():
+        return None
+    try:
+        numbers = texts.astype(float)
+    except ValueError:
+        return None
+    return numbers if np.isfinite(numbers).all() else None
+
+
+def _coerce_column(types, values, empty, datemode: int):
+    """Decode dates, booleans, errors and numbers of one column in place."""
+    import numpy as np
+
+    dates = types == XL_CELL_DATE
+    if dates.any():
+        values[dates] = decode_dates(values[dates].astype(float), datemode)
+
+    bools = types == XL_CELL_BOOLEAN
+    if bools.any():
+        values[bools] = values[bools].astype(bool)
+
+    errors = types == XL_CELL_ERROR
+    if errors.any():
+        values[errors] = [error_text_from_code.get(code, "#ERR") for code in values[errors]]
+
+    numbers = types == XL_CELL_NUMBER
+    texts = (types == XL_CELL_TEXT) & ~empty
+    if numbers.any() and texts.any():
+        parsed = parse_numbers(values[texts])
+        if parsed is not None:
+            values[texts] = parsed
+            numbers |= texts
+    if numbers.any():
+        floats = values[numbers].astype(float)
+        if (np.mod(floats, 1) == 0).all() and (np.abs(floats) < 2 ** 53).all():
+            values[numbers] = floats.astype(np.int64).astype(object)
+        else:
+            values[numbers] = floats.astype(object)
+
+
+def _type_matrix(row_types: list, ncols: int):
+    """xlrd cell types of several rows as one (rows x columns) array."""
+    import numpy as np
+
+    if row_types and isinstance(row_types[0], array):
+        # xlrd keeps each row's types as array("B"): join the raw bytes
+        joined = b"".join(t.tobytes() for t in row_types)
+        return np.frombuffer(joined, dtype=np.uint8).reshape(len(row_types), ncols)
+    return np.array(row_types, dtype=np.uint8).reshape(len(row_types), ncols)
+
+
+def normalize_sheet(xls_book, xls_sheet, spec: dict) -> NormalizedSheet:
+    """Clean one xlrd sheet column by column (see the module docstring)."""
+    import numpy as np
+
+    header_row = spec.get("header_row", 0)
+    nrows, ncols = xls_sheet.nrows, xls_sheet.ncols
+    top = [xls_sheet.row_values(r) for r in range(min(nrows, header_row + 1))]
+    header = [v.strip() if isinstance(v, str) else v for v in top[header_row]] if nrows > header_row else []
+    if header:
+        top[header_row] = header
+    validate_header([str(v) for v in header], spec, xls_sheet.name)
+
+    start = len(top)
+    n = nrows - start
+    if n <= 0 or ncols == 0:
+        return NormalizedSheet(xls_sheet.name, top, np.empty((0, ncols), dtype=object),
+                               list(xls_sheet.merged_cells))
+
+    # Read row by row (xlrd's col_values is a slow per-cell loop), then work
+    # on whole columns of the (rows x columns) matrices
+    rows = range(start, nrows)
+    types = _type_matrix([xls_sheet.row_types(r) for r in rows], ncols)
+    values = np.empty((n, ncols), dtype=object)
+    values[:] = [xls_sheet.row_values(r) for r in rows]
+
+    empty = (types == XL_CELL_EMPTY) | (types == XL_CELL_BLANK)
+    text = types == XL_CELL_TEXT
+    if text.any():
+        stripped = np.char.strip(values[text].astype(str))
+        values[text] = stripped.astype(object)
+        empty[text] = np.char.str_len(stripped) == 0
+    values[empty] = None
+
+    keep = ~empty.all(axis=1)
+    if any(v not in ("", None) for v in header):
+        expected = np.array(header + [""] * (ncols - len(header)), dtype=object)
+        expected[expected == ""] = None
+        # Only rows whose first cell matches can be a repeated header
+        candidates = np.flatnonzero(keep & (values[:, 0] == expected[0]))
+        if len(candidates):
+            repeated = (values[candidates] == expected).all(axis=1)
+            keep[candidates[repeated]] = False
+    types, values, empty = types[keep], values[keep], empty[keep]
+
+    for c in range(ncols):
+        _coerce_column(types[:, c], values[:, c], empty[:, c], xls_book.datemode)
+
+    # Old row index -> new one (-1 once dropped), to move merged ranges
+    row_map = np.concatenate([np.arange(start), np.where(keep, np.cumsum(keep) - 1 + start, -1)])
+    merged = []
+    for r1, r2, c1, c2 in xls_sheet.merged_cells:
+        rows = row_map[r1:r2]
+        if (rows >= 0).all():
+            merged.append((int(rows[0]), int(rows[-1]) + 1, c1, c2))
+    return NormalizedSheet(xls_sheet.name, top, values, merged)
+
+
+def _header_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_report(xls_path, spec: dict, tag: str = "[Normalize]"):
+    """Header (as text) and data rows of a report, through normalize_sheet.
+
+    Sheets whose header matches the first sheet's are read one after the
+    other; any other sheet is skipped with a warning. Without NumPy the
+    rows are xlrd's raw values.
+    """
+    header_row = spec.get("header_row", 0)
+    normalize = available()
+    xls_book = open_workbook(str(xls_path), on_demand=True)
+    header, rows = [], []
+    try:
+        for sheet_name in xls_book.sheet_names():
+            sheet = xls_book.sheet_by_name(sheet_name)
+            if normalize:
+                sheet = normalize_sheet(xls_book, sheet, spec)
+            if sheet.nrows > header_row:
+                sheet_header = [_header_text(v) for v in sheet.row_values(header_row)]
+                if not header:
+                    header = sheet_header
+                if sheet_header == header:
+                    rows.extend(sheet.row_values(r) for r in range(header_row + 1, sheet.nrows))
+                else:
+                    print(f"{tag} ⚠ Sheet {sheet_name!r} has a different header, skipped")
+            xls_book.unload_sheet(sheet_name)
+    finally:
+        xls_book.release_resources()
+    return header, rows
@@ -0,0 +1,138 @@
+# readiness.py
+"""Named readiness waits for the portal flows.
+
+Each page step waits on a condition (selector visible, network idle, date
+picker populated, Excel icon enabled) instead of a fixed ``time.sleep``.
+Conditions are polled with exponential backoff until they hold or the
+step's timeout expires, and the actual wait is logged so slow steps show up.
+
+Timeouts are in seconds: READY_TIMEOUT sets the default and READY_TIMEOUTS
+overrides single steps, e.g. ``READY_TIMEOUTS="excel_icon=20,search_results=90"``.
+"""
+
+import os
+import time
+import asyncio
+
+DEFAULT_TIMEOUT = float(os.getenv("READY_TIMEOUT", "60"))
+
+# Steps that legitimately may never become ready get a shorter default
+STEP_TIMEOUTS = {
+    "excel_icon": 20.0,
+}
+
+POLL_START = 0.1
+POLL_MAX = 2.0
+
+
+def _parse_step_timeouts(raw: str) -> dict:
+    timeouts = {}
+    for item in raw.split(","):
+        if "=" in item:
+            step, secs = item.split("=", 1)
+            timeouts[step.strip()] = float(secs)
+    return timeouts
+
+
+STEP_TIMEOUTS.update(_parse_step_timeouts(os.getenv("READY_TIMEOUTS", "")))
+
+
+def step_timeout(step: str) -> float:
+    return STEP_TIMEOUTS.get(step, DEFAULT_TIMEOUT)
+
+
+# ---------------------------------------------------------------------------
+# Conditions: async callables taking the page and returning True when ready
+# ---------------------------------------------------------------------------
+
+def selector_visible(selector: str):
+    async def check(page):
+        loc = page.locator(selector)
+        return (await loc.count()) > 0 and await loc.first.is_visible()
+    return check
+
+
+def network_idle():
+    async def check(page):
+        try:
+            # Short bounded attempt; the poll loop provides the overall timeout
+            await page.wait_for_load_state("networkidle", timeout=int(POLL_MAX * 1000))
+            return True
+        except Exception:
+            return False
+    return check
+
+
+def document_complete():
+    async def check(page):
+        return await page.evaluate("document.readyState === 'complete'")
+    return check
+
+
+def input_has_value(selector: str, value: str):
+    """Date picker (or any input) shows the value we filled in."""
+    async def check(page):
+        loc = page.locator(selector)
+        return (await loc.count()) > 0 and (await loc.first.input_value()) == value
+    return check
+
+
+def element_enabled(selector: str):
+    """Element is rendered and not disabled by itself or an ancestor."""
+    async def check(page):
+        loc = page.locator(selector)
+        if (await loc.count()) == 0:
+            return False
+        return await loc.first.evaluate(
+            "el => el.offsetParent !== null"
+            " && !el.closest('[disabled], [aria-disabled=\"true\"], .disabled')"
+        )
+    return check
+
+
+def all_of(*conditions):
+    async def check(page):
+        for cond in conditions:
+            if not await cond(page):
+                return False
+        return True
+    return check
+
+
+async def wait_ready(page, step: str, condition, tag: str = "[Ready]",
+                     timeout: float = None) -> float:
+    """Poll ``condition`` until it holds; return the seconds actually waited.
+
+    Raises asyncio.TimeoutError if the step is not ready within its timeout.
+    """
+    timeout = step_timeout(step) if timeout is None else timeout
+    started = time.monotonic()
+    deadline = started + timeout
+    interval = POLL_START
+
+    while True:
+        try:
+            ready = await condition(page)
+        except Exception:
+            # Page may be mid-navigation; treat as not ready yet
+            ready = False
+        elapsed = time.monotonic() - started
+        if ready:
+            print(f"{tag} ⏱ {step} ready after {elapsed:.2f}s")
+            return elapsed
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"{tag} ⏱ {step} not ready after {elapsed:.2f}s")
+            raise asyncio.TimeoutError(f"{step} not ready within {timeout:.0f}s")
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX)
+
+
+async def is_ready(page, step: str, condition, tag: str = "[Ready]",
+                   timeout: float = None) -> bool:
+    """Like wait_ready, but returns False instead of raising on timeout."""
+    try:
+        await wait_ready(page, step, condition, tag=tag, timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
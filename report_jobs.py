@@ -0,0 +1,124 @@
+# report_jobs.py
+"""Declarative report-job definitions run by job_engine.py.
+
+Each job says *what* to fetch; job_engine.py knows *how* (session reuse,
+concurrent facilities, readiness waits, upload stage, dedupe, output modes).
+This module is plain data so control_panel.py can import it cheaply.
+
+Step language (``navigation`` runs once per page from the portal home,
+``facility_steps`` once per facility on that page):
+
+    {"fill": selector, "value": "{date}"}      fill an input ("{date}", "{keyword}")
+    {"click": selector}                        click an element
+    {"press": key}                             press one key
+    {"keys": "facility"}                       press the facility's own "steps"
+    {"wait": name, "until": [conditions]}      named readiness wait (readiness.py)
+
+Conditions: "network_idle", "document_complete", {"visible": selector},
+{"enabled": selector}, {"value": [selector, "{date}"]}.
+
+``download`` names the element whose click produces the .xls and the
+readiness step ("wait") that waits for it; with "optional" a facility
+without it is reported as "no report" rather than an error.
+
+``schedule`` is "hours" (every ``frequency`` minutes inside the run hours)
+or "weekly" (the job's ``cron``, unless force-run); a per-job ``cron``
+setting overrides either, see cron_schedule.py.
+
+``report`` describes the downloaded sheet for normalize.py: its 0-based
+``header_row`` and the ``required_columns`` a valid report must have
+(none listed means any header is accepted). Optional ``column_types``
+(column -> "number", "integer", "date", "bool") type those columns in the
+Parquet archive; every other column is archived as text (archive.py).
+
+``defaults`` seed control_panel.py's per-job settings (and the engine's
+fallbacks when a setting is not in the environment).
+"""
+
+DATE_INPUT = 'div#dateTimePicker1 input'
+EXCEL_ICON = "img[alt='Excel']"
+
+# Facility selection on the Daily Service / Vision IBPR report
+IBPR_FACILITIES = [
+    {"name": "ZECA-278", "steps": []},
+    {"name": "ZNHI-250/3250",      "steps": ["Tab", "Enter", "ArrowDown", "Enter"]},
+    {"name": "ZWLN-256/3256", "steps": ["Tab", "Enter", "ArrowDown", "ArrowDown", "Enter"]},
+]
+
+IBPR_SEARCH = [
+    {"fill": "input#PTSKEYWORD", "value": "{keyword}"},
+    {"click": "#PTSSEARCHBTN"},
+    {"wait": "search_results", "until": ["network_idle"]},
+    {"press": "Enter"},
+    {"wait": "date_picker", "until": ["network_idle", {"visible": DATE_INPUT}]},
+    {"fill": DATE_INPUT, "value": "{date}"},
+    {"wait": "date_picker_populated", "until": [{"value": [DATE_INPUT, "{date}"]}, "network_idle"]},
+]
+
+IBPR_FACILITY_STEPS = [
+    # Re-fill date (sometimes it resets)
+    {"fill": DATE_INPUT, "value": "{date}"},
+    {"keys": "facility"},
+    {"click": "button.selectionButton"},
+    {"wait": "facility_report", "until": ["network_idle"]},
+]
+
+MANIFEST_TAB = '#mainTabSettab_1'
+MANIFEST_DATE_INPUT = '#manifestForm\\:date_input'
+GENERATE_EXCEL_BUTTON = '#manifestForm\\:buttonGenerateExcel'
+
+
+JOBS = {
+    "daily_service": {
+        "tag": "[Daily]",
+        "keyword": "Daily Service Wk & Vision IBPR",
+        "navigation": [{"wait": "portal_home", "until": ["document_complete"]}] + IBPR_SEARCH,
+        "facilities": IBPR_FACILITIES,
+        "facility_steps": IBPR_FACILITY_STEPS,
+        "download": {"selector": EXCEL_ICON, "wait": "excel_icon", "optional": True},
+        "report": {"header_row": 0, "required_columns": []},
+        "schedule": "hours",
+        "defaults": {"start_hour": 9, "end_hour": 22, "frequency": 60, "concurrency": 1,
+                     "folder_id": "FOLDER-ID-DAILY"},
+    },
+    "pickup_manifest": {
+        "tag": "[Pickup]",
+        "keyword": "FedEx Customer Connection",
+        "navigation": [
+            {"fill": "input#PTSKEYWORD", "value": "{keyword}"},
+            {"click": "#PTSSEARCHBTN"},
+            {"wait": "search_results", "until": ["network_idle"]},
+            {"press": "Enter"},
+            # P&D Manifest
+            {"wait": "manifest_tab", "until": [{"visible": MANIFEST_TAB}]},
+            {"click": MANIFEST_TAB},
+            {"wait": "manifest_form", "until": [{"visible": MANIFEST_DATE_INPUT}]},
+            {"fill": MANIFEST_DATE_INPUT, "value": "{date}"},
+            {"click": '#manifestForm\\:search'},
+            {"wait": "manifest_results", "until": ["network_idle", {"enabled": GENERATE_EXCEL_BUTTON}]},
+        ],
+        "facilities": [{"name": "PickUpManifest", "steps": []}],
+        "facility_steps": [],
+        "download": {"selector": GENERATE_EXCEL_BUTTON},
+        "report": {"header_row": 0, "required_columns": []},
+        "upload_workers": 1,
+        "schedule": "hours",
+        "defaults": {"start_hour": 8, "end_hour": 23, "frequency": 120, "incremental": False,
+                     "folder_id": "FOLDER-ID-PICKUP"},
+    },
+    "weekly_service": {
+        "tag": "[Weekly]",
+        "keyword": "Daily Service Wk & Vision IBPR",
+        "navigation": IBPR_SEARCH + [
+            {"click": "li.triggered a[href*='/mgba/wsw']"},
+            {"wait": "weekly_report", "until": ["network_idle"]},
+        ],
+        "facilities": IBPR_FACILITIES,
+        "facility_steps": IBPR_FACILITY_STEPS,
+        "download": {"selector": EXCEL_ICON, "wait": "excel_icon", "optional": True},
+        "report": {"header_row": 0, "required_columns": []},
+        "schedule": "weekly",
+        "cron": "0 22 * * 5",  # Fridays 10 PM US/Eastern
+        "defaults": {"schedule_run": 1, "concurrency": 1, "folder_id": "FOLDER-ID-WEEKLY"},
+    },
+}
@@ -0,0 +1,149 @@
+# run_history.py
+"""Local SQLite history of every iteration, facility result and stage span.
+
+Written once per iteration from the record timing.py builds; read by the
+control panel, which asks for p50/p95 iteration latency, success rate and
+the last successful upload per facility with aggregate queries over the
+indexed tables instead of scanning logs.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+RUN_HISTORY_DB = os.getenv("RUN_HISTORY_DB", "run_history.sqlite3")
+# Latency / success-rate stats cover this many days
+STATS_WINDOW_DAYS = int(os.getenv("STATS_WINDOW_DAYS", "7"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS iterations (
+    id              INTEGER PRIMARY KEY,
+    job             TEXT NOT NULL,
+    started_at      TEXT NOT NULL,
+    seconds         REAL NOT NULL,
+    status          TEXT NOT NULL,
+    download_bytes  INTEGER NOT NULL DEFAULT 0,
+    upload_bytes    INTEGER NOT NULL DEFAULT 0,
+    rows            INTEGER NOT NULL DEFAULT 0,
+    retries         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS iterations_job_started ON iterations (job, started_at);
+
+CREATE TABLE IF NOT EXISTS facility_runs (
+    iteration_id    INTEGER NOT NULL REFERENCES iterations (id),
+    job             TEXT NOT NULL,
+    facility        TEXT NOT NULL,
+    started_at      TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    uploaded        INTEGER NOT NULL,
+    seconds         REAL,
+    xls_bytes       INTEGER,
+    output_bytes    INTEGER,
+    error           TEXT
+);
+CREATE INDEX IF NOT EXISTS facility_runs_job_facility_started
+    ON facility_runs (job, facility, started_at);
+
+CREATE TABLE IF NOT EXISTS stage_spans (
+    iteration_id    INTEGER NOT NULL REFERENCES iterations (id),
+    job             TEXT NOT NULL,
+    facility        TEXT,
+    stage           TEXT NOT NULL,
+    seconds         REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_spans_job_stage ON stage_spans (job, stage);
+"""
+
+
+def was_uploaded(status: str) -> bool:
+    """Did this facility result put data into Drive ("ok" or "+N rows")?"""
+    return status == "ok" or status.startswith("+")
+
+
+class RunHistory:
+    """Thread-safe wrapper around one SQLite connection."""
+
+    def __init__(self, path: str = RUN_HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        # WAL so the panel can query while a worker writes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, data: dict) -> int:
+        """Store one iteration record (timing.IterationRecord.as_dict)."""
+        job, started = data["job"], data["started"]
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO iterations (job, started_at, seconds, status, download_bytes,"
+                " upload_bytes, rows, retries) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job, started, data["seconds"], data["status"], data.get("download_bytes", 0),
+                 data.get("upload_bytes", 0), data.get("rows", 0), data.get("retries", 0)),
+            )
+            iteration_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT INTO facility_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(iteration_id, job, f["facility"], started, f["status"],
+                  int(was_uploaded(f["status"])), f.get("seconds"), f.get("xls_bytes"),
+                  f.get("output_bytes"), f.get("error"))
+                 for f in data.get("facilities", [])],
+            )
+            self._conn.executemany(
+                "INSERT INTO stage_spans VALUES (?, ?, ?, ?, ?)",
+                [(iteration_id, job, s.get("facility"), s["stage"], s["seconds"])
+                 for s in data.get("spans", [])],
+            )
+            self._conn.commit()
+        return iteration_id
+
+    def _percentile(self, job: str, since: str, n: int, pct: float):
+        if n == 0:
+            return None
+        row = self._conn.execute(
+            "SELECT seconds FROM iterations WHERE job=? AND started_at>=?"
+            " ORDER BY seconds LIMIT 1 OFFSET ?",
+            (job, since, min(n - 1, int(pct * n))),
+        ).fetchone()
+        return row[0] if row else None
+
+    def job_stats(self, job: str, days: int = STATS_WINDOW_DAYS) -> dict:
+        """Latency percentiles, success rate and last uploads of one job."""
+        since = (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds")
+        with self._lock:
+            n, ok, last_run = self._conn.execute(
+                "SELECT COUNT(*), SUM(status = 'ok'), MAX(started_at) FROM iterations"
+                " WHERE job=? AND started_at>=?",
+                (job, since),
+            ).fetchone()
+            p50 = self._percentile(job, since, n, 0.50)
+            p95 = self._percentile(job, since, n, 0.95)
+            last_uploads = dict(self._conn.execute(
+                "SELECT facility, MAX(started_at) FROM facility_runs"
+                " WHERE job=? AND uploaded=1 GROUP BY facility",
+                (job,),
+            ).fetchall())
+        return {
+            "window_days": days,
+            "iterations": n,
+            "success_rate": round(ok / n, 3) if n else None,
+            "p50_seconds": p50,
+            "p95_seconds": p95,
+            "last_run": last_run,
+            "last_upload": last_uploads,
+        }
+
+
+def record_iteration(data: dict, path: str = RUN_HISTORY_DB):
+    """Open, write one iteration, close; cheap enough once per iteration."""
+    history = RunHistory(path)
+    try:
+        history.record(data)
+    finally:
+        history.close()
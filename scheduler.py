@@ -0,0 +1,267 @@
+# scheduler.py
+"""Single-process scheduler: every report job as an asyncio task on one loop.
+
+Optional alternative to one worker process per job (SCHEDULER_MODE=inprocess
+in control_panel.py). Playwright, googleapiclient and openpyxl are imported
+once, all jobs share one Chromium (each keeps its own context and saved
+login) and the process-wide Drive client, and a job can be paused, resumed
+or given new settings from the control panel without restarting anything.
+Stopping a job lets it finish its current facility first (as a stopped
+worker process does); it is only cancelled after GRACEFUL_STOP_SECS.
+
+The event loop runs in a background thread; the public methods are called
+from Flask request threads and hop onto the loop.
+"""
+
+import asyncio
+import threading
+import traceback
+from datetime import datetime
+
+from browser_session import SharedBrowser
+from cron_schedule import EST, Ticker, schedule_state_file
+from events import emit
+from job_engine import (IDLE_CLOSE_SECS, job_schedule, new_session, report_missed,
+                        run_job_iteration)
+from report_jobs import JOBS
+from supervisor import GRACEFUL_STOP_SECS
+
+
+class JobScheduler:
+    """Runs report jobs on one event loop; thread-safe control methods."""
+
+    def __init__(self, tag: str = "[Scheduler]"):
+        self.tag = tag
+        self.loop = None
+        self._thread = None
+        self._browser = None
+        # job_name -> {"settings", "task", "paused", "wakeup", "stop", "running",
+        #              "last_start", "next_run", "last_results"}
+        self._jobs = {}
+
+    # ------------------------------------------------------------------
+    # Loop thread
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self._browser = SharedBrowser(tag=self.tag)
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="job-scheduler", daemon=True)
+        self._thread.start()
+        ready.wait()
+        print(f"{self.tag} In-process scheduler started")
+
+    def _call(self, coro, timeout: float = 30):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def shutdown(self, timeout: float = GRACEFUL_STOP_SECS):
+        """Stop every job gracefully (cancelled after ``timeout``), then the loop."""
+        if self._thread is None:
+            return
+        running = [job_name for job_name in self._jobs if self.is_running(job_name)]
+        if running:
+            self._call(self._stop_all(running, timeout), timeout + 30)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # Control API (called from Flask threads)
+    # ------------------------------------------------------------------
+
+    def is_running(self, job_name: str) -> bool:
+        state = self._jobs.get(job_name)
+        return bool(state and state["task"] and not state["task"].done())
+
+    def start_job(self, job_name: str, settings: dict) -> bool:
+        """Start the job's task; False if it was already running."""
+        if self.is_running(job_name):
+            return False
+        return self._call(self._start(job_name, settings))
+
+    def stop_job(self, job_name: str, wait: float = None) -> bool:
+        """Stop after the current facility; returns at once unless ``wait`` is given.
+
+        The job is cancelled if it is still running after GRACEFUL_STOP_SECS.
+        """
+        if not self.is_running(job_name):
+            return False
+        future = asyncio.run_coroutine_threadsafe(self._stop(job_name), self.loop)
+        if wait is not None:
+            future.result(wait)
+        return True
+
+    def pause_job(self, job_name: str) -> bool:
+        """No new iterations until resumed; a running one finishes first."""
+        return self._set_paused(job_name, True)
+
+    def resume_job(self, job_name: str) -> bool:
+        return self._set_paused(job_name, False)
+
+    def update_settings(self, job_name: str, settings: dict):
+        """New settings take effect from the job's next iteration."""
+        state = self._jobs.get(job_name)
+        if state is None:
+            return
+        state["settings"] = settings
+        self.loop.call_soon_threadsafe(state["wakeup"].set)
+
+    def status(self, job_name: str) -> dict:
+        state = self._jobs.get(job_name)
+        if state is None:
+            return {"paused": False, "stopping": False, "iterating": False, "next_run": None}
+        next_run = state["next_run"]
+        return {
+            "paused": state["paused"],
+            "stopping": state["stop"].is_set() and self.is_running(job_name),
+            "iterating": state["running"],
+            "next_run": next_run.isoformat() if next_run else None,
+        }
+
+    def _set_paused(self, job_name: str, paused: bool) -> bool:
+        state = self._jobs.get(job_name)
+        if state is None or not self.is_running(job_name) or state["paused"] == paused:
+            return False
+        state["paused"] = paused
+        self.loop.call_soon_threadsafe(state["wakeup"].set)
+        print(f"{JOBS[job_name]['tag']} {'⏸ Paused' if paused else '▶ Resumed'}")
+        emit("state", job_name, state="paused" if paused else "resumed")
+        return True
+
+    # ------------------------------------------------------------------
+    # On the loop
+    # ------------------------------------------------------------------
+
+    async def _start(self, job_name: str, settings: dict) -> bool:
+        state = {
+            "settings": settings,
+            "task": None,
+            "paused": False,
+            "wakeup": asyncio.Event(),
+            "stop": asyncio.Event(),
+            "running": False,
+            "last_start": None,
+            "next_run": None,
+            "last_results": None,
+        }
+        self._jobs[job_name] = state
+        state["task"] = asyncio.create_task(self._run_job(job_name, state), name=job_name)
+        emit("state", job_name, state="started")
+        return True
+
+    async def _stop(self, job_name: str, timeout: float = GRACEFUL_STOP_SECS) -> bool:
+        state = self._jobs[job_name]
+        task = state["task"]
+        if not state["stop"].is_set():
+            state["stop"].set()
+            state["wakeup"].set()
+            emit("state", job_name, state="stopping")
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            print(f"{JOBS[job_name]['tag']} ⚠ Still running {timeout:.0f}s after stop, cancelling it")
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        except Exception:
+            # Already reported by the job itself
+            pass
+        return True
+
+    async def _stop_all(self, job_names: list, timeout: float):
+        await asyncio.gather(*(self._stop(job_name, timeout) for job_name in job_names))
+
+    async def _wait(self, state: dict, seconds: float = None):
+        """Sleep until ``seconds`` pass or a pause/resume/settings change/stop.
+
+        The event is cleared only after waking, so a change signalled while the
+        job was still deciding what to do returns at once instead of being lost.
+        """
+        if state["stop"].is_set():
+            return
+        try:
+            await asyncio.wait_for(state["wakeup"].wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        state["wakeup"].clear()
+
+    async def _run_job(self, job_name: str, state: dict):
+        tag = JOBS[job_name]["tag"]
+        session = None
+        ticker = None
+        try:
+            while not state["stop"].is_set():
+                settings = state["settings"]
+                if state["paused"]:
+                    state["next_run"] = None
+                    await self._wait(state)
+                    continue
+
+                # Credentials changed: start over with a fresh context / login
+                if session is not None and (session.username, session.password) != \
+                        (settings["username"], settings["password"]):
+                    await session.close()
+                    session = None
+
+                # Rebuilt every pass so new settings apply; the last fire time is kept
+                schedule = job_schedule(job_name, settings)
+                if schedule is None:
+                    if state["last_start"] is not None:
+                        print(f"{tag} Forced run done, job finished")
+                        return
+                    runs, next_fire = [None], None
+                else:
+                    if ticker is None:
+                        ticker = Ticker(schedule, settings["missed_runs"],
+                                        state_file=schedule_state_file(job_name))
+                    ticker.schedule, ticker.policy = schedule, settings["missed_runs"]
+                    runs, next_fire = ticker.plan(datetime.now(EST))
+                    report_missed(tag, ticker)
+
+                if not runs:
+                    state["next_run"] = next_fire
+                    delay = max(0, (next_fire - datetime.now(EST)).total_seconds())
+                    if delay > IDLE_CLOSE_SECS and session is not None:
+                        # The saved login state survives; no point holding the context
+                        await session.close()
+                        session = None
+                    print(f"{tag} Next run at {next_fire:%Y-%m-%d %H:%M} ({delay/60:.0f} min)")
+                    emit("state", job_name, state="idle", next_run=next_fire.isoformat())
+                    await self._wait(state, delay)
+                    continue
+
+                if session is None:
+                    session = new_session(job_name, settings, shared=self._browser)
+                for fire in runs:
+                    state["last_start"] = datetime.now(EST)
+                    state["running"] = True
+                    try:
+                        state["last_results"] = await run_job_iteration(job_name, session, settings,
+                                                                        state["stop"], fire)
+                    except Exception as e:
+                        print(f"{tag} Unexpected iteration error: {e}")
+                        traceback.print_exc()
+                        await self._wait(state, 30)  # short recovery delay
+                    finally:
+                        state["running"] = False
+                        if fire is not None:
+                            ticker.done(fire)
+                    if state["paused"] or state["stop"].is_set():
+                        break
+            print(f"{tag} 🛑 Stopped")
+        finally:
+            state["next_run"] = None
+            if session is not None:
+                await session.close()
+            emit("state", job_name, state="stopped")
@@ -0,0 +1,264 @@
+# supervisor.py
+"""Worker process supervision for the control panel (process mode).
+
+The panel starts and stops workers through a Supervisor, which watches
+them from a background thread:
+
+* Heartbeats: a worker sends a ``heartbeat`` event every HEARTBEAT_SECS
+  from its event loop (job_engine.heartbeat). None for HEARTBEAT_TIMEOUT
+  means the loop is blocked; during an iteration, no stage / facility /
+  log activity for PROGRESS_TIMEOUT means a call is stuck (e.g. a hung
+  Playwright wait). Either way the worker is killed and restarted.
+* Crashes: a worker that exits nonzero without being asked to is
+  restarted after a backoff, RESTART_BACKOFF_SECS doubling per failure up
+  to RESTART_BACKOFF_MAX_SECS; it resets once a worker has run
+  STABLE_SECS. Exit code 0 (a forced run that finished) is not restarted.
+* Graceful stop: SIGTERM asks the worker to finish its current facility,
+  skip the rest and exit (job_engine.handle_stop_signals). Only after
+  GRACEFUL_STOP_SECS is it killed.
+
+Workers run in their own process group, and every kill (and every exit)
+takes the whole group down with it, so Chromium, the Playwright driver
+and conversion pool children never outlive their worker.
+"""
+
+import os
+import time
+import signal
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "90"))
+PROGRESS_TIMEOUT = float(os.getenv("PROGRESS_TIMEOUT", "1800"))
+GRACEFUL_STOP_SECS = float(os.getenv("GRACEFUL_STOP_SECS", "300"))
+RESTART_BACKOFF_SECS = float(os.getenv("RESTART_BACKOFF_SECS", "10"))
+RESTART_BACKOFF_MAX_SECS = float(os.getenv("RESTART_BACKOFF_MAX_SECS", "600"))
+STABLE_SECS = float(os.getenv("STABLE_SECS", "600"))
+SUPERVISE_SECS = 5
+
+# Events that show an iteration is moving
+PROGRESS_EVENTS = ("stage", "facility", "iteration", "log")
+
+
+def kill_tree(proc):
+    """SIGKILL a worker's whole process group (Chromium, driver, pool children)."""
+    if os.name != "posix":
+        proc.kill()
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _alive(proc) -> bool:
+    return proc is not None and proc.poll() is None
+
+
+class Supervisor:
+    """Starts, watches and restarts worker processes; thread-safe."""
+
+    def __init__(self, spawn, publish, tag: str = "[Supervisor]"):
+        # spawn(job) -> Popen (or None); it must call exited() once the process ends
+        self.spawn = spawn
+        self.publish = publish
+        self.tag = tag
+        # job -> {"proc", "wanted", "started", "last_heartbeat", "last_progress",
+        #         "iterating", "stopping_since", "failures", "restart_at"}
+        self._workers = {}
+        self._lock = threading.RLock()
+        self._thread = None
+        self._closing = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="supervisor", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Control API
+    # ------------------------------------------------------------------
+
+    def is_running(self, job: str) -> bool:
+        return _alive(self._worker(job)["proc"])
+
+    def start_job(self, job: str):
+        """Start the job's worker (or return the running one)."""
+        with self._lock:
+            w = self._worker(job)
+            if _alive(w["proc"]):
+                return w["proc"]
+            w.update(wanted=True, failures=0, restart_at=None)
+            return self._launch(job, w)
+
+    def stop_job(self, job: str, wait: float = None) -> bool:
+        """Ask the worker to stop after its current facility.
+
+        Returns at once unless ``wait`` is given; the supervisor kills the
+        worker if it is still there after GRACEFUL_STOP_SECS.
+        """
+        with self._lock:
+            w = self._worker(job)
+            w.update(wanted=False, restart_at=None)
+            proc = w["proc"]
+            if not _alive(proc):
+                return False
+            self._terminate(job, w)
+        if wait is not None:
+            try:
+                proc.wait(wait)
+            except Exception:
+                kill_tree(proc)
+                proc.wait()
+        return True
+
+    def status(self, job: str) -> dict:
+        with self._lock:
+            w = self._worker(job)
+            now = time.monotonic()
+            if w["stopping_since"] is not None and _alive(w["proc"]):
+                health = "stopping"
+            elif w["restart_at"] is not None:
+                health = "restarting"
+            elif not _alive(w["proc"]):
+                health = None
+            elif now - w["last_heartbeat"] > HEARTBEAT_TIMEOUT:
+                health = "no heartbeat"
+            else:
+                health = "ok"
+            return {
+                "health": health,
+                "restarts": w["failures"],
+                "last_heartbeat": self._wall(w["last_heartbeat"]) if w["proc"] else None,
+                "next_restart": self._wall(w["restart_at"]) if w["restart_at"] else None,
+            }
+
+    def observe(self, job: str, event: dict):
+        """Feed every event / log record from a worker (reader threads)."""
+        with self._lock:
+            w = self._workers.get(job)
+            if w is None:
+                return
+            now = time.monotonic()
+            kind = event.get("kind")
+            # Any output at all shows the loop is alive
+            w["last_heartbeat"] = now
+            if kind in PROGRESS_EVENTS:
+                w["last_progress"] = now
+            if kind == "iteration":
+                w["iterating"] = event.get("phase") == "start"
+
+    def exited(self, job: str, proc, code: int):
+        """Called once a worker has ended; restarts it if it should be running."""
+        kill_tree(proc)
+        with self._lock:
+            w = self._worker(job)
+            if w["proc"] is not proc:
+                return
+            ran = time.monotonic() - w["started"]
+            w.update(stopping_since=None, iterating=False)
+            if not w["wanted"] or self._closing.is_set():
+                self.publish({"kind": "state", "job": job, "state": "stopped", "returncode": code})
+                return
+            if code == 0:
+                w["wanted"] = False
+                print(f"{self.tag} {job} finished")
+                self.publish({"kind": "state", "job": job, "state": "stopped", "returncode": code})
+                return
+            if ran >= STABLE_SECS:
+                w["failures"] = 0
+            w["failures"] += 1
+            delay = min(RESTART_BACKOFF_SECS * 2 ** (w["failures"] - 1), RESTART_BACKOFF_MAX_SECS)
+            w["restart_at"] = time.monotonic() + delay
+            print(f"{self.tag} ❌ {job} exited with code {code}, restart #{w['failures']} in {delay:.0f}s")
+            self.publish({"kind": "state", "job": job, "state": "crashed", "returncode": code,
+                          "restart_in": delay})
+
+    def shutdown(self, timeout: float = GRACEFUL_STOP_SECS):
+        """Stop every worker gracefully; kill what is left after ``timeout``."""
+        self._closing.set()
+        with self._lock:
+            procs = [w["proc"] for w in self._workers.values() if _alive(w["proc"])]
+            for job, w in self._workers.items():
+                w.update(wanted=False, restart_at=None)
+                if _alive(w["proc"]):
+                    self._terminate(job, w)
+        deadline = time.monotonic() + timeout
+        for proc in procs:
+            try:
+                proc.wait(max(0, deadline - time.monotonic()))
+            except Exception:
+                print(f"{self.tag} ⚠ PID {proc.pid} did not stop in time, killing it")
+            kill_tree(proc)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _worker(self, job: str) -> dict:
+        with self._lock:
+            if job not in self._workers:
+                self._workers[job] = {
+                    "proc": None, "wanted": False, "started": 0.0, "last_heartbeat": 0.0,
+                    "last_progress": 0.0, "iterating": False, "stopping_since": None,
+                    "failures": 0, "restart_at": None,
+                }
+            return self._workers[job]
+
+    def _launch(self, job: str, w: dict):
+        now = time.monotonic()
+        w.update(started=now, last_heartbeat=now, last_progress=now, iterating=False,
+                 stopping_since=None, restart_at=None)
+        w["proc"] = self.spawn(job)
+        if w["proc"] is None and w["wanted"]:
+            # Could not even start; try again later
+            w["failures"] += 1
+            w["restart_at"] = now + min(RESTART_BACKOFF_SECS * 2 ** (w["failures"] - 1),
+                                        RESTART_BACKOFF_MAX_SECS)
+        return w["proc"]
+
+    def _terminate(self, job: str, w: dict):
+        if w["stopping_since"] is None:
+            w["stopping_since"] = time.monotonic()
+            self.publish({"kind": "state", "job": job, "state": "stopping"})
+        try:
+            w["proc"].terminate()
+        except ProcessLookupError:
+            pass
+
+    def _wall(self, monotonic: float) -> str:
+        return (datetime.now() + timedelta(seconds=monotonic - time.monotonic())).isoformat(timespec="seconds")
+
+    def _run(self):
+        while not self._closing.wait(SUPERVISE_SECS):
+            try:
+                self.check()
+            except Exception:
+                traceback.print_exc()
+
+    def check(self):
+        """One supervision pass: hung workers, overdue stops, due restarts."""
+        now = time.monotonic()
+        with self._lock:
+            for job, w in self._workers.items():
+                proc = w["proc"]
+                if _alive(proc):
+                    if w["stopping_since"] is not None:
+                        if now - w["stopping_since"] > GRACEFUL_STOP_SECS:
+                            print(f"{self.tag} ⚠ {job} still running {GRACEFUL_STOP_SECS:.0f}s after stop, killing it")
+                            kill_tree(proc)
+                        continue
+                    reason = None
+                    if now - w["last_heartbeat"] > HEARTBEAT_TIMEOUT:
+                        reason = f"no heartbeat for {now - w['last_heartbeat']:.0f}s"
+                    elif w["iterating"] and now - w["last_progress"] > PROGRESS_TIMEOUT:
+                        reason = f"no progress for {now - w['last_progress']:.0f}s"
+                    if reason:
+                        # exited() sees a nonzero code and schedules the restart
+                        print(f"{self.tag} ❌ {job} (PID {proc.pid}) looks hung: {reason}, killing it")
+                        self.publish({"kind": "state", "job": job, "state": "hung", "reason": reason})
+                        kill_tree(proc)
+                elif w["wanted"] and w["restart_at"] is not None and now >= w["restart_at"]:
+                    print(f"{self.tag} Restarting {job} (restart #{w['failures']})")
+                    self._launch(job, w)
@@ -0,0 +1,196 @@
+# timing.py
+"""Per-stage timing spans and one metrics record per iteration.
+
+``with iteration(job):`` opens a record for the current iteration; inside
+it, ``with span("upload", facility):`` times a stage and ``count("retries")``
+bumps a counter. The record lives in a context variable, so spans work from
+any task started inside the iteration and from executor threads run with a
+copied context (``contextvars.copy_context().run``). Outside an iteration
+both are no-ops.
+
+When the iteration ends its record (stage spans, bytes, rows, retries,
+per-facility results and file sizes) is appended as one JSON line to
+METRICS_FILE (rotated past METRICS_ROTATE_MB and gzip-compressed, keeping
+METRICS_KEEP archives, like the panel's logs), which control_panel.py
+folds into the /metrics histograms,
+and stored in the run history database (run_history.py). Iteration starts
+and ends and every closed span are also sent as live events (events.py).
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from events import emit
+from log_store import compress
+from run_history import record_iteration
+
+METRICS_FILE = Path(os.getenv("METRICS_FILE", "iteration_metrics.jsonl"))
+METRICS_ROTATE_MB = float(os.getenv("METRICS_ROTATE_MB", "10"))
+METRICS_KEEP = int(os.getenv("METRICS_KEEP", "10"))
+
+# Stages timed by the services, in pipeline order
+STAGES = ("session_check", "login", "navigation", "render", "download",
+          "digest", "archive", "convert", "upload", "append")
+
+_current = contextvars.ContextVar("iteration_record", default=None)
+_write_lock = threading.Lock()
+
+
+class IterationRecord:
+    """Spans and counters of one job iteration (shared by its tasks and threads)."""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.started = time.time()
+        self.spans = []
+        self.counters = {"download_bytes": 0, "upload_bytes": 0, "rows": 0, "retries": 0}
+        # facility -> extra fields for its result (file sizes, ...)
+        self.facility_info = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float, facility: str = None):
+        with self._lock:
+            self.spans.append({"stage": stage, "facility": facility, "seconds": round(seconds, 3)})
+        emit("stage", self.job, stage=stage, facility=facility, seconds=round(seconds, 3))
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def note(self, facility: str, **fields):
+        with self._lock:
+            self.facility_info.setdefault(facility, {}).update(fields)
+
+    def stage_totals(self) -> dict:
+        totals = {}
+        with self._lock:
+            for s in self.spans:
+                totals[s["stage"]] = totals.get(s["stage"], 0.0) + s["seconds"]
+        return totals
+
+    def as_dict(self, status: str, results: list = None) -> dict:
+        with self._lock:
+            return {
+                "job": self.job,
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "seconds": round(time.time() - self.started, 3),
+                "status": status,
+                "spans": list(self.spans),
+                **self.counters,
+                "facilities": [{**{k: r.get(k) for k in ("facility", "status", "seconds", "error")},
+                                **self.facility_info.get(r.get("facility"), {})}
+                               for r in results or []],
+            }
+
+
+def current_record() -> IterationRecord:
+    return _current.get()
+
+
+@contextmanager
+def counting():
+    """Collect count() calls outside an iteration (e.g. in a pool worker); yields the counters."""
+    record = IterationRecord(None)
+    token = _current.set(record)
+    try:
+        yield record.counters
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage: str, facility: str = None):
+    """Time the enclosed block as ``stage`` of the current iteration."""
+    record = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record.add_span(stage, time.perf_counter() - started, facility)
+
+
+def count(name: str, n: int = 1):
+    record = _current.get()
+    if record is not None:
+        record.count(name, n)
+
+
+def note(facility: str, **fields):
+    """Attach fields (e.g. ``xls_bytes``) to a facility's result in the record."""
+    record = _current.get()
+    if record is not None:
+        record.note(facility, **fields)
+
+
+def iteration_status(results: list) -> str:
+    """"ok", "partial" or "error" from the per-facility results."""
+    failed = [r for r in results if r.get("status") in ("error", "not run", "convert failed", "invalid", "spooled")]
+    if not failed:
+        return "ok"
+    return "error" if len(failed) == len(results) else "partial"
+
+
+def write_record(data: dict, path: Path = METRICS_FILE):
+    line = json.dumps(data, default=str) + "\n"
+    with _write_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+            size = f.tell()
+        if size >= METRICS_ROTATE_MB * 1024 * 1024:
+            rotate_metrics(path)
+
+
+def rotate_metrics(path: Path = METRICS_FILE):
+    """Move the metrics file aside and gzip it in the background."""
+    path = Path(path)
+    rotated = path.with_name(f"{path.stem}.{datetime.now():%Y%m%d_%H%M%S_%f}.{os.getpid()}{path.suffix}")
+    try:
+        os.replace(path, rotated)
+    except FileNotFoundError:
+        return  # another worker rotated it first
+    # Not a daemon: a worker that exits right after still finishes the archive
+    threading.Thread(target=compress, args=(rotated, f"{path.stem}.*{path.suffix}.gz", METRICS_KEEP),
+                     name="metrics-rotate").start()
+
+
+@contextmanager
+def iteration(job: str, tag: str = "[Timing]"):
+    """Collect one iteration's record; written out when the block ends.
+
+    The block may set ``record.results`` (the facility results list);
+    an exception marks the iteration "error".
+    """
+    record = IterationRecord(job)
+    record.results = None
+    token = _current.set(record)
+    status = None
+    emit("iteration", job, phase="start")
+    try:
+        yield record
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current.reset(token)
+        results = record.results or []
+        data = record.as_dict(status or iteration_status(results), results)
+        totals = ", ".join(f"{stage} {secs:.1f}s" for stage, secs in record.stage_totals().items())
+        print(f"{tag} ⏱ Iteration {data['status']} in {data['seconds']:.1f}s ({totals or 'no spans'})")
+        try:
+            write_record(data)
+        except OSError as e:
+            print(f"{tag} ⚠ Could not write metrics record: {e}")
+        try:
+            record_iteration(data)
+        except Exception as e:
+            print(f"{tag} ⚠ Could not store run history: {e}")
+        # After the history write, so a /status refresh on this event sees the run
+        emit("iteration", job, phase="end", status=data["status"], seconds=data["seconds"],
+             stages=record.stage_totals())
@@ -0,0 +1,385 @@
+# xls_converter.py
+"""Shared XLS -> XLSX / CSV conversion used by all three services.
+
+Besides the whole-file converters, the per-sheet functions at the bottom
+(``write_sheet_xml``, ``write_sheet_csv``, ``assemble_xlsx``) let
+conversion_pool.py convert the sheets of one workbook in separate
+processes and merge the results, and ``convert_xls_to_xlsx_bounded``
+converts huge workbooks within a memory ceiling.
+
+Every converter takes an optional report ``spec`` (normalize.report_spec);
+with one, sheets go through normalize.normalize_sheet before they are
+written, and a report failing validation raises ReportValidationError
+instead of being reported as a failed conversion.
+"""
+
+import os
+import re
+import csv
+import json
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import traceback
+from datetime import datetime
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+from xlrd import open_workbook
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from normalize import ReportValidationError, normalize_sheet
+from timing import count
+
+# Merges are the only formatting kept, and xlrd needs formatting_info for them
+KEEP_MERGES = os.getenv("CONVERT_KEEP_MERGES", "1") == "1"
+# Bounded conversion: spill buffered sheet XML to disk above this RSS (0 = off)
+CONVERT_RSS_LIMIT_MB = float(os.getenv("CONVERT_RSS_LIMIT_MB", "0"))
+# ... and in any case once one sheet's XML outgrows this buffer
+SPILL_BUFFER_MB = float(os.getenv("CONVERT_SPILL_BUFFER_MB", "32"))
+RSS_CHECK_ROWS = 2000
+
+
+def merge_range(r1: int, r2: int, c1: int, c2: int) -> str:
+    """Turn an xlrd (rlo, rhi, clo, chi) merge tuple into an A1 range."""
+    return f"{get_column_letter(c1+1)}{r1+1}:{get_column_letter(c2)}{r2}"
+
+
+def _sheet(xls_book, xls_sheet, spec: dict):
+    """The sheet as it is written: normalized when there is a report spec."""
+    return xls_sheet if spec is None else normalize_sheet(xls_book, xls_sheet, spec)
+
+
+def convert_xls_to_xlsx(xls_path: Path, tag: str = "[Convert]", spec: dict = None) -> Path:
+    """Convert .xls to .xlsx while preserving merges.
+
+    Rows are read in bulk with ``row_values`` and appended to a write-only
+    openpyxl workbook, so the output side never holds more than one row.
+    """
+    try:
+        if not xls_path.exists():
+            print(f"{tag} ❌ File not found: {xls_path}")
+            return None
+
+        xlsx_path = xls_path.with_suffix(".xlsx")
+        print(f"{tag} Converting {xls_path} -> {xlsx_path}...")
+
+        # formatting_info is required for xlrd to report merged cells
+        xls_book = open_workbook(str(xls_path), formatting_info=True)
+        xlsx_book = Workbook(write_only=True)
+
+        for xls_sheet in xls_book.sheets():
+            xls_sheet = _sheet(xls_book, xls_sheet, spec)
+            new_sheet = xlsx_book.create_sheet(title=xls_sheet.name)
+            # Merges are written in the sheet tail, so they can be registered up front
+            for (r1, r2, c1, c2) in xls_sheet.merged_cells:
+                new_sheet.merged_cells.add(merge_range(r1, r2, c1, c2))
+            for row_idx in range(xls_sheet.nrows):
+                new_sheet.append(xls_sheet.row_values(row_idx))
+            count("rows", xls_sheet.nrows)
+
+        xlsx_book.save(str(xlsx_path))
+        print(f"{tag} ✅ Converted to: {xlsx_path}")
+        return xlsx_path
+    except ReportValidationError:
+        raise
+    except Exception as e:
+        print(f"{tag} ❌ XLS->XLSX conversion failed: {e}")
+        traceback.print_exc()
+        return None
+
+
+def convert_xls_to_csv(xls_path: Path, tag: str = "[Convert]", spec: dict = None) -> list:
+    """Stream every sheet's rows straight to CSV, one file per sheet.
+
+    No openpyxl workbook is built at all; merges and formatting are dropped,
+    which is fine for consumers that only need the data.
+    """
+    try:
+        if not xls_path.exists():
+            print(f"{tag} ❌ File not found: {xls_path}")
+            return None
+
+        xls_book = open_workbook(str(xls_path), on_demand=True)
+        sheet_names = xls_book.sheet_names()
+        csv_paths = []
+        try:
+            for sheet_name in sheet_names:
+                xls_sheet = _sheet(xls_book, xls_book.sheet_by_name(sheet_name), spec)
+                csv_path = csv_path_for(xls_path, sheet_name, len(sheet_names))
+                with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    for row_idx in range(xls_sheet.nrows):
+                        writer.writerow(xls_sheet.row_values(row_idx))
+                count("rows", xls_sheet.nrows)
+                xls_book.unload_sheet(sheet_name)
+                csv_paths.append(csv_path)
+        finally:
+            xls_book.release_resources()
+
+        print(f"{tag} ✅ Wrote CSV: {', '.join(p.name for p in csv_paths)}")
+        return csv_paths
+    except ReportValidationError:
+        raise
+    except Exception as e:
+        print(f"{tag} ❌ XLS->CSV conversion failed: {e}")
+        traceback.print_exc()
+        return None
+
+
+def csv_path_for(xls_path: Path, sheet_name: str, n_sheets: int) -> Path:
+    """report.csv for a single sheet, report_<sheet>.csv otherwise."""
+    if n_sheets == 1:
+        return xls_path.with_suffix(".csv")
+    safe_sheet = "".join(c if c.isalnum() else "_" for c in sheet_name)
+    return xls_path.with_name(f"{xls_path.stem}_{safe_sheet}.csv")
+
+
+def normalize_cell(value):
+    """Canonical form of an xlrd cell value, for digests and row keys."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def content_digest(xls_path: Path) -> str:
+    """SHA-256 over the normalized cell data of every sheet.
+
+    Whitespace, trailing blank cells, blank rows and ``123`` vs ``123.0`` do
+    not change the digest, so re-downloads of an unchanged report match.
+    """
+    digest = hashlib.sha256()
+    xls_book = open_workbook(str(xls_path), on_demand=True)
+    try:
+        for sheet_name in xls_book.sheet_names():
+            xls_sheet = xls_book.sheet_by_name(sheet_name)
+            digest.update(f"\x00sheet:{sheet_name}\n".encode("utf-8"))
+            for row_idx in range(xls_sheet.nrows):
+                row = [normalize_cell(v) for v in xls_sheet.row_values(row_idx)]
+                while row and row[-1] == "":
+                    row.pop()
+                if row:
+                    digest.update(json.dumps(row, default=str).encode("utf-8"))
+                    digest.update(b"\n")
+            xls_book.unload_sheet(sheet_name)
+    finally:
+        xls_book.release_resources()
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Per-sheet conversion (run in worker processes by conversion_pool.py)
+# ---------------------------------------------------------------------------
+
+SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+# Control characters are not allowed in XML 1.0
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def sheet_names(xls_path: Path) -> list:
+    """Sheet names without parsing any sheet."""
+    xls_book = open_workbook(str(xls_path), on_demand=True)
+    try:
+        return xls_book.sheet_names()
+    finally:
+        xls_book.release_resources()
+
+
+def _cell_xml(ref: str, value) -> str:
+    if value == "" or value is None:
+        return ""
+    if isinstance(value, str):
+        text = escape(_ILLEGAL_XML.sub("", value))
+        return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, datetime):
+        # Serial day number with a date (s="1") or date-time (s="2") format
+        style = 1 if value == datetime(value.year, value.month, value.day) else 2
+        serial = (value - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="{style}"><v>{serial!r}</v></c>'
+    return f'<c r="{ref}"><v>{value!r}</v></c>'
+
+
+def _sheet_xml_chunks(xls_sheet):
+    """Worksheet part XML for one xlrd sheet, one chunk per row."""
+    letters = [get_column_letter(c + 1) for c in range(xls_sheet.ncols)]
+    yield f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{SHEET_NS}"><sheetData>'
+    for row_idx in range(xls_sheet.nrows):
+        cells = "".join(_cell_xml(f"{letters[c]}{row_idx + 1}", v)
+                        for c, v in enumerate(xls_sheet.row_values(row_idx)))
+        if cells:
+            yield f'<row r="{row_idx + 1}">{cells}</row>'
+    tail = "</sheetData>"
+    merges = xls_sheet.merged_cells
+    if merges:
+        tail += f'<mergeCells count="{len(merges)}">'
+        tail += "".join(f'<mergeCell ref="{merge_range(*m)}"/>' for m in merges)
+        tail += "</mergeCells>"
+    yield tail + "</worksheet>"
+
+
+def write_sheet_xml(xls_path: Path, sheet_index: int, out_path: Path,
+                    keep_merges: bool = KEEP_MERGES, spec: dict = None) -> dict:
+    """Write one sheet as an XLSX worksheet part (inline strings, merges kept).
+
+    Returns the sheet name and row count for ``assemble_xlsx``.
+    """
+    xls_book = open_workbook(str(xls_path), formatting_info=keep_merges, on_demand=True)
+    try:
+        xls_sheet = _sheet(xls_book, xls_book.sheet_by_index(sheet_index), spec)
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.writelines(_sheet_xml_chunks(xls_sheet))
+        return {"name": xls_sheet.name, "rows": xls_sheet.nrows, "path": str(out_path)}
+    finally:
+        xls_book.release_resources()
+
+
+def write_sheet_csv(xls_path: Path, sheet_index: int, out_path: Path, spec: dict = None) -> dict:
+    """Stream one sheet's rows to CSV."""
+    xls_book = open_workbook(str(xls_path), on_demand=True)
+    try:
+        xls_sheet = _sheet(xls_book, xls_book.sheet_by_index(sheet_index), spec)
+        with open(out_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            for row_idx in range(xls_sheet.nrows):
+                writer.writerow(xls_sheet.row_values(row_idx))
+        return {"name": xls_sheet.name, "rows": xls_sheet.nrows, "path": str(out_path)}
+    finally:
+        xls_book.release_resources()
+
+
+_STYLES = (
+    f'<styleSheet xmlns="{SHEET_NS}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def assemble_xlsx(parts: list, xlsx_path: Path, compresslevel: int = 6) -> Path:
+    """Zip worksheet parts from ``write_sheet_xml`` (in order) into one .xlsx."""
+    ct = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    n = len(parts)
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{ct}.worksheet+xml"/>'
+        for i in range(1, n + 1)
+    )
+    sheets = "".join(f'<sheet name={quoteattr(p["name"])} sheetId="{i}" r:id="rId{i}"/>'
+                     for i, p in enumerate(parts, 1))
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, n + 1)
+    )
+    header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+    with zipfile.ZipFile(xlsx_path, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        zf.writestr("[Content_Types].xml", header + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{ct}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{ct}.styles+xml"/>'
+            f'{overrides}</Types>'))
+        zf.writestr("_rels/.rels", header + (
+            f'<Relationships xmlns="{PKG_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'))
+        zf.writestr("xl/workbook.xml", header + (
+            f'<workbook xmlns="{SHEET_NS}" xmlns:r="{REL_NS}"><sheets>{sheets}</sheets></workbook>'))
+        zf.writestr("xl/_rels/workbook.xml.rels", header + (
+            f'<Relationships xmlns="{PKG_REL_NS}">{sheet_rels}'
+            f'<Relationship Id="rId{n + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>'))
+        zf.writestr("xl/styles.xml", header + _STYLES)
+        for i, part in enumerate(parts, 1):
+            arcname = f"xl/worksheets/sheet{i}.xml"
+            if "file" in part:
+                part["file"].seek(0)
+                with zf.open(arcname, "w") as dst:
+                    shutil.copyfileobj(part["file"], dst)
+            else:
+                zf.write(part["path"], arcname)
+    return xlsx_path
+
+
+def current_rss_mb() -> float:
+    """Resident set size right now (Linux), else the peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            return 0.0
+
+
+def convert_xls_to_xlsx_bounded(xls_path: Path, tag: str = "[Convert]",
+                                rss_limit_mb: float = CONVERT_RSS_LIMIT_MB,
+                                keep_merges: bool = KEEP_MERGES, spec: dict = None) -> Path:
+    """Convert a huge .xls to .xlsx within a memory ceiling.
+
+    Only one sheet is parsed at a time (``on_demand`` + ``unload_sheet``),
+    formatting info is only loaded when merges are kept, and each sheet's
+    XML goes to a SpooledTemporaryFile that spills to disk once it outgrows
+    SPILL_BUFFER_MB or the process RSS passes ``rss_limit_mb``. No openpyxl
+    workbook is built at all.
+    """
+    try:
+        if not xls_path.exists():
+            print(f"{tag} ❌ File not found: {xls_path}")
+            return None
+
+        xlsx_path = xls_path.with_suffix(".xlsx")
+        print(f"{tag} Converting {xls_path} -> {xlsx_path} (memory-bounded)...")
+        xls_book = open_workbook(str(xls_path), on_demand=True, formatting_info=keep_merges)
+        parts = []
+        spilled = 0
+        spill_bytes = int(SPILL_BUFFER_MB * 1024 * 1024)
+        try:
+            for idx, sheet_name in enumerate(xls_book.sheet_names()):
+                xls_sheet = _sheet(xls_book, xls_book.sheet_by_index(idx), spec)
+                buf = tempfile.SpooledTemporaryFile(max_size=spill_bytes, dir=str(xls_path.parent))
+                parts.append({"name": sheet_name, "rows": xls_sheet.nrows, "file": buf})
+                over_limit = False
+                for n, chunk in enumerate(_sheet_xml_chunks(xls_sheet)):
+                    buf.write(chunk.encode("utf-8"))
+                    if rss_limit_mb and not over_limit and n % RSS_CHECK_ROWS == 0:
+                        over_limit = current_rss_mb() > rss_limit_mb
+                        if over_limit:
+                            buf.rollover()
+                # Spooled files also roll over on their own past max_size
+                spilled += over_limit or buf.tell() > spill_bytes
+                count("rows", xls_sheet.nrows)
+                xls_book.unload_sheet(idx)
+            assemble_xlsx(parts, xlsx_path)
+        finally:
+            xls_book.release_resources()
+            for part in parts:
+                part["file"].close()
+
+        note = f", {spilled} sheet(s) spilled to disk" if spilled else ""
+        print(f"{tag} ✅ Converted to: {xlsx_path}{note}")
+        return xlsx_path
+    except ReportValidationError:
+        raise
+    except Exception as e:
+        print(f"{tag} ❌ XLS->XLSX conversion failed: {e}")
+        traceback.print_exc()
+        return None